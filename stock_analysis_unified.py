@@ -15,6 +15,8 @@ from pathlib import Path
 from datetime import datetime, timedelta
 import multiprocessing as mp
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import importlib
+import threading
 import time
 
 # 抑制警告
@@ -25,40 +27,188 @@ os.environ['LOKY_MAX_CPU_COUNT'] = str(mp.cpu_count())
 # 第一部分：数据下载模块
 # ============================================================================
 
-# 修复Streamlit Cloud权限问题：在导入efinance前修补其配置
-EFINANCE_AVAILABLE = False
-ef = None
+# efinance 延迟导入：导入时会加载网络配置并打印诊断信息，放在模块加载时会拖慢
+# Streamlit 的每次重跑，因此改为首次访问 ef / EFINANCE_AVAILABLE 或调用 get_efinance() 时才导入
+_EFINANCE_STATE = {'loaded': False, 'module': None}
+_EFINANCE_LOCK = threading.Lock()
 
+def _patch_efinance_config():
+    """
+    修复Streamlit Cloud权限问题：在导入efinance前修补其配置
+    """
+    if not os.path.exists('/mount/src'):
+        return
+    
+    print("[Streamlit Cloud] 检测到云环境，正在修补efinance配置...")
+    temp_dir = tempfile.gettempdir()
+    cache_dir = os.path.join(temp_dir, 'efinance_cache')
+    
+    import types
+    
+    mock_config = types.ModuleType('efinance.config')
+    mock_config.DATA_DIR = Path(cache_dir)
+    mock_config.SEARCH_RESULT_CACHE_PATH = Path(cache_dir) / 'search_cache.json'
+    mock_config.MAX_CONNECTIONS = 5
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    sys.modules['efinance.config'] = mock_config
+    
+    print(f"[OK] efinance缓存目录设置为: {cache_dir}")
+
+def get_efinance():
+    """
+    获取efinance模块（首次调用时导入，线程安全），不可用时返回None
+    """
+    if not _EFINANCE_STATE['loaded']:
+        with _EFINANCE_LOCK:
+            if not _EFINANCE_STATE['loaded']:
+                try:
+                    _patch_efinance_config()
+                    import efinance
+                    _EFINANCE_STATE['module'] = efinance
+                    print("[OK] efinance导入成功")
+                except Exception as e:
+                    print(f"[WARNING] efinance导入失败: {e}")
+                    print("[INFO] 应用将在离线模式下运行")
+                    _EFINANCE_STATE['module'] = None
+                _EFINANCE_STATE['loaded'] = True
+    return _EFINANCE_STATE['module']
+
+def is_efinance_available():
+    """efinance是否可用（首次调用时导入）"""
+    return get_efinance() is not None
+
+def __getattr__(name):
+    # 兼容原有的模块属性 ef / EFINANCE_AVAILABLE（访问时才导入efinance）
+    if name == 'ef':
+        return get_efinance()
+    if name == 'EFINANCE_AVAILABLE':
+        return is_efinance_available()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ============================================================================
+# 启动性能：依赖导入耗时分析与后台预热
+# ============================================================================
+
+# 预测路径依赖（下载行情、反序列化模型所需）
+PREDICTION_DEPENDENCIES = ('efinance', 'joblib', 'sklearn.ensemble', 'xgboost', 'lightgbm')
+
+# 训练路径额外依赖
+TRAINING_DEPENDENCIES = ('sklearn.model_selection', 'sklearn.metrics', 'tsfresh', 'imblearn')
+
+_WARMUP_STATE = {'thread': None, 'timings': {}, 'errors': {}}
+_WARMUP_LOCK = threading.Lock()
+
+def _import_dependency(name):
+    """导入一个依赖；efinance 通过 get_efinance() 导入以应用云端配置修补"""
+    if name == 'efinance':
+        if get_efinance() is None:
+            raise ImportError("efinance不可用")
+    else:
+        importlib.import_module(name)
+
+def _run_warmup(modules):
+    for name in modules:
+        t0 = time.perf_counter()
+        try:
+            _import_dependency(name)
+            _WARMUP_STATE['timings'][name] = time.perf_counter() - t0
+        except Exception as e:
+            _WARMUP_STATE['errors'][name] = str(e)
+
+def warm_up_dependencies(modules=PREDICTION_DEPENDENCIES, background=True):
+    """
+    预先导入预测路径的依赖，使首次预测不再承担导入耗时
+    
+    background=True 时在后台守护线程中执行（UI渲染期间并行导入），同一进程只启动一次；
+    返回线程对象（background=False 时同步执行并返回None）。进度见 warmup_status()
+    """
+    if not background:
+        _run_warmup(modules)
+        return None
+    
+    with _WARMUP_LOCK:
+        thread = _WARMUP_STATE['thread']
+        if thread is None:
+            thread = threading.Thread(target=_run_warmup, args=(tuple(modules),),
+                                      name='dependency-warmup', daemon=True)
+            _WARMUP_STATE['thread'] = thread
+            thread.start()
+    return thread
+
+def warmup_status():
+    """
+    后台预热状态：{'running': bool, 'timings': {模块: 秒}, 'errors': {模块: 错误信息}}
+    """
+    thread = _WARMUP_STATE['thread']
+    return {
+        'running': thread is not None and thread.is_alive(),
+        'timings': dict(_WARMUP_STATE['timings']),
+        'errors': dict(_WARMUP_STATE['errors']),
+    }
+
+_PROFILE_SCRIPT = """
+import importlib, json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import stock_analysis_unified as sau
+base = time.perf_counter() - t0
+t0 = time.perf_counter()
+error = None
 try:
-    is_streamlit_cloud = os.path.exists('/mount/src')
+    sau._import_dependency({name!r})
+except Exception as e:
+    error = str(e)
+print('@@' + json.dumps({{'base': base, 'seconds': time.perf_counter() - t0, 'error': error}}))
+"""
+
+def profile_imports(modules=PREDICTION_DEPENDENCIES + TRAINING_DEPENDENCIES, isolated=True):
+    """
+    统计每个依赖的导入耗时
     
-    if is_streamlit_cloud:
-        print("[Streamlit Cloud] 检测到云环境，正在修补efinance配置...")
-        temp_dir = tempfile.gettempdir()
-        cache_dir = os.path.join(temp_dir, 'efinance_cache')
-        
-        import importlib.util
-        import types
-        
-        mock_config = types.ModuleType('efinance.config')
-        mock_config.DATA_DIR = Path(cache_dir)
-        mock_config.SEARCH_RESULT_CACHE_PATH = Path(cache_dir) / 'search_cache.json'
-        mock_config.MAX_CONNECTIONS = 5
-        
-        os.makedirs(cache_dir, exist_ok=True)
-        sys.modules['efinance.config'] = mock_config
+    isolated=True 时每个依赖在新的Python进程中导入（冷启动耗时，不受导入顺序影响，
+    'stock_analysis_unified' 一行为本模块自身的导入耗时）；否则在当前进程中依次导入
+    （已导入的模块耗时接近0）
+    
+    返回:
+    DataFrame: module, seconds, ok, error
+    """
+    import subprocess
+    import json
+    
+    rows = []
+    base_times = []
+    root = os.path.dirname(os.path.abspath(__file__))
+    
+    for name in modules:
+        if isolated:
+            script = _PROFILE_SCRIPT.format(root=root, name=name)
+            proc = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+            marker = [line for line in proc.stdout.splitlines() if line.startswith('@@')]
+            if not marker:
+                rows.append({'module': name, 'seconds': np.nan, 'ok': False,
+                             'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else '进程异常退出'})
+                continue
+            result = json.loads(marker[-1][2:])
+            base_times.append(result['base'])
+            seconds, error = result['seconds'], result['error']
+        else:
+            t0 = time.perf_counter()
+            error = None
+            try:
+                _import_dependency(name)
+            except Exception as e:
+                error = str(e)
+            seconds = time.perf_counter() - t0
         
-        print(f"[OK] efinance缓存目录设置为: {cache_dir}")
+        rows.append({'module': name, 'seconds': seconds, 'ok': error is None, 'error': error})
+        print(f"[导入] {name}: {seconds:.3f}s{'' if error is None else f' (失败: {error})'}")
     
-    import efinance as ef
-    EFINANCE_AVAILABLE = True
-    print("[OK] efinance导入成功")
+    if base_times:
+        rows.insert(0, {'module': 'stock_analysis_unified', 'seconds': float(np.median(base_times)),
+                        'ok': True, 'error': None})
     
-except Exception as e:
-    print(f"[WARNING] efinance导入失败: {e}")
-    print("[INFO] 应用将在离线模式下运行")
-    EFINANCE_AVAILABLE = False
-    ef = None
+    return pd.DataFrame(rows)
 
 def add_technical_indicators_inline(df):
     """
@@ -90,127 +240,532 @@ def add_technical_indicators_inline(df):
     
     return df
 
-def download_single_stock_data(stock_code, start_date='20240101', end_date='20250930'):
+# K线数据列名映射
+KLINE_COLUMN_MAP = {
+    '日期': 'Date',
+    '开盘': 'Open',
+    '收盘': 'Close',
+    '最高': 'High',
+    '最低': 'Low',
+    '成交量': 'Volume',
+    '成交额': 'Amount',
+    '涨跌幅': 'PriceChangeRate',
+    '涨跌额': 'PriceChangeAmount',
+    '换手率': 'TurnoverRate',
+    '振幅': 'Amplitude'
+}
+
+# 资金流数据列名映射
+MONEY_FLOW_COLUMN_MAP = {
+    '主力净流入': 'MainNetInflow',
+    '主力净流入占比': 'MainNetInflowRatio',
+}
+
+def _prepare_kline_frame(df):
+    """
+    重命名K线列并设置日期索引
+    """
+    df = df.rename(columns=KLINE_COLUMN_MAP)
+    df['Date'] = pd.to_datetime(df['Date'])
+    df.set_index('Date', inplace=True)
+    df.sort_index(inplace=True)
+    return df
+
+def _join_money_flow(df, money_flow):
+    """
+    将资金流数据按日期合并到K线数据
+    """
+    try:
+        if isinstance(money_flow, pd.DataFrame) and not money_flow.empty:
+            money_flow = money_flow.copy()
+            money_flow['日期'] = pd.to_datetime(money_flow['日期'])
+            money_flow.set_index('日期', inplace=True)
+            
+            for old_col, new_col in MONEY_FLOW_COLUMN_MAP.items():
+                if old_col in money_flow.columns:
+                    money_flow[new_col] = money_flow[old_col]
+            
+            df = df.join(money_flow[[c for c in MONEY_FLOW_COLUMN_MAP.values() if c in money_flow.columns]], how='left')
+    except:
+        pass
+    return df
+
+def _finalize_stock_frame(df):
+    """
+    补齐资金流列、添加技术指标与价格特征并清理数据
+    """
+    # 填充缺失的资金流列
+    for col in ['MainNetInflow', 'MainNetInflowRatio']:
+        if col not in df.columns:
+            df[col] = 0
+    
+    # 添加技术指标
+    df = add_technical_indicators_inline(df)
+    
+    # 添加价格特征
+    df['Close_Open_Ratio'] = df['Close'] / df['Open']
+    df['High_Low_Ratio'] = df['High'] / df['Low']
+    
+    # 数据清理
+    df = df.replace([np.inf, -np.inf], np.nan)
+    df = df.fillna(method='ffill').fillna(0)
+    
+    return df
+
+def _fetch_raw_stock_frame(stock_code, start_date, end_date, client=None):
+    """
+    下载K线并合并资金流，返回未计算指标的原始日线（失败返回None）
+    """
+    client = client or get_efinance()
+    kline_data = client.stock.get_quote_history(
+        stock_codes=[stock_code],
+        beg=start_date,
+        end=end_date
+    )
+    
+    if not isinstance(kline_data, dict) or stock_code not in kline_data:
+        return None
+    
+    df = kline_data[stock_code]
+    if df.empty:
+        return None
+    
+    df = _prepare_kline_frame(df)
+    
+    # 获取资金流数据
+    try:
+        df = _join_money_flow(df, client.stock.get_history_bill(stock_code))
+    except:
+        pass
+    
+    return df
+
+_OHLCV_CACHE = None
+
+def get_ohlcv_cache():
+    """
+    获取进程内共享的本地行情缓存（设置环境变量 STOCK_OHLCV_CACHE=0 可禁用）
+    """
+    global _OHLCV_CACHE
+    if _OHLCV_CACHE is None:
+        if os.environ.get('STOCK_OHLCV_CACHE', '1') == '0':
+            _OHLCV_CACHE = False
+        else:
+            try:
+                from utils.ohlcv_cache import OHLCVCache
+                _OHLCV_CACHE = OHLCVCache()
+            except Exception as e:
+                print(f"[WARNING] 本地行情缓存不可用: {e}")
+                _OHLCV_CACHE = False
+    return _OHLCV_CACHE or None
+
+def download_single_stock_data(stock_code, start_date='20240101', end_date='20250930', use_cache=True):
     """
     下载单只股票数据（内存版本）
+    
+    use_cache=True 时优先使用本地行情缓存：同日重复请求不联网，跨日只增量下载新K线；
+    efinance不可用时返回缓存中的数据
     """
-    if not EFINANCE_AVAILABLE or ef is None:
+    cache = get_ohlcv_cache() if use_cache else None
+    online = is_efinance_available()
+    
+    if not online and cache is None:
         print(f"[ERROR] efinance不可用，无法下载股票 {stock_code}")
         return None
     
     try:
         print(f"[处理] {stock_code}")
         
-        # 获取K线数据
-        kline_data = ef.stock.get_quote_history(
-            stock_codes=[stock_code],
-            beg=start_date,
-            end=end_date
-        )
+        if cache is not None:
+            fetcher = (lambda beg, end: _fetch_raw_stock_frame(stock_code, beg, end)) if online else None
+            df = cache.get_or_fetch(stock_code, start_date, end_date, fetcher)
+            if df is None and not online:
+                print(f"[ERROR] efinance不可用且无本地缓存，无法获取股票 {stock_code}")
+                return None
+        else:
+            df = _fetch_raw_stock_frame(stock_code, start_date, end_date)
         
-        if not isinstance(kline_data, dict) or stock_code not in kline_data:
+        if df is None:
             return None
         
-        df = kline_data[stock_code]
-        if df.empty:
-            return None
+        return _finalize_stock_frame(df.copy())
         
-        # 重命名列
-        df = df.rename(columns={
-            '日期': 'Date',
-            '开盘': 'Open',
-            '收盘': 'Close',
-            '最高': 'High',
-            '最低': 'Low',
-            '成交量': 'Volume',
-            '成交额': 'Amount',
-            '涨跌幅': 'PriceChangeRate',
-            '涨跌额': 'PriceChangeAmount',
-            '换手率': 'TurnoverRate',
-            '振幅': 'Amplitude'
-        })
+    except Exception as e:
+        print(f"[ERROR] {stock_code} 失败: {e}")
+        return None
+
+# efinance各接口对应的主机，用于按主机限速
+EFINANCE_ENDPOINT_HOSTS = {
+    'quote_history': 'push2his.eastmoney.com',
+    'history_bill': 'push2his.eastmoney.com',
+}
+
+class RateLimiter:
+    """
+    令牌桶限速器（线程安全）
+    
+    rate: 每秒请求数；burst: 桶容量，默认等于rate
+    """
+    
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, tokens=1):
+        """阻塞直到获得指定数量的令牌"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                # 单次请求超过桶容量时允许透支，之后的请求顺延等待
+                if self.tokens >= min(tokens, self.capacity):
+                    self.tokens -= tokens
+                    return
+                wait = (min(tokens, self.capacity) - self.tokens) / self.rate
+            time.sleep(wait)
+
+def _is_transient_error(exc):
+    """判断是否为可重试的网络类错误"""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import requests
+        return isinstance(exc, (requests.exceptions.ConnectionError,
+                                requests.exceptions.Timeout,
+                                requests.exceptions.ChunkedEncodingError))
+    except ImportError:
+        return False
+
+class StockDownloader:
+    """
+    并发多股票下载器
+    
+    - K线按batch_size分批调用 get_quote_history（接口接受代码列表）
+    - 资金流在线程池中并发获取，并发数受max_workers限制
+    - 每个主机独立令牌桶限速，网络类错误按指数退避重试
+    - client为efinance兼容对象（需提供 client.stock.get_quote_history / get_history_bill），
+      默认使用 get_efinance()，测试时可传入伪造模块
+    
+    下载完成后 self.stats 记录吞吐量（只/秒）与单只股票耗时
+    """
+    
+    def __init__(self, client=None, max_workers=8, batch_size=20, rate_limits=None,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, fetch_money_flow=True,
+                 verbose=True):
+        self.client = client
+        self.max_workers = max(1, int(max_workers))
+        self.batch_size = max(1, int(batch_size))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.fetch_money_flow = fetch_money_flow
+        self.verbose = verbose
+        
+        # 默认每个主机每秒10个请求
+        rate_limits = rate_limits if rate_limits is not None else {host: 10.0 for host in set(EFINANCE_ENDPOINT_HOSTS.values())}
+        self.limiters = {host: RateLimiter(rate) for host, rate in rate_limits.items() if rate}
         
-        df['Date'] = pd.to_datetime(df['Date'])
-        df.set_index('Date', inplace=True)
-        df.sort_index(inplace=True)
+        self._lock = threading.Lock()
+        self.stats = {}
+    
+    def _call(self, endpoint, func, *args, n_requests=1, **kwargs):
+        """限速 + 指数退避重试调用接口"""
+        import random
         
-        # 获取资金流数据
+        limiter = self.limiters.get(EFINANCE_ENDPOINT_HOSTS.get(endpoint))
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                limiter.acquire(n_requests)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_transient_error(e):
+                    raise
+                with self._lock:
+                    self.stats['retries'] += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                time.sleep(delay * (0.5 + random.random() / 2))
+    
+    def _fetch_kline_batch(self, batch, start_date, end_date):
+        """批量获取K线，返回 {代码: (DataFrame, 耗时)}"""
+        t0 = time.perf_counter()
         try:
-            money_flow = ef.stock.get_history_bill(stock_code)
-            if isinstance(money_flow, pd.DataFrame) and not money_flow.empty:
-                money_flow['日期'] = pd.to_datetime(money_flow['日期'])
-                money_flow.set_index('日期', inplace=True)
-                
-                money_flow_columns = {
-                    '主力净流入': 'MainNetInflow',
-                    '主力净流入占比': 'MainNetInflowRatio',
-                }
-                
-                for old_col, new_col in money_flow_columns.items():
-                    if old_col in money_flow.columns:
-                        money_flow[new_col] = money_flow[old_col]
-                
-                df = df.join(money_flow[[c for c in money_flow_columns.values() if c in money_flow.columns]], how='left')
-        except:
-            pass
+            kline_data = self._call(
+                'quote_history', self.client.stock.get_quote_history,
+                stock_codes=list(batch), beg=start_date, end=end_date,
+                n_requests=len(batch)
+            )
+        except Exception as e:
+            if self.verbose:
+                print(f"[ERROR] K线批次 {batch[0]}..{batch[-1]} 失败: {e}")
+            return {}
+        elapsed = time.perf_counter() - t0
         
-        # 填充缺失的资金流列
-        for col in ['MainNetInflow', 'MainNetInflowRatio']:
-            if col not in df.columns:
-                df[col] = 0
+        # 单只股票时接口可能直接返回DataFrame
+        if isinstance(kline_data, pd.DataFrame) and len(batch) == 1:
+            kline_data = {batch[0]: kline_data}
+        if not isinstance(kline_data, dict):
+            return {}
         
-        # 添加技术指标
-        df = add_technical_indicators_inline(df)
+        return {code: (kline_data[code], elapsed) for code in batch
+                if code in kline_data and isinstance(kline_data[code], pd.DataFrame) and not kline_data[code].empty}
+    
+    def _complete_stock(self, stock_code, kline_df, kline_elapsed):
+        """获取资金流并完成单只股票的数据处理"""
+        t0 = time.perf_counter()
+        try:
+            df = _prepare_kline_frame(kline_df)
+            if self.fetch_money_flow:
+                try:
+                    money_flow = self._call('history_bill', self.client.stock.get_history_bill, stock_code)
+                    df = _join_money_flow(df, money_flow)
+                except Exception:
+                    pass
+            df = _finalize_stock_frame(df)
+        except Exception as e:
+            if self.verbose:
+                print(f"[ERROR] {stock_code} 失败: {e}")
+            return stock_code, None, kline_elapsed + time.perf_counter() - t0
+        return stock_code, df, kline_elapsed + time.perf_counter() - t0
+    
+    def download(self, stock_codes, start_date='20240101', end_date='20250930'):
+        """
+        并发下载多只股票，返回 {代码: DataFrame}（顺序与输入一致）
+        """
+        if self.client is None:
+            self.client = get_efinance()
+        if self.client is None:
+            print("[ERROR] efinance不可用，无法下载数据")
+            return {}
         
-        # 添加价格特征
-        df['Close_Open_Ratio'] = df['Close'] / df['Open']
-        df['High_Low_Ratio'] = df['High'] / df['Low']
+        stock_codes = list(dict.fromkeys(stock_codes))
+        self.stats = {'symbols': len(stock_codes), 'succeeded': 0, 'failed': 0,
+                      'retries': 0, 'elapsed': 0.0, 'throughput': 0.0, 'latency': {}}
+        batches = [stock_codes[i:i + self.batch_size] for i in range(0, len(stock_codes), self.batch_size)]
         
-        # 数据清理
-        df = df.replace([np.inf, -np.inf], np.nan)
-        df = df.fillna(method='ffill').fillna(0)
+        t_start = time.perf_counter()
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            kline_futures = [executor.submit(self._fetch_kline_batch, batch, start_date, end_date) for batch in batches]
+            
+            stock_futures = []
+            for future in as_completed(kline_futures):
+                for code, (kline_df, kline_elapsed) in future.result().items():
+                    stock_futures.append(executor.submit(self._complete_stock, code, kline_df, kline_elapsed))
+            
+            for future in as_completed(stock_futures):
+                code, df, latency = future.result()
+                self.stats['latency'][code] = latency
+                if df is not None:
+                    results[code] = df
         
-        return df
+        elapsed = time.perf_counter() - t_start
+        latencies = np.array(list(self.stats['latency'].values())) if self.stats['latency'] else np.zeros(1)
+        self.stats.update({
+            'succeeded': len(results),
+            'failed': len(stock_codes) - len(results),
+            'elapsed': elapsed,
+            'throughput': len(results) / elapsed if elapsed > 0 else 0.0,
+            'latency_p50': float(np.percentile(latencies, 50)),
+            'latency_p95': float(np.percentile(latencies, 95)),
+        })
         
-    except Exception as e:
-        print(f"[ERROR] {stock_code} 失败: {e}")
-        return None
+        return {code: results[code] for code in stock_codes if code in results}
 
-def download_multiple_stocks(stock_codes, start_date='20240101', end_date='20250930'):
+def download_multiple_stocks(stock_codes, start_date='20240101', end_date='20250930',
+                             max_workers=8, batch_size=20, client=None, return_stats=False):
     """
-    批量下载股票数据（内存版本）
+    批量下载股票数据（内存版本，并发下载）
+    
+    return_stats=True 时额外返回下载统计（吞吐量、单只耗时等）
     """
     print(f"\n[开始] 下载 {len(stock_codes)} 只股票...")
-    all_data = {}
     
+    downloader = StockDownloader(client=client, max_workers=max_workers, batch_size=batch_size)
+    all_data = downloader.download(stock_codes, start_date, end_date)
+    stats = downloader.stats
+    
+    print(f"[完成] 成功下载 {len(all_data)} 只股票")
+    if stats.get('symbols'):
+        print(f"[统计] 耗时 {stats['elapsed']:.1f}s, 吞吐量 {stats['throughput']:.2f} 只/秒, "
+              f"单只耗时 p50={stats['latency_p50']:.2f}s p95={stats['latency_p95']:.2f}s, 重试 {stats['retries']} 次")
+    
+    if return_stats:
+        return all_data, stats
+    return all_data
+
+def load_local_stock_data(stock_codes=None, data_dir='data', columns=None):
+    """
+    从本地 data/ 目录读取股票日线（优先使用列式存储，支持列投影）
+    
+    参数：
+    - stock_codes: 股票列表，None表示目录下的全部股票
+    - columns: 只读取的列，None表示全部
+    """
+    from utils.columnar_store import ColumnarStore, default_store_dir, load_stock_frame
+    
+    store_dir = default_store_dir(data_dir)
+    store = ColumnarStore(store_dir) if os.path.isdir(store_dir) else None
+    
+    if stock_codes is None:
+        names = store.names() if store is not None else [
+            f[:-len('_data.csv')] for f in sorted(os.listdir(data_dir))
+            if f.startswith('stock_') and f.endswith('_data.csv')
+        ]
+        stock_codes = [n[len('stock_'):] for n in names if n.startswith('stock_')]
+    
+    all_data = {}
     for stock_code in stock_codes:
-        df = download_single_stock_data(stock_code, start_date, end_date)
-        if df is not None:
+        df = load_stock_frame(stock_code, data_dir, columns=columns, store=store)
+        if df is not None and not df.empty:
             all_data[stock_code] = df
     
-    print(f"[完成] 成功下载 {len(all_data)} 只股票")
+    print(f"[完成] 从本地读取 {len(all_data)} 只股票")
     return all_data
 
 # ============================================================================
 # 第二部分：特征工程模块
 # ============================================================================
 
+# TSFresh使用的基础特征列
+TSFRESH_BASE_FEATURES = [
+    'Close', 'Open', 'High', 'Low', 'Volume', 'TurnoverRate',
+    'PriceChangeRate', 'MainNetInflow', 'MainNetInflowRatio'
+]
+
+def _compute_ma20_targets(data, positions, forecast_horizon):
+    """
+    计算窗口目标：未来收盘价是否低于MA20（1=弱势, 0=强势）
+    """
+    close = data['Close'].to_numpy(dtype=float)
+    future_idx = positions + forecast_horizon
+    future_close = close[future_idx]
+    
+    if 'MA_20' in data.columns:
+        future_ma20 = data['MA_20'].to_numpy(dtype=float)[future_idx]
+    else:
+        future_ma20 = data['Close'].rolling(window=20).mean().to_numpy()[future_idx]
+        # 起点为负时保持与逐行切片（iloc）完全一致的语义
+        for k in np.flatnonzero(future_idx - 19 < 0):
+            j = future_idx[k]
+            future_ma20[k] = float(data['Close'].iloc[j - 19: j + 1].mean())
+    
+    return (future_close < future_ma20).astype(int)
+
+def build_window_tensor(all_data, window_size=20, forecast_horizon=5, features=None):
+    """
+    基于NumPy步长视图构建滑动窗口张量
+    
+    返回：
+    - windows: 形状为 (窗口数, window_size, 特征数) 的float64数组，NaN已填0
+    - window_ids: 窗口ID列表，格式为 {stock}_{i}
+    - targets: 每个窗口的MA20目标
+    """
+    from numpy.lib.stride_tricks import sliding_window_view
+    
+    features = list(features or TSFRESH_BASE_FEATURES)
+    window_blocks = []
+    window_ids = []
+    target_blocks = []
+    
+    for stock_code, data in all_data.items():
+        for feature in features:
+            if feature not in data.columns:
+                data[feature] = 0
+        
+        if len(data) < window_size + forecast_horizon:
+            continue
+        
+        n_windows = len(data) - forecast_horizon - window_size
+        if n_windows <= 0:
+            continue
+        
+        block = data[features].to_numpy(dtype=np.float64)
+        block = np.nan_to_num(block, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        
+        # 视图形状 (len-window_size+1, 特征数, window_size)，窗口i对应行 [i-window_size, i)
+        view = sliding_window_view(block, window_size, axis=0)[:n_windows]
+        window_blocks.append(view.transpose(0, 2, 1))
+        
+        positions = np.arange(window_size, window_size + n_windows)
+        window_ids.extend(f"{stock_code}_{i}" for i in positions)
+        target_blocks.append(_compute_ma20_targets(data, positions, forecast_horizon))
+    
+    if not window_blocks:
+        return np.empty((0, window_size, len(features))), [], np.empty(0, dtype=int)
+    
+    windows = np.ascontiguousarray(np.concatenate(window_blocks, axis=0))
+    targets = np.concatenate(target_blocks)
+    return windows, window_ids, targets
+
+def window_dates(all_data, window_ids, forecast_horizon=5):
+    """
+    每个窗口样本对应的日期（build_window_tensor 的窗口ID {stock}_{i}）
+    
+    返回：
+    - end_dates: 窗口最后一天（做出预测的日期）
+    - label_dates: 目标所用的未来日期（窗口最后一天之后第 forecast_horizon+1 行）
+    """
+    end_dates = []
+    label_dates = []
+    for window_id in window_ids:
+        stock_code, position = window_id.rsplit('_', 1)
+        index = all_data[stock_code].index
+        position = int(position)
+        end_dates.append(index[position - 1])
+        label_dates.append(index[position + forecast_horizon])
+    return pd.DatetimeIndex(end_dates), pd.DatetimeIndex(label_dates)
+
+def windows_to_long_frame(windows, window_ids, features=None):
+    """
+    将窗口张量展开为TSFresh长格式 (id, time, feature_name, value)
+    """
+    features = list(features or TSFRESH_BASE_FEATURES)
+    n_windows, window_size, n_features = windows.shape
+    
+    # id与feature_name使用分类编码，避免数千万行重复字符串占用内存
+    id_codes = np.repeat(np.arange(n_windows, dtype=np.int32), n_features * window_size)
+    feature_codes = np.tile(np.repeat(np.arange(n_features, dtype=np.int8), window_size), n_windows)
+    
+    return pd.DataFrame({
+        'id': pd.Categorical.from_codes(id_codes, categories=pd.Index(window_ids, dtype=object)),
+        'time': np.tile(np.arange(window_size, dtype=np.int64), n_windows * n_features),
+        'feature_name': pd.Categorical.from_codes(feature_codes, categories=pd.Index(features, dtype=object)),
+        'value': windows.transpose(0, 2, 1).reshape(-1)
+    })
+
 def create_tsfresh_data(all_data, window_size=20, forecast_horizon=5):
     """
-    创建TSFresh格式数据（内存版本）
+    创建TSFresh格式数据（内存版本，向量化滑动窗口）
     """
     print(f"\n[特征工程] 窗口={window_size}天, 预测期={forecast_horizon}天")
     
+    windows, window_ids, targets = build_window_tensor(all_data, window_size, forecast_horizon)
+    
+    if len(window_ids) == 0:
+        x_df = pd.DataFrame()
+        y_df = pd.DataFrame()
+    else:
+        x_df = windows_to_long_frame(windows, window_ids)
+        y_df = pd.DataFrame({'id': window_ids, 'target': targets})
+    
+    print(f"[完成] 生成 {len(y_df)} 个样本")
+    return x_df, y_df
+
+def _create_tsfresh_data_loop(all_data, window_size=20, forecast_horizon=5):
+    """
+    逐值构建TSFresh数据的原始实现（仅用于基准测试与结果核对）
+    """
     tsfresh_data_list = []
     target_list = []
     
-    tsfresh_features = [
-        'Close', 'Open', 'High', 'Low', 'Volume', 'TurnoverRate',
-        'PriceChangeRate', 'MainNetInflow', 'MainNetInflowRatio'
-    ]
-    
     for stock_code, data in all_data.items():
-        for feature in tsfresh_features:
+        for feature in TSFRESH_BASE_FEATURES:
             if feature not in data.columns:
                 data[feature] = 0
         
@@ -220,7 +775,7 @@ def create_tsfresh_data(all_data, window_size=20, forecast_horizon=5):
         for i in range(window_size, len(data) - forecast_horizon):
             window_id = f"{stock_code}_{i}"
             
-            for feature in tsfresh_features:
+            for feature in TSFRESH_BASE_FEATURES:
                 feature_window = data[feature].iloc[i - window_size: i]
                 
                 for time_idx, value in enumerate(feature_window.values):
@@ -241,18 +796,344 @@ def create_tsfresh_data(all_data, window_size=20, forecast_horizon=5):
             target = 1 if future_close < future_ma20 else 0
             target_list.append({'id': window_id, 'target': target})
     
-    x_df = pd.DataFrame(tsfresh_data_list)
-    y_df = pd.DataFrame(target_list)
+    return pd.DataFrame(tsfresh_data_list), pd.DataFrame(target_list)
+
+def _make_synthetic_stock_data(n_stocks, n_days=400, seed=42):
+    """
+    生成基准测试用的合成股票数据
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2024-01-01', periods=n_days)
+    all_data = {}
     
-    print(f"[完成] 生成 {len(y_df)} 个样本")
-    return x_df, y_df
+    for k in range(n_stocks):
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+        open_ = close * (1 + rng.normal(0, 0.005, n_days))
+        df = pd.DataFrame({
+            'Open': open_,
+            'Close': close,
+            'High': np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n_days)),
+            'Low': np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n_days)),
+            'Volume': rng.integers(1e5, 1e7, n_days).astype(float),
+            'TurnoverRate': rng.uniform(0.1, 5, n_days),
+            'PriceChangeRate': np.r_[0, np.diff(close) / close[:-1] * 100],
+            'MainNetInflow': rng.normal(0, 1e6, n_days),
+            'MainNetInflowRatio': rng.normal(0, 5, n_days),
+        }, index=dates)
+        df['MA_20'] = df['Close'].rolling(window=20).mean()
+        all_data[f"{k:06d}"] = df
+    
+    return all_data
 
-def extract_tsfresh_features(x_df, y_df, use_minimal=True):
+def benchmark_create_tsfresh_data(stock_counts=(10, 100, 1000), n_days=400, window_size=20,
+                                  forecast_horizon=5, legacy_max_stocks=100):
+    """
+    对比向量化窗口构建与原始逐值循环的耗时
+    
+    超过legacy_max_stocks只股票时，原始循环按单只股票耗时线性外推（标记为估算）
+    """
+    rows = []
+    legacy_per_stock = None
+    
+    for n_stocks in stock_counts:
+        all_data = _make_synthetic_stock_data(n_stocks, n_days)
+        
+        t0 = time.perf_counter()
+        windows, window_ids, targets = build_window_tensor(all_data, window_size, forecast_horizon)
+        tensor_time = time.perf_counter() - t0
+        
+        t0 = time.perf_counter()
+        x_df = windows_to_long_frame(windows, window_ids)
+        long_time = tensor_time + time.perf_counter() - t0
+        
+        if n_stocks <= legacy_max_stocks:
+            t0 = time.perf_counter()
+            x_loop, y_loop = _create_tsfresh_data_loop(all_data, window_size, forecast_horizon)
+            legacy_time = time.perf_counter() - t0
+            legacy_per_stock = legacy_time / n_stocks
+            legacy_estimated = False
+            
+            pd.testing.assert_frame_equal(x_df.astype({'id': object, 'feature_name': object}),
+                                          x_loop, check_dtype=False)
+            assert list(y_loop['id']) == list(window_ids)
+            assert np.array_equal(y_loop['target'].to_numpy(), targets)
+        elif legacy_per_stock is not None:
+            legacy_time = legacy_per_stock * n_stocks
+            legacy_estimated = True
+        else:
+            legacy_time = np.nan
+            legacy_estimated = True
+        
+        rows.append({
+            'stocks': n_stocks,
+            'windows': len(window_ids),
+            'tensor_s': tensor_time,
+            'long_frame_s': long_time,
+            'legacy_loop_s': legacy_time,
+            'legacy_estimated': legacy_estimated,
+            'speedup': legacy_time / long_time if long_time > 0 else np.nan
+        })
+        del x_df
+        print(f"[基准] {n_stocks}只股票: 张量={tensor_time:.3f}s, 长格式={long_time:.3f}s, "
+              f"原始循环={legacy_time:.3f}s{'(估算)' if legacy_estimated else ''}")
+    
+    return pd.DataFrame(rows)
+
+# TSFresh MinimalFCParameters 的特征及其列顺序
+MINIMAL_FC_STATISTICS = [
+    'sum_values', 'median', 'mean', 'length', 'standard_deviation',
+    'variance', 'root_mean_square', 'maximum', 'absolute_maximum', 'minimum'
+]
+
+def long_frame_to_windows(x_df):
+    """
+    将TSFresh长格式数据还原为窗口张量
+    
+    返回：
+    - windows: 形状为 (窗口数, 时间步数, 特征数) 的数组
+    - window_ids: 窗口ID列表（按首次出现顺序）
+    - features: 特征名列表（按首次出现顺序）
+    """
+    if isinstance(x_df['id'].dtype, pd.CategoricalDtype):
+        id_codes = x_df['id'].cat.codes.to_numpy()
+        window_ids = list(x_df['id'].cat.categories)
+    else:
+        id_codes, id_uniques = pd.factorize(x_df['id'], sort=False)
+        window_ids = list(id_uniques)
+    
+    if isinstance(x_df['feature_name'].dtype, pd.CategoricalDtype):
+        feature_codes = x_df['feature_name'].cat.codes.to_numpy()
+        features = list(x_df['feature_name'].cat.categories)
+    else:
+        feature_codes, feature_uniques = pd.factorize(x_df['feature_name'], sort=False)
+        features = list(feature_uniques)
+    
+    time_idx = x_df['time'].to_numpy(dtype=np.int64)
+    windows = np.zeros((len(window_ids), int(time_idx.max()) + 1, len(features)))
+    windows[id_codes, time_idx, feature_codes] = x_df['value'].to_numpy(dtype=np.float64)
+    return windows, window_ids, features
+
+def _impute_features_native(values):
+    """
+    与 tsfresh.impute 相同的列级填补：-inf→列最小值, +inf→列最大值, NaN→列中位数
+    """
+    finite = np.isfinite(values)
+    if finite.all():
+        return values
+    
+    masked = np.where(finite, values, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        col_min = np.nan_to_num(np.nanmin(masked, axis=0), nan=0.0)
+        col_max = np.nan_to_num(np.nanmax(masked, axis=0), nan=0.0)
+        col_median = np.nan_to_num(np.nanmedian(masked, axis=0), nan=0.0)
+    
+    values = values.copy()
+    rows, cols = np.nonzero(np.isneginf(values))
+    values[rows, cols] = col_min[cols]
+    rows, cols = np.nonzero(np.isposinf(values))
+    values[rows, cols] = col_max[cols]
+    rows, cols = np.nonzero(np.isnan(values))
+    values[rows, cols] = col_median[cols]
+    return values
+
+def minimal_feature_columns(features=None):
+    """MinimalFCParameters 的tsfresh原始列名（如 Close_value__mean），顺序与原生提取结果一致"""
+    features = list(features or TSFRESH_BASE_FEATURES)
+    return [f"{feature}_value__{stat}" for feature in features for stat in MINIMAL_FC_STATISTICS]
+
+def _minimal_feature_values(windows):
+    """
+    计算 MinimalFCParameters 特征矩阵，形状 (窗口数, 特征数 * 统计量数)，已完成填补
+    """
+    n_windows, window_size, n_features = windows.shape
+    
+    # 转为 (窗口数, 特征数, window_size) 的连续内存，沿最后一轴归约与tsfresh逐序列计算一致
+    x = np.ascontiguousarray(np.asarray(windows, dtype=np.float64).transpose(0, 2, 1))
+    
+    with np.errstate(invalid='ignore', over='ignore'):
+        stats = np.stack([
+            np.sum(x, axis=-1),
+            np.median(x, axis=-1),
+            np.mean(x, axis=-1),
+            np.full((n_windows, n_features), float(window_size)),
+            np.std(x, axis=-1),
+            np.var(x, axis=-1),
+            np.sqrt(np.mean(np.square(x), axis=-1)),
+            np.max(x, axis=-1),
+            np.max(np.absolute(x), axis=-1),
+            np.min(x, axis=-1),
+        ], axis=-1)
+    
+    return _impute_features_native(stats.reshape(n_windows, n_features * len(MINIMAL_FC_STATISTICS)))
+
+def extract_minimal_features_native(windows, window_ids, features=None):
+    """
+    原生向量化实现的 MinimalFCParameters 特征提取（无需tsfresh）
+    
+    参数：
+    - windows: 形状为 (窗口数, window_size, 特征数) 的数组
+    - window_ids: 窗口ID列表
+    - features: 特征名列表，默认 TSFRESH_BASE_FEATURES
+    
+    返回与tsfresh相同列名的DataFrame（如 Close_value__mean），已完成填补
+    """
+    values = _minimal_feature_values(windows)
+    return pd.DataFrame(values, index=pd.Index(window_ids, dtype=object, name='id'),
+                        columns=minimal_feature_columns(features))
+
+def _tsfresh_shard_worker(task):
+    """
+    进程池工作函数：从共享内存读取窗口切片并调用tsfresh提取特征
+    
+    task: (共享内存名, 张量形状, 窗口起止, 特征列下标, 特征名)
+    返回: (窗口起点, {特征名: 提取结果DataFrame})
+    """
+    from multiprocessing import shared_memory
+    from tsfresh import extract_features
+    from tsfresh.feature_extraction import MinimalFCParameters
+    
+    shm_name, shape, (start, stop), feature_positions, feature_names = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        windows = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        block = np.array(windows[start:stop][:, :, feature_positions])
+    finally:
+        shm.close()
+    
+    n_windows, window_size, _ = block.shape
+    settings = MinimalFCParameters()
+    results = {}
+    
+    for k, feature_name in enumerate(feature_names):
+        feature_df = pd.DataFrame({
+            'id': np.repeat(np.arange(start, stop), window_size),
+            'time': np.tile(np.arange(window_size), n_windows),
+            'value': block[:, :, k].reshape(-1)
+        })
+        extracted = extract_features(
+            feature_df,
+            column_id="id",
+            column_sort="time",
+            column_value="value",
+            default_fc_parameters=settings,
+            n_jobs=1,
+            disable_progressbar=True
+        )
+        results[feature_name] = extracted.sort_index()
+    
+    return start, results
+
+def _plan_window_chunks(window_ids, chunk_size):
+    """
+    按股票切分窗口区间，并将相邻股票合并到约chunk_size个窗口一组
+    """
+    stock_of = [str(window_id).rsplit('_', 1)[0] for window_id in window_ids]
+    boundaries = [0] + [i for i in range(1, len(stock_of)) if stock_of[i] != stock_of[i - 1]] + [len(stock_of)]
+    
+    chunks = []
+    chunk_start = 0
+    for boundary in boundaries[1:]:
+        if boundary - chunk_start >= chunk_size or boundary == len(stock_of):
+            chunks.append((chunk_start, boundary))
+            chunk_start = boundary
+    return chunks
+
+def extract_tsfresh_features_multiprocess(windows, window_ids, features=None, n_workers=None,
+                                          shard_by='feature', chunk_size=None):
+    """
+    基于进程池的TSFresh特征提取（绕开GIL）
+    
+    参数：
+    - windows: 形状为 (窗口数, window_size, 特征数) 的数组，通过共享内存传给工作进程
+    - window_ids: 窗口ID列表
+    - features: 特征名列表，默认 TSFRESH_BASE_FEATURES
+    - n_workers: 进程数，默认CPU核数
+    - shard_by: 'feature' 每个特征一个分片；'stock' 按股票合并窗口分片（每片包含全部特征）
+    - chunk_size: 每个分片的窗口数（按股票边界对齐），None表示不按窗口切分
+    
+    返回列顺序固定（按features顺序），行顺序与window_ids一致
+    """
+    from multiprocessing import shared_memory
+    from concurrent.futures import ProcessPoolExecutor
+    from tsfresh.utilities.dataframe_functions import impute
+    
+    features = list(features or TSFRESH_BASE_FEATURES)
+    windows = np.ascontiguousarray(windows, dtype=np.float64)
+    n_windows = windows.shape[0]
+    
+    if shard_by == 'feature':
+        feature_groups = [[k] for k in range(len(features))]
+        default_chunk = n_windows
+    elif shard_by == 'stock':
+        feature_groups = [list(range(len(features)))]
+        default_chunk = max(1, n_windows // (4 * (n_workers or mp.cpu_count())))
+    else:
+        raise ValueError(f"不支持的分片方式: {shard_by}")
+    
+    window_chunks = _plan_window_chunks(window_ids, chunk_size or default_chunk)
+    n_workers = n_workers or mp.cpu_count()
+    
+    shm = shared_memory.SharedMemory(create=True, size=max(windows.nbytes, 1))
+    try:
+        np.ndarray(windows.shape, dtype=np.float64, buffer=shm.buf)[:] = windows
+        
+        tasks = [
+            (shm.name, windows.shape, chunk, group, [features[k] for k in group])
+            for group in feature_groups for chunk in window_chunks
+        ]
+        n_workers = max(1, min(n_workers, len(tasks)))
+        print(f"[多进程] {len(tasks)} 个分片, {n_workers} 个进程, 分片方式={shard_by}")
+        
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            shard_results = list(executor.map(_tsfresh_shard_worker, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+    
+    # 按 (特征顺序, 窗口起点) 组装，保证列和行的顺序确定
+    blocks = {feature: [] for feature in features}
+    for start, results in sorted(shard_results, key=lambda item: item[0]):
+        for feature_name, extracted in results.items():
+            blocks[feature_name].append(extracted)
+    
+    feature_frames = []
+    for feature in features:
+        extracted = pd.concat(blocks[feature], axis=0)
+        extracted.columns = [f"{feature}_{col}" for col in extracted.columns]
+        feature_frames.append(extracted)
+    
+    x_extracted = pd.concat(feature_frames, axis=1)
+    x_extracted.index = pd.Index([window_ids[i] for i in x_extracted.index], dtype=object, name='id')
+    return impute(x_extracted)
+
+def extract_tsfresh_features(x_df, y_df, use_minimal=True, engine='native', n_workers=None,
+                             shard_by='feature', chunk_size=None):
     """
     提取TSFresh特征（内存版本）
+    
+    engine: 'native' 使用原生向量化实现（与MinimalFCParameters等价），
+            'process' 使用tsfresh + 进程池（参数见 extract_tsfresh_features_multiprocess），
+            'tsfresh' 使用tsfresh + 线程池
     """
     print("\n[特征提取] 开始...")
     
+    if engine in ('native', 'process'):
+        windows, window_ids, features = long_frame_to_windows(x_df)
+        if engine == 'native':
+            x_extracted = extract_minimal_features_native(windows, window_ids, features)
+        else:
+            x_extracted = extract_tsfresh_features_multiprocess(
+                windows, window_ids, features, n_workers=n_workers,
+                shard_by=shard_by, chunk_size=chunk_size
+            )
+        
+        y_series = y_df.set_index('id')['target']
+        x_extracted = x_extracted.loc[y_series.index]
+        
+        print(f"[完成] 提取 {x_extracted.shape[1]} 个特征")
+        return x_extracted, y_series
+    
     from tsfresh import extract_features
     from tsfresh.feature_extraction import MinimalFCParameters
     from tsfresh.utilities.dataframe_functions import impute
@@ -341,66 +1222,222 @@ def select_features(x_extracted, y_series):
 # 第三部分：模型训练模块
 # ============================================================================
 
+def _clean_feature_name(col):
+    """清理单个特征名称（去除LightGBM/XGBoost不支持的字符）"""
+    clean_col = str(col)
+    clean_col = clean_col.replace('[', '_').replace(']', '_')
+    clean_col = clean_col.replace('{', '_').replace('}', '_')
+    clean_col = clean_col.replace('"', '').replace("'", '')
+    clean_col = clean_col.replace(':', '_').replace(',', '_')
+    clean_col = clean_col.replace(' ', '_').replace('<', 'lt')
+    clean_col = clean_col.replace('>', 'gt').replace('=', 'eq')
+    clean_col = clean_col.replace('(', '_').replace(')', '_')
+    while '__' in clean_col:
+        clean_col = clean_col.replace('__', '_')
+    return clean_col.strip('_')
+
 def clean_feature_names(df):
     """清理特征名称"""
-    cleaned_columns = []
-    for col in df.columns:
-        clean_col = str(col)
-        clean_col = clean_col.replace('[', '_').replace(']', '_')
-        clean_col = clean_col.replace('{', '_').replace('}', '_')
-        clean_col = clean_col.replace('"', '').replace("'", '')
-        clean_col = clean_col.replace(':', '_').replace(',', '_')
-        clean_col = clean_col.replace(' ', '_').replace('<', 'lt')
-        clean_col = clean_col.replace('>', 'gt').replace('=', 'eq')
-        clean_col = clean_col.replace('(', '_').replace(')', '_')
-        while '__' in clean_col:
-            clean_col = clean_col.replace('__', '_')
-        clean_col = clean_col.strip('_')
-        cleaned_columns.append(clean_col)
-    
     df_cleaned = df.copy()
-    df_cleaned.columns = cleaned_columns
+    df_cleaned.columns = [_clean_feature_name(col) for col in df.columns]
     return df_cleaned
 
-def find_optimal_threshold(y_true, y_proba, metric='precision', min_recall=0.3):
-    """寻找最优分类阈值"""
-    from sklearn.metrics import precision_score, recall_score, f1_score
+class FeaturePlan:
+    """
+    特征对齐计划（模型加载时构建一次）
+    
+    预先计算原生提取结果的每一列（tsfresh原始列名经 clean_feature_names 清理后）
+    在模型 feature_list 中的位置，预测时只需一次NumPy gather，
+    无需逐次清理列名和逐列对齐；模型需要但提取结果中不存在的特征保持为0
     
-    thresholds = np.arange(0.1, 0.95, 0.01)
-    best_threshold = 0.5
-    best_score = 0
+    默认使用float64（与训练时一致；LightGBM按float64比较阈值，降为float32会改变少数样本的预测）
+    """
     
-    for threshold in thresholds:
-        y_pred = (y_proba >= threshold).astype(int)
+    def __init__(self, feature_list, features=None, dtype=np.float64):
+        self.feature_list = list(feature_list)
+        self.features = list(features or TSFRESH_BASE_FEATURES)
+        self.dtype = dtype
         
-        precision_0 = precision_score(y_true, y_pred, pos_label=0, zero_division=0)
-        precision_1 = precision_score(y_true, y_pred, pos_label=1, zero_division=0)
-        recall_0 = recall_score(y_true, y_pred, pos_label=0, zero_division=0)
-        recall_1 = recall_score(y_true, y_pred, pos_label=1, zero_division=0)
+        positions = {}
+        for i, col in enumerate(minimal_feature_columns(self.features)):
+            positions.setdefault(_clean_feature_name(col), i)
         
-        min_class_recall = min(recall_0, recall_1)
+        source_index = np.array([positions.get(name, -1) for name in self.feature_list], dtype=np.intp)
+        self.target_index = np.flatnonzero(source_index >= 0)
+        self.source_index = source_index[self.target_index]
+        self.missing = [name for name, idx in zip(self.feature_list, source_index) if idx < 0]
+        self.columns = pd.Index(self.feature_list)
         
-        if min_class_recall >= min_recall:
-            avg_precision = (precision_0 + precision_1) / 2
-            f1 = f1_score(y_true, y_pred, average='macro', zero_division=0)
-            balanced_score = (avg_precision + (recall_0 + recall_1) / 2) / 2
-            
-            if metric == 'precision':
-                score = avg_precision
-            elif metric == 'f1':
-                score = f1
-            else:
-                score = balanced_score
-            
-            if score > best_score:
-                best_score = score
-                best_threshold = threshold
+        self._local = threading.local()
+    
+    def _row_buffer(self):
+        """单行预测复用的缓冲区（每个线程一个，缺失特征位置始终为0）"""
+        buffer = getattr(self._local, 'row', None)
+        if buffer is None:
+            buffer = np.zeros((1, len(self.feature_list)), dtype=self.dtype)
+            self._local.row = buffer
+        return buffer
+    
+    def gather(self, values, reuse_buffer=False):
+        """
+        将原生提取矩阵 (N, 原始特征数) 按 feature_list 重排为 (N, 模型特征数)
+        
+        reuse_buffer=True 且 N == 1 时返回线程内复用的缓冲区（下一次调用会被覆盖），
+        只用于结果立即被消费、不外传的内部预测路径
+        """
+        if reuse_buffer and len(values) == 1:
+            out = self._row_buffer()
+        else:
+            out = np.zeros((len(values), len(self.feature_list)), dtype=self.dtype)
+        out[:, self.target_index] = values[:, self.source_index]
+        return out
+    
+    def transform(self, windows, window_ids, reuse_buffer=False):
+        """窗口张量 -> 已对齐 feature_list 的DataFrame（列名与训练时一致，reuse_buffer 见 gather）"""
+        matrix = self.gather(_minimal_feature_values(windows), reuse_buffer)
+        return pd.DataFrame(matrix, index=pd.Index(window_ids, dtype=object, name='id'),
+                            columns=self.columns, copy=False)
+
+_FEATURE_PLANS = {}
+
+def get_feature_plan(feature_list, features=None):
+    """按 feature_list 缓存的 FeaturePlan（同一模型只构建一次）"""
+    key = (tuple(feature_list), tuple(features or TSFRESH_BASE_FEATURES))
+    plan = _FEATURE_PLANS.get(key)
+    if plan is None:
+        plan = FeaturePlan(feature_list, features)
+        _FEATURE_PLANS[key] = plan
+    return plan
+
+def _threshold_metrics(y_true, y_proba, thresholds):
+    """
+    一次排序计算所有候选阈值下的分类指标（预测为1当且仅当 y_proba >= 阈值）
     
-    return best_threshold, best_score
+    按概率排序后用累计计数得到每个阈值的混淆矩阵，复杂度 O(n log n + k log n)
+    
+    返回：
+    - 字典，包含每个阈值对应的 precision_0/1、recall_0/1、f1_macro 数组
+    """
+    y_true = np.asarray(y_true).astype(int).ravel()
+    y_proba = np.asarray(y_proba, dtype=np.float64).ravel()
+    
+    order = np.argsort(y_proba, kind='mergesort')
+    sorted_proba = y_proba[order]
+    # cum_pos[k]: 概率最小的k个样本中真实标签为1的数量
+    cum_pos = np.concatenate(([0], np.cumsum(y_true[order] == 1)))
+    
+    n = len(y_true)
+    n_pos = int(cum_pos[-1])
+    n_neg = n - n_pos
+    
+    # 低于阈值的样本数（预测为0）
+    split = np.searchsorted(sorted_proba, thresholds, side='left')
+    pred_0 = split
+    pred_1 = n - split
+    tp_1 = n_pos - cum_pos[split]
+    tp_0 = split - cum_pos[split]
+    
+    def _ratio(num, den):
+        # 与sklearn的 zero_division=0 一致
+        return np.divide(num, den, out=np.zeros(len(thresholds)), where=den > 0)
+    
+    f1_0 = _ratio(2.0 * tp_0, pred_0 + n_neg)
+    f1_1 = _ratio(2.0 * tp_1, pred_1 + n_pos)
+    # 宏平均只统计在真实标签或预测中出现过的类别
+    present_0 = (n_neg > 0) | (pred_0 > 0)
+    present_1 = (n_pos > 0) | (pred_1 > 0)
+    n_present = present_0.astype(int) + present_1.astype(int)
+    f1_macro = _ratio(f1_0 * present_0 + f1_1 * present_1, n_present)
+    
+    return {
+        'precision_0': _ratio(tp_0, pred_0),
+        'precision_1': _ratio(tp_1, pred_1),
+        'recall_0': _ratio(tp_0, np.full(len(thresholds), n_neg)),
+        'recall_1': _ratio(tp_1, np.full(len(thresholds), n_pos)),
+        'f1_macro': f1_macro,
+    }
 
-def train_models(X_train, X_test, y_train, y_test, use_multi_models=True):
+def find_optimal_threshold(y_true, y_proba, metric='precision', min_recall=0.3, thresholds=None):
+    """
+    寻找最优分类阈值
+    
+    参数：
+    - metric: 'precision'（两类平均精确率）、'f1'（宏平均F1）或其他（精确率与召回率的均衡分数）
+    - min_recall: 两类召回率均需达到的下限
+    - thresholds: 候选阈值，None为默认网格 0.10~0.94（步长0.01），
+      'unique' 为全部不同的概率值（覆盖所有可能的混淆矩阵），也可传入任意阈值数组
+    
+    返回：
+    - (最优阈值, 最优分数)；没有满足条件的阈值时返回 (0.5, 0)
+    """
+    if thresholds is None:
+        thresholds = np.arange(0.1, 0.95, 0.01)
+    elif isinstance(thresholds, str):
+        if thresholds != 'unique':
+            raise ValueError(f"不支持的阈值网格: {thresholds}")
+        thresholds = np.unique(np.asarray(y_proba, dtype=np.float64))
+    thresholds = np.asarray(thresholds, dtype=np.float64).ravel()
+    
+    if len(thresholds) == 0:
+        return 0.5, 0
+    
+    m = _threshold_metrics(y_true, y_proba, thresholds)
+    
+    avg_precision = (m['precision_0'] + m['precision_1']) / 2
+    if metric == 'precision':
+        scores = avg_precision
+    elif metric == 'f1':
+        scores = m['f1_macro']
+    else:
+        scores = (avg_precision + (m['recall_0'] + m['recall_1']) / 2) / 2
+    
+    # 与逐阈值搜索一致：只接受满足召回下限且分数大于0的阈值，并列时取最小阈值
+    valid = (np.minimum(m['recall_0'], m['recall_1']) >= min_recall) & (scores > 0)
+    if not valid.any():
+        return 0.5, 0
+    
+    best = int(np.argmax(np.where(valid, scores, -np.inf)))
+    return thresholds[best], scores[best]
+
+def _report_progress(progress_callback, stage, progress, message=''):
+    """向调用方报告训练进度（progress 为 0~1），回调出错不影响训练"""
+    if progress_callback is None:
+        return
+    try:
+        progress_callback(stage, progress, message)
+    except Exception as e:
+        print(f"[警告] 进度回调失败: {e}")
+
+def time_ordered_split(X, y, end_dates, label_dates, test_size=0.2):
+    """
+    按时间划分训练集与测试集（留出样本）
+    
+    以窗口最后一天的 (1-test_size) 分位日期为截止日：测试集为截止日之后的窗口；
+    训练集只保留目标日期不晚于截止日的窗口，训练用到的数据（含目标）都不晚于截止日
+    
+    返回：
+    - X_train, X_test, y_train, y_test
+    - cutoff: 训练截止日（pd.Timestamp）
+    - test_dates: 测试集每行的窗口结束日期
+    """
+    end_dates = pd.DatetimeIndex(end_dates)
+    label_dates = pd.DatetimeIndex(label_dates)
+    unique_dates = end_dates.unique().sort_values()
+    cutoff = unique_dates[min(int(len(unique_dates) * (1 - test_size)), len(unique_dates) - 1)]
+    train_mask = np.asarray(label_dates <= cutoff)
+    test_mask = np.asarray(end_dates > cutoff)
+    return (X[train_mask], X[test_mask], y[train_mask], y[test_mask],
+            cutoff, end_dates[test_mask])
+
+def train_models(X_train, X_test, y_train, y_test, use_multi_models=True, progress_callback=None,
+                 X_val=None, y_val=None):
     """
     训练模型（内存版本）
+
+    progress_callback(stage, progress, message) 在开始训练每个模型时被调用，
+    progress 为本阶段内的完成比例（0~1）
+    X_val/y_val 不为空时在验证集上确定各模型的阈值并选择最佳模型，测试集只用于评估；
+    否则阈值与最佳模型都在测试集上确定（测试集指标偏乐观）
     """
     from sklearn.model_selection import train_test_split
     from sklearn.ensemble import RandomForestClassifier
@@ -419,11 +1456,18 @@ def train_models(X_train, X_test, y_train, y_test, use_multi_models=True):
     
     X_train_cleaned = clean_feature_names(X_train_use) if isinstance(X_train_use, pd.DataFrame) else X_train_use
     X_test_cleaned = clean_feature_names(X_test) if isinstance(X_test, pd.DataFrame) else X_test
+    if X_val is not None:
+        X_tune = clean_feature_names(X_val) if isinstance(X_val, pd.DataFrame) else X_val
+        y_tune = y_val
+    else:
+        X_tune, y_tune = X_test_cleaned, y_test
     
     models_dict = {}
     
     # Random Forest
+    n_models = 3 if use_multi_models else 1
     print("[训练] Random Forest...")
+    _report_progress(progress_callback, 'train', 0.0, 'Random Forest')
     rf_model = RandomForestClassifier(
         n_estimators=1000,
         random_state=42,
@@ -442,6 +1486,7 @@ def train_models(X_train, X_test, y_train, y_test, use_multi_models=True):
         try:
             import xgboost as xgb
             print("[训练] XGBoost...")
+            _report_progress(progress_callback, 'train', 1 / n_models, 'XGBoost')
             neg_count = (y_train_use == 0).sum()
             pos_count = (y_train_use == 1).sum()
             scale_pos_weight = neg_count / pos_count if pos_count > 0 else 1
@@ -466,6 +1511,7 @@ def train_models(X_train, X_test, y_train, y_test, use_multi_models=True):
         try:
             import lightgbm as lgb
             print("[训练] LightGBM...")
+            _report_progress(progress_callback, 'train', 2 / n_models, 'LightGBM')
             lgb_model = lgb.LGBMClassifier(
                 n_estimators=500,
                 max_depth=6,
@@ -484,14 +1530,17 @@ def train_models(X_train, X_test, y_train, y_test, use_multi_models=True):
             pass
     
     # 选择最佳模型
+    _report_progress(progress_callback, 'evaluate', 0.0, f'{len(models_dict)} 个模型')
     best_model = None
     best_model_name = None
     best_precision = 0
     all_models_data = {}
     
     for model_name, model in models_dict.items():
+        optimal_threshold, tune_score = find_optimal_threshold(
+            y_tune, model.predict_proba(X_tune)[:, 1], metric='precision', min_recall=0.3
+        )
         y_proba = model.predict_proba(X_test_cleaned)[:, 1]
-        optimal_threshold, _ = find_optimal_threshold(y_test, y_proba, metric='precision', min_recall=0.3)
         y_pred = (y_proba >= optimal_threshold).astype(int)
         
         precision_0 = precision_score(y_test, y_pred, pos_label=0, zero_division=0)
@@ -510,17 +1559,18 @@ def train_models(X_train, X_test, y_train, y_test, use_multi_models=True):
         
         print(f"  {model_name}: 精确率={avg_precision:.2%}, 阈值={optimal_threshold:.3f}")
         
-        if avg_precision > best_precision:
-            best_precision = avg_precision
+        # 有验证集时按验证集上的分数选择，测试集指标保持独立
+        score = tune_score if X_val is not None else avg_precision
+        if best_model is None or score > best_precision:
+            best_precision = score
             best_model = model
             best_model_name = model_name
     
-    print(f"\n[最佳模型] {best_model_name} (精确率={best_precision:.2%})")
+    print(f"\n[最佳模型] {best_model_name} (精确率={all_models_data[best_model_name]['avg_precision']:.2%})")
     
     # 最终预测
     y_proba = best_model.predict_proba(X_test_cleaned)[:, 1]
-    optimal_threshold, _ = find_optimal_threshold(y_test, y_proba, metric='precision', min_recall=0.3)
-    y_pred = (y_proba >= optimal_threshold).astype(int)
+    y_pred = (y_proba >= all_models_data[best_model_name]['optimal_threshold']).astype(int)
     accuracy = accuracy_score(y_test, y_pred)
     
     print(f"\n[性能评估]")
@@ -532,141 +1582,283 @@ def train_models(X_train, X_test, y_train, y_test, use_multi_models=True):
 # 第四部分：预测模块
 # ============================================================================
 
+_PREDICTION_CACHE = None
+
+def get_prediction_cache():
+    """
+    获取进程内共享的预测结果缓存（设置环境变量 STOCK_PREDICTION_CACHE=0 可禁用）
+    
+    设置 STOCK_PREDICTION_CACHE_DIR 时同时启用磁盘缓存，多个进程可共享
+    """
+    global _PREDICTION_CACHE
+    if _PREDICTION_CACHE is None:
+        if os.environ.get('STOCK_PREDICTION_CACHE', '1') == '0':
+            _PREDICTION_CACHE = False
+        else:
+            from utils.prediction_cache import PredictionCache
+            _PREDICTION_CACHE = PredictionCache(disk_dir=os.environ.get('STOCK_PREDICTION_CACHE_DIR'))
+    return _PREDICTION_CACHE if _PREDICTION_CACHE is not False else None
+
+def _prediction_cache_key(stock_code, stock_data, model, all_models_data, feature_list,
+                          window_size, model_version):
+    """缓存键：股票、窗口、最新K线日期、模型版本（默认为模型指纹）、结果格式"""
+    from utils.prediction_cache import make_key, model_fingerprint
+    multi = bool(all_models_data) and len(all_models_data) > 1
+    if model_version is None:
+        model_version = model_fingerprint(model, all_models_data if multi else None, feature_list)
+    return make_key(stock_code, window_size, stock_data.index[-1], model_version,
+                    'multi' if multi else 'single')
+
 def predict_single_stock_inline(stock_code, model, all_models_data, feature_list,
-                                window_size=20, days=365):
+                                window_size=20, days=365, feature_plan=None,
+                                prediction_cache=None, model_version=None,
+                                stock_data=None, features=None):
     """
     预测单只股票（内存版本）
+    
+    prediction_cache 不为空时（见 get_prediction_cache），同一股票在同一根最新K线、同一模型版本下
+    只做一次特征提取和推理；model_version 默认为模型指纹（建议传入制品包版本号）
+    
+    stock_data / features 为调用方已有的日线数据和 extract_prediction_features 的结果，提供时不再下载/提取
     """
     print(f"\n[预测] {stock_code}")
     
     # 下载数据
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-    start_date_str = start_date.strftime('%Y%m%d')
-    end_date_str = end_date.strftime('%Y%m%d')
-    
-    stock_data = download_single_stock_data(stock_code, start_date_str, end_date_str)
+    if stock_data is None:
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        start_date_str = start_date.strftime('%Y%m%d')
+        end_date_str = end_date.strftime('%Y%m%d')
+        
+        stock_data = download_single_stock_data(stock_code, start_date_str, end_date_str)
     if stock_data is None:
         print(f"[失败] 无法下载数据")
         return None
     
-    # 提取特征
-    from tsfresh import extract_features
-    from tsfresh.feature_extraction import MinimalFCParameters
-    from tsfresh.utilities.dataframe_functions import impute
+    def compute():
+        if features is not None:
+            results = predict_from_features(features, {stock_code: stock_data}, model, all_models_data)
+        else:
+            results = predict_stocks_batch(
+                [stock_code], model, all_models_data, feature_list,
+                window_size=window_size, all_data={stock_code: stock_data}, feature_plan=feature_plan
+            )
+        if not results:
+            return None
+        # 缓存中不保存行情数据，命中时附上本次下载的数据
+        return {k: v for k, v in results[0].items() if k != 'stock_data'}
     
-    tsfresh_features = [
-        'Close', 'Open', 'High', 'Low', 'Volume', 'TurnoverRate',
-        'PriceChangeRate', 'MainNetInflow', 'MainNetInflowRatio'
-    ]
+    if prediction_cache is None or len(stock_data) < window_size:
+        result = compute()
+    else:
+        key = _prediction_cache_key(stock_code, stock_data, model, all_models_data, feature_list,
+                                    window_size, model_version)
+        result = prediction_cache.get_or_compute(key, compute)
+    return dict(result, stock_data=stock_data) if result is not None else None
+
+def _download_prediction_data(stock_codes, start_date, end_date, max_workers=8):
+    """
+    为批量预测准备日线数据
     
-    for feature in tsfresh_features:
-        if feature not in stock_data.columns:
-            stock_data[feature] = 0
+    启用本地行情缓存时并发调用 download_single_stock_data（同日命中缓存、跨日增量刷新），
+    否则使用 StockDownloader 批量并发下载
+    """
+    if get_ohlcv_cache() is None:
+        return download_multiple_stocks(stock_codes, start_date, end_date, max_workers=max_workers)
     
-    if len(stock_data) < window_size:
-        print(f"[失败] 数据不足")
-        return None
+    all_data = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        futures = {executor.submit(download_single_stock_data, code, start_date, end_date): code
+                   for code in stock_codes}
+        for future in as_completed(futures):
+            df = future.result()
+            if df is not None:
+                all_data[futures[future]] = df
+    return all_data
+
+def _build_prediction_windows(all_data, stock_codes, window_size=20):
+    """
+    取每只股票最近 window_size 天的基础特征，拼成 (股票数, window_size, 特征数) 张量
     
-    window_data = stock_data.iloc[-window_size:]
-    tsfresh_data_list = []
-    window_id = "prediction"
-    
-    for feature in tsfresh_features:
-        feature_values = window_data[feature].values
-        for time_idx, value in enumerate(feature_values):
-            tsfresh_data_list.append({
-                'id': window_id,
-                'time': time_idx,
-                'feature_name': feature,
-                'value': float(value) if not pd.isna(value) else 0.0
-            })
+    返回：
+    - windows: float64 张量，NaN已填0
+    - valid_codes: 数据充足、进入张量的股票代码（与张量行顺序一致）
+    """
+    n_features = len(TSFRESH_BASE_FEATURES)
+    windows = np.zeros((len(stock_codes), window_size, n_features), dtype=np.float64)
+    valid_codes = []
     
-    x_df = pd.DataFrame(tsfresh_data_list)
+    for stock_code in stock_codes:
+        stock_data = all_data.get(stock_code)
+        if stock_data is None or len(stock_data) < window_size:
+            print(f"[失败] {stock_code} 数据不足")
+            continue
+        
+        for feature in TSFRESH_BASE_FEATURES:
+            if feature not in stock_data.columns:
+                stock_data[feature] = 0
+        
+        windows[len(valid_codes)] = stock_data[TSFRESH_BASE_FEATURES].iloc[-window_size:].to_numpy(dtype=np.float64)
+        valid_codes.append(stock_code)
     
-    all_extracted_features = []
-    feature_extraction_settings = MinimalFCParameters()
+    windows = np.nan_to_num(windows[:len(valid_codes)], nan=0.0, posinf=np.inf, neginf=-np.inf)
+    return windows, valid_codes
+
+def predict_stocks_batch(stock_codes, model, all_models_data, feature_list, window_size=20,
+                         days=365, all_data=None, max_workers=8, feature_plan=None,
+                         prediction_cache=None, model_version=None):
+    """
+    批量预测多只股票（一次特征提取，每个模型一次 predict_proba）
     
-    for feature_type in tsfresh_features:
-        feature_df = x_df[x_df['feature_name'] == feature_type].copy()
-        feature_df = feature_df.drop('feature_name', axis=1)
-        
-        try:
-            extracted = extract_features(
-                feature_df,
-                column_id="id",
-                column_sort="time",
-                column_value="value",
-                default_fc_parameters=feature_extraction_settings,
-                n_jobs=1,
-                disable_progressbar=True
-            )
-            extracted.columns = [f"{feature_type}_{col}" for col in extracted.columns]
-            all_extracted_features.append(extracted)
-        except:
-            continue
+    流程：并发/缓存下载 -> 构建 (N, window_size, 特征数) 窗口张量 -> 原生向量化特征提取
+    -> 按 FeaturePlan 一次gather对齐 feature_list -> 每个模型对全部N行调用一次 predict_proba
     
-    if not all_extracted_features:
-        print(f"[失败] 特征提取失败")
-        return None
+    参数：
+    - all_data: 已有的 {代码: DataFrame}，提供时不再下载
+    - max_workers: 并发下载线程数
+    - feature_plan: 预先构建的 FeaturePlan，默认按 feature_list 从缓存获取
+    - prediction_cache / model_version: 预测结果缓存，只对未命中的股票提取特征和推理
     
-    x_extracted = pd.concat(all_extracted_features, axis=1)
-    x_extracted = impute(x_extracted)
-    x_extracted = clean_feature_names(x_extracted)
+    返回：
+    - 结果列表（顺序与输入一致，失败的股票被跳过），格式与 predict_single_stock_inline 相同
+    """
+    stock_codes = list(dict.fromkeys(stock_codes))
     
-    # 对齐特征
-    aligned_df = pd.DataFrame(0, index=x_extracted.index, columns=feature_list)
-    for col in x_extracted.columns:
-        if col in feature_list:
-            aligned_df[col] = x_extracted[col]
+    if all_data is None:
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        all_data = _download_prediction_data(
+            stock_codes, start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d'), max_workers
+        )
     
-    # 预测
+    if prediction_cache is not None:
+        return _predict_stocks_cached(stock_codes, model, all_models_data, feature_list, window_size,
+                                      all_data, feature_plan, prediction_cache, model_version)
+    
+    # 特征只在本次推理中使用，单行预测复用线程内缓冲区
+    aligned_df = _extract_prediction_features(all_data, stock_codes, feature_list, window_size, feature_plan,
+                                              reuse_buffer=True)
+    if aligned_df is None:
+        return []
+    return predict_from_features(aligned_df, all_data, model, all_models_data)
+
+def _extract_prediction_features(all_data, stock_codes, feature_list, window_size, feature_plan, reuse_buffer):
+    windows, valid_codes = _build_prediction_windows(all_data, stock_codes, window_size)
+    if not valid_codes:
+        return None
+    plan = feature_plan or get_feature_plan(feature_list)
+    return plan.transform(windows, valid_codes, reuse_buffer)
+
+def extract_prediction_features(all_data, stock_codes, feature_list, window_size=20, feature_plan=None):
+    """
+    提取预测特征：取每只股票最近 window_size 天，原生向量化特征提取后按预编译的对齐计划重排到 feature_list
+    
+    返回：
+    - 以股票代码为索引的DataFrame（数据不足的股票被跳过，每次调用返回新的数组），没有可用股票时返回None
+    """
+    return _extract_prediction_features(all_data, stock_codes, feature_list, window_size, feature_plan,
+                                        reuse_buffer=False)
+
+def predict_from_features(aligned_df, all_data, model, all_models_data):
+    """
+    对 extract_prediction_features 的结果推理，返回格式与 predict_stocks_batch 相同
+    """
+    valid_codes = list(aligned_df.index)
+    
+    # 预测（model_data 中有 compile_models 生成的编译版本时使用编译版本）
+    from utils.tree_inference import model_predict_proba
     if all_models_data and len(all_models_data) > 1:
-        predictions_dict = {}
+        model_outputs = {}
         for model_name, model_data in all_models_data.items():
-            m = model_data['model']
             threshold = model_data.get('optimal_threshold', 0.5)
-            probability = m.predict_proba(aligned_df)[0]
-            prediction = 1 if probability[1] >= threshold else 0
+            probabilities = model_predict_proba(model_data, aligned_df)
+            model_outputs[model_name] = (model_data, threshold, probabilities)
+        
+        results = []
+        for i, stock_code in enumerate(valid_codes):
+            predictions_dict = {}
+            for model_name, (model_data, threshold, probabilities) in model_outputs.items():
+                probability = probabilities[i]
+                predictions_dict[model_name] = {
+                    'prediction': 1 if probability[1] >= threshold else 0,
+                    'probability': probability,
+                    'prob_strong': probability[0],  # 强势概率
+                    'prob_weak': probability[1],    # 弱势概率
+                    'confidence': max(probability),
+                    'optimal_threshold': threshold,
+                    'train_accuracy': model_data.get('accuracy', 0),
+                    'train_precision': model_data.get('avg_precision', 0)
+                }
             
-            predictions_dict[model_name] = {
-                'prediction': prediction,
-                'probability': probability,
-                'prob_strong': probability[0],  # 强势概率
-                'prob_weak': probability[1],    # 弱势概率
-                'confidence': max(probability),
-                'optimal_threshold': threshold,
-                'train_accuracy': model_data.get('accuracy', 0),
-                'train_precision': model_data.get('avg_precision', 0)
-            }
-        
-        return {
-            'stock_code': stock_code,
-            'stock_data': stock_data,
-            'predictions': predictions_dict,
-            'type': 'multi'
-        }
+            results.append({
+                'stock_code': stock_code,
+                'stock_data': all_data[stock_code],
+                'predictions': predictions_dict,
+                'type': 'multi'
+            })
+        return results
+    
+    model_data = next((data for data in (all_models_data or {}).values() if data['model'] is model), None)
+    if model_data is not None:
+        probabilities = model_predict_proba(model_data, aligned_df)
+        predictions = model.classes_[np.argmax(probabilities, axis=1)]
     else:
-        prediction = model.predict(aligned_df)[0]
-        probability = model.predict_proba(aligned_df)[0]
-        
-        return {
+        predictions = model.predict(aligned_df)
+        probabilities = model.predict_proba(aligned_df)
+    return [
+        {
             'stock_code': stock_code,
-            'stock_data': stock_data,
-            'prediction': prediction,
-            'probability': probability,
+            'stock_data': all_data[stock_code],
+            'prediction': predictions[i],
+            'probability': probabilities[i],
             'type': 'single'
         }
+        for i, stock_code in enumerate(valid_codes)
+    ]
+
+def _predict_stocks_cached(stock_codes, model, all_models_data, feature_list, window_size,
+                           all_data, feature_plan, prediction_cache, model_version):
+    """predict_stocks_batch 的缓存路径：命中的股票直接返回，其余股票一次批量预测后写入缓存"""
+    keys, cached, missing = {}, {}, []
+    for stock_code in stock_codes:
+        stock_data = all_data.get(stock_code)
+        if stock_data is None or len(stock_data) < window_size:
+            missing.append(stock_code)
+            continue
+        keys[stock_code] = _prediction_cache_key(stock_code, stock_data, model, all_models_data,
+                                                 feature_list, window_size, model_version)
+        value = prediction_cache.get(keys[stock_code])
+        if value is not None:
+            cached[stock_code] = value
+        else:
+            missing.append(stock_code)
+    
+    if missing:
+        for result in predict_stocks_batch(missing, model, all_models_data, feature_list,
+                                           window_size=window_size, all_data=all_data,
+                                           feature_plan=feature_plan):
+            value = {k: v for k, v in result.items() if k != 'stock_data'}
+            prediction_cache.put(keys[result['stock_code']], value)
+            cached[result['stock_code']] = value
+    
+    return [dict(cached[code], stock_data=all_data[code]) for code in stock_codes if code in cached]
 
 # ============================================================================
 # 主流程函数
 # ============================================================================
 
 def train_stock_prediction_model(stock_codes, window_size=20, forecast_horizon=5,
-                                 use_multi_models=True):
+                                 use_multi_models=True, data_dir=None, bundle_dir=None,
+                                 progress_callback=None, on_saved=None):
     """
     完整训练流程（内存版本）
     
+    data_dir 不为空时从本地数据目录读取日线（只读取TSFresh所需的基础列），不联网下载
+    bundle_dir 不为空时把所有模型保存为制品包的新版本（见 utils.model_bundle），
+    保存后调用 on_saved(version) 告知新版本号
+    progress_callback(stage, progress, message) 在每个步骤开始时被调用，stage 依次为
+    download / features / extract / select / train / evaluate / save（见 utils.training_jobs）
+    
     返回：
     - best_model: 最佳模型
     - all_models_data: 所有模型数据
@@ -677,42 +1869,86 @@ def train_stock_prediction_model(stock_codes, window_size=20, forecast_horizon=5
     print("="*80)
     
     # 1. 下载数据
-    print("\n[步骤1] 下载股票数据")
-    all_data = download_multiple_stocks(stock_codes)
+    _report_progress(progress_callback, 'download', 0.0, f'{len(stock_codes)} 只股票')
+    if data_dir:
+        print("\n[步骤1] 读取本地股票数据")
+        all_data = load_local_stock_data(stock_codes, data_dir, columns=TSFRESH_BASE_FEATURES)
+    else:
+        print("\n[步骤1] 下载股票数据")
+        all_data = download_multiple_stocks(stock_codes)
     if not all_data:
         print("[错误] 没有成功下载任何数据")
         return None, None, None
     
-    # 2. 特征工程
+    # 2. 特征工程（直接构建窗口张量，无需长格式数据）
     print("\n[步骤2] 特征工程")
-    x_df, y_df = create_tsfresh_data(all_data, window_size, forecast_horizon)
-    if x_df.empty:
+    _report_progress(progress_callback, 'features', 0.0, f'{len(all_data)} 只股票')
+    print(f"[特征工程] 窗口={window_size}天, 预测期={forecast_horizon}天")
+    windows, window_ids, targets = build_window_tensor(all_data, window_size, forecast_horizon)
+    if len(window_ids) == 0:
         print("[错误] 特征数据生成失败")
         return None, None, None
+    print(f"[完成] 生成 {len(window_ids)} 个样本")
     
-    # 3. 提取特征
+    # 3. 提取特征（原生MinimalFCParameters实现）
     print("\n[步骤3] TSFresh特征提取")
-    x_extracted, y_series = extract_tsfresh_features(x_df, y_df)
-    if x_extracted is None:
-        print("[错误] 特征提取失败")
-        return None, None, None
+    _report_progress(progress_callback, 'extract', 0.0, f'{len(window_ids)} 个样本')
+    x_extracted = extract_minimal_features_native(windows, window_ids)
+    y_series = pd.Series(targets, index=x_extracted.index, name='target')
+    print(f"[完成] 提取 {x_extracted.shape[1]} 个特征")
     
     # 4. 特征选择
     print("\n[步骤4] 特征选择")
+    _report_progress(progress_callback, 'select', 0.0, f'{x_extracted.shape[1]} 个特征')
     x_filtered = select_features(x_extracted, y_series)
     x_filtered = clean_feature_names(x_filtered)
     
     # 5. 训练模型
     print("\n[步骤5] 模型训练")
-    from sklearn.model_selection import train_test_split
-    X_train, X_test, y_train, y_test = train_test_split(
-        x_filtered, y_series, test_size=0.2, random_state=42, stratify=y_series
+    # 按时间划分：留出样本全部晚于训练截止日，之后的版本可以在同一份样本上公平比较
+    end_dates, label_dates = window_dates(all_data, x_filtered.index, forecast_horizon)
+    X_train, X_test, y_train, y_test, cutoff, test_dates = time_ordered_split(
+        x_filtered, y_series, end_dates, label_dates, test_size=0.2
     )
+    # 阈值与最佳模型在训练期末尾的验证集上确定，测试集（留出样本）上的指标才是独立评估
+    train_rows = x_filtered.index.get_indexer(X_train.index)
+    X_fit, X_val, y_fit, y_val, val_cutoff, _ = time_ordered_split(
+        X_train, y_train, end_dates[train_rows], label_dates[train_rows], test_size=0.2
+    )
+    print(f"[划分] 训练截止日 {cutoff:%Y-%m-%d}: 训练集 {len(y_fit)}（至 {val_cutoff:%Y-%m-%d}）, "
+          f"验证集 {len(y_val)}, 测试集 {len(y_test)}")
     
     best_model, all_models_data, feature_list = train_models(
-        X_train, X_test, y_train, y_test, use_multi_models
+        X_fit, X_test, y_fit, y_test, use_multi_models, progress_callback=progress_callback,
+        X_val=X_val, y_val=y_val
     )
     
+    if bundle_dir:
+        # 留出样本保存全部原生特征（而不只是本次选出的特征），之后特征选择结果不同的版本
+        # 也能在上面与本版本比较
+        _report_progress(progress_callback, 'save', 0.0, bundle_dir)
+        from utils.model_bundle import save_model_bundle, hash_training_data
+        best_name = next(name for name, data in all_models_data.items() if data['model'] is best_model)
+        version = save_model_bundle(
+            bundle_dir, all_models_data, feature_list, best_model_name=best_name,
+            training_data_hash=hash_training_data(x_filtered, y_series),
+            training_cutoff=cutoff,
+            metadata={
+                'stock_codes': list(all_data),
+                'stock_count': len(all_data),
+                'sample_count': len(y_series),
+                'test_size': len(y_test),
+                'validation_size': len(y_val),
+                'threshold_tuned_on': 'validation',
+                'window_size': window_size,
+                'forecast_horizon': forecast_horizon,
+            },
+            holdout=(clean_feature_names(x_extracted.loc[X_test.index]), y_test, test_dates)
+        )
+        print(f"[保存] 模型制品包版本 {version} -> {bundle_dir}")
+        if on_saved is not None:
+            on_saved(version)
+    
     print("\n" + "="*80)
     print("[完成] 模型训练完成")
     print(f"  特征数: {len(feature_list)}")
@@ -722,21 +1958,20 @@ def train_stock_prediction_model(stock_codes, window_size=20, forecast_horizon=5
     return best_model, all_models_data, feature_list
 
 def predict_stocks_inline(stock_codes, model, all_models_data, feature_list,
-                          window_size=20):
+                          window_size=20, max_workers=8, feature_plan=None,
+                          prediction_cache=None, model_version=None):
     """
-    批量预测（内存版本）
+    批量预测（内存版本，所有股票一次提取特征并批量推理）
     """
     print("\n" + "="*80)
     print(f"股票预测（共{len(stock_codes)}只）")
     print("="*80)
     
-    results = []
-    for stock_code in stock_codes:
-        result = predict_single_stock_inline(
-            stock_code, model, all_models_data, feature_list, window_size
-        )
-        if result:
-            results.append(result)
+    results = predict_stocks_batch(
+        stock_codes, model, all_models_data, feature_list,
+        window_size=window_size, max_workers=max_workers, feature_plan=feature_plan,
+        prediction_cache=prediction_cache, model_version=model_version
+    )
     
     print(f"\n[完成] 成功预测 {len(results)}/{len(stock_codes)} 只股票")
     return results
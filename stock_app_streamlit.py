@@ -15,8 +15,11 @@ streamlit run stock_app_streamlit.py
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import time
+import inspect
+import threading
 
 # 页面配置
 st.set_page_config(
@@ -60,51 +63,131 @@ try:
         download_single_stock_data,
         predict_single_stock_inline,
         train_stock_prediction_model,
-        EFINANCE_AVAILABLE
+        get_feature_plan,
+        get_prediction_cache,
+        get_ohlcv_cache,
+        extract_prediction_features,
+        is_efinance_available,
+        warm_up_dependencies
     )
+    from utils.prediction_cache import trading_epoch, model_fingerprint
     PREDICTION_AVAILABLE = True
     st.success("✅ 预测模块加载成功")
 except ImportError as e:
     st.error(f"⚠️ 预测模块导入失败: {e}")
     st.info("请确保所有依赖已正确安装")
     PREDICTION_AVAILABLE = False
-    EFINANCE_AVAILABLE = False
+    
+    def is_efinance_available():
+        return False
 
-# 全局变量存储模型（使用缓存避免重复训练）
 @st.cache_resource(show_spinner=False)
-def load_or_train_models():
+def start_dependency_warmup():
+    """
+    每个进程只启动一次：UI渲染时在后台线程预先导入efinance和模型相关依赖
+    """
+    if PREDICTION_AVAILABLE:
+        return warm_up_dependencies()
+    return None
+
+MODELS_DIR = 'models'
+MODEL_BUNDLE_DIR = os.path.join(MODELS_DIR, 'bundle')
+
+# 没有可用模型时后台训练所用的股票（少量股票快速训练）
+TRAIN_STOCKS = ['600519', '000001', '600036', '000002', '600410']
+# 训练进行中时侧边栏刷新训练进度的间隔（秒）
+TRAINING_POLL_SECONDS = 2
+# 模型注册表检查新版本的间隔（秒）与内存中保留的版本数
+MODEL_POLL_SECONDS = 30
+MODEL_WARM_VERSIONS = 2
+
+
+def _prepare_models(all_models_data, feature_list):
+    """模型加载时预先构建特征对齐计划，并把树模型编译为扁平数组"""
+    from utils.tree_inference import compile_models
+    get_feature_plan(feature_list)
+    compile_models(all_models_data)
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_registry():
     """
-    加载或训练模型（带缓存）
-    优先从本地加载，如果不存在则训练
+    每个进程一个模型注册表（utils.model_registry）：后台监视制品包目录，新版本通过
+    留出样本验证后原子切换，无需重启；内存中保留 MODEL_WARM_VERSIONS 个版本用于对比和回滚
     """
-    import pickle
-    import os
+    from utils.model_registry import ModelRegistry
     
-    # 尝试从文件加载
-    if os.path.exists('models/trained_model.pkl'):
-        try:
-            with open('models/trained_model.pkl', 'rb') as f:
-                model = pickle.load(f)
-            with open('models/all_trained_models.pkl', 'rb') as f:
-                all_models_data = pickle.load(f)
-            with open('models/feature_list.pkl', 'rb') as f:
-                feature_list = pickle.load(f)
-            with open('models/model_info.pkl', 'rb') as f:
-                model_info = pickle.load(f)
-            
-            return model, all_models_data, feature_list, model_info
-        except:
-            pass
+    registry = ModelRegistry(MODEL_BUNDLE_DIR, max_warm=MODEL_WARM_VERSIONS, poll_interval=MODEL_POLL_SECONDS)
+    
+    def on_event(event, record):
+        # 版本移出内存后删除其预测结果缓存
+        prediction_cache = get_prediction_cache()
+        if event == 'evicted' and prediction_cache is not None:
+            prediction_cache.invalidate(model_version=record['version'])
     
-    # 如果文件不存在，在内存中训练
-    st.warning("⚠️ 本地模型不存在，将在内存中训练新模型（首次可能较慢）")
+    registry.add_listener(on_event)
+    registry.start()
     
-    # 使用少量股票快速训练
-    train_stocks = ['600519', '000001', '600036', '000002', '600410']
+    # 后台训练完成后立即检查新版本，不必等到下一次轮询
+    runner = get_training_runner()
+    if runner is not None:
+        runner.add_done_callback(lambda job: registry.poll_now())
+    return registry
+
+
+@st.cache_resource(show_spinner=False)
+def load_legacy_model_files():
+    """加载旧格式的 .pkl 模型文件（带缓存）"""
+    from utils.model_bundle import load_legacy_models
+    
+    start = time.perf_counter()
+    model, all_models_data, feature_list, model_info = load_legacy_models(MODELS_DIR)
+    model_info['load_seconds'] = time.perf_counter() - start
+    model_info['model_version'] = model_fingerprint(model, all_models_data, feature_list)
+    _prepare_models(all_models_data, feature_list)
+    return model, all_models_data, feature_list, model_info
+
+
+@st.cache_resource(show_spinner=False)
+def get_training_runner():
+    """
+    每个进程一个后台训练任务管理器（utils.training_jobs）
+    模型目录不可写（如只读部署环境）时返回None
+    """
+    from utils.training_jobs import TrainingJobRunner
+    
+    # 制品包目录（或其最近的已存在上级目录）可写时才能保存训练结果
+    path = os.path.abspath(MODEL_BUNDLE_DIR)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    if not os.access(path, os.W_OK):
+        print(f"[模型] 模型目录不可写，无法后台训练: {path}")
+        return None
+    return TrainingJobRunner(MODEL_BUNDLE_DIR)
+
+
+@st.cache_resource(show_spinner=False)
+def start_initial_training():
+    """
+    没有任何可用模型时，每个进程自动提交一次后台训练任务
+    （失败后不自动重试，由侧边栏的按钮重新提交）
+    """
+    runner = get_training_runner()
+    if runner is None:
+        return None
+    return runner.submit(TRAIN_STOCKS, window_size=20, forecast_horizon=5, use_multi_models=True)
+
+
+@st.cache_resource(show_spinner=False)
+def train_models_in_memory():
+    """
+    模型目录不可写时在内存中同步训练（带缓存，每个进程只训练一次）
+    """
+    st.warning("⚠️ 本地模型不存在且模型目录不可写，将在内存中训练新模型（首次可能较慢）")
     
     with st.spinner('🔧 正在训练模型，请稍候...'):
         best_model, all_models_data, feature_list = train_stock_prediction_model(
-            stock_codes=train_stocks,
+            stock_codes=TRAIN_STOCKS,
             window_size=20,
             forecast_horizon=5,
             use_multi_models=True
@@ -114,22 +197,310 @@ def load_or_train_models():
         st.error("❌ 模型训练失败")
         return None, None, None, None
     
-    # 创建模型信息
+    # 创建模型信息（指标来自训练时的测试集）
+    best_name = next(name for name, data in all_models_data.items() if data['model'] is best_model)
+    best_data = all_models_data[best_name]
     model_info = {
-        'model_name': 'Best Model',
+        'model_name': best_name,
         'train_date': datetime.now().strftime('%Y-%m-%d'),
-        'accuracy': 0.75,  # 示例值
-        'avg_precision': 0.70
+        'accuracy': best_data['accuracy'],
+        'avg_precision': best_data['avg_precision'],
+        'model_version': model_fingerprint(best_model, all_models_data, feature_list)
     }
     
+    _prepare_models(all_models_data, feature_list)
     st.success("✅ 模型训练完成！")
     
     return best_model, all_models_data, feature_list, model_info
 
 
+def load_or_train_models():
+    """
+    返回当前服务的模型 (model, all_models_data, feature_list, model_info)
+    
+    优先使用模型注册表当前服务的制品包版本，其次是旧的 .pkl 文件；
+    都不存在时提交后台训练任务并返回 (None, None, None, None)，训练完成后自动切换到新模型
+    """
+    # 1. 模型制品包（注册表在后台切换版本，每次调用读取当前服务的版本）
+    serving = get_model_registry().serving
+    if serving is not None:
+        get_feature_plan(serving.feature_list)
+        return serving.as_tuple()
+    
+    # 2. 旧格式 .pkl 文件
+    if os.path.exists(os.path.join(MODELS_DIR, 'trained_model.pkl')):
+        try:
+            return load_legacy_model_files()
+        except Exception as e:
+            print(f"[模型] 旧格式模型加载失败: {e}")
+    
+    # 3. 后台训练（不阻塞页面）；模型目录不可写时退回内存训练
+    if get_training_runner() is None:
+        return train_models_in_memory()
+    start_initial_training()
+    return None, None, None, None
+
+
+# ============================================================================
+# 跨会话共享缓存：行情数据、预测特征、预测结果
+# ============================================================================
+
+# st.cache_data 按参数缓存，进程内所有会话共享；键中包含交易时段标识（trading_epoch），
+# 交易时段内每5分钟、非交易时段每个收盘后才重新计算，TTL只用于回收旧条目
+DATA_CACHE_TTL = 6 * 3600
+DATA_CACHE_MAX_ENTRIES = 512
+
+
+class _NotCached(Exception):
+    """计算失败（返回None）时抛出，st.cache_data 不缓存异常，下次调用会重试"""
+
+
+@st.cache_resource(show_spinner=False)
+def _cache_counters():
+    """进程内所有会话共享的调用计数：calls 为调用次数，computes 为实际计算次数"""
+    return {'lock': threading.Lock(), 'counts': {}}
+
+
+def _record_cache_event(layer, event):
+    counters = _cache_counters()
+    with counters['lock']:
+        counts = counters['counts'].setdefault(layer, {'calls': 0, 'computes': 0})
+        counts[event] += 1
+
+
+@st.cache_data(ttl=DATA_CACHE_TTL, max_entries=DATA_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_stock_data(stock_code, days, epoch):
+    _record_cache_event('行情数据', 'computes')
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    stock_data = download_single_stock_data(stock_code, start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d'))
+    if stock_data is None:
+        raise _NotCached(stock_code)
+    return stock_data
+
+
+def cached_stock_data(stock_code, days, epoch=None):
+    """缓存的日线数据，下载失败时返回None（不缓存）"""
+    _record_cache_event('行情数据', 'calls')
+    try:
+        return _cached_stock_data(stock_code, days, epoch or trading_epoch())
+    except _NotCached:
+        return None
+
+
+@st.cache_data(ttl=DATA_CACHE_TTL, max_entries=DATA_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_prediction_features(stock_code, window_size, days, feature_list, epoch):
+    _record_cache_event('预测特征', 'computes')
+    stock_data = cached_stock_data(stock_code, days, epoch)
+    if stock_data is None:
+        raise _NotCached(stock_code)
+    features = extract_prediction_features({stock_code: stock_data}, [stock_code], list(feature_list),
+                                           window_size, get_feature_plan(list(feature_list)))
+    if features is None:
+        raise _NotCached(stock_code)
+    return features
+
+
+def cached_prediction_features(stock_code, window_size, days, feature_list, epoch=None):
+    """缓存的对齐后预测特征（单行DataFrame），数据不足时返回None"""
+    _record_cache_event('预测特征', 'calls')
+    try:
+        return _cached_prediction_features(stock_code, window_size, days, tuple(feature_list),
+                                           epoch or trading_epoch())
+    except _NotCached:
+        return None
+
+
+@st.cache_data(ttl=DATA_CACHE_TTL, max_entries=DATA_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_prediction(stock_code, window_size, days, use_multi_models, model_version, epoch,
+                       _model, _all_models_data, _feature_list):
+    # 以下划线开头的参数不参与缓存键，模型由 model_version 标识
+    _record_cache_event('预测结果', 'computes')
+    stock_data = cached_stock_data(stock_code, days, epoch)
+    if stock_data is None:
+        raise _NotCached(stock_code)
+    result = predict_single_stock_inline(
+        stock_code=stock_code,
+        model=_model,
+        all_models_data=_all_models_data if use_multi_models else None,
+        feature_list=_feature_list,
+        window_size=window_size,
+        days=days,
+        feature_plan=get_feature_plan(_feature_list),
+        prediction_cache=get_prediction_cache(),
+        model_version=model_version,
+        stock_data=stock_data,
+        features=cached_prediction_features(stock_code, window_size, days, _feature_list, epoch)
+    )
+    if result is None:
+        raise _NotCached(stock_code)
+    return result
+
+
+def cached_prediction(stock_code, window_size, days, use_multi_models, model, all_models_data,
+                      feature_list, model_info):
+    """缓存的预测结果，失败时返回None"""
+    _record_cache_event('预测结果', 'calls')
+    model_version = (model_info or {}).get('model_version') or model_fingerprint(model, all_models_data, feature_list)
+    try:
+        return _cached_prediction(stock_code, window_size, days, use_multi_models, model_version,
+                                  trading_epoch(), model, all_models_data, feature_list)
+    except _NotCached:
+        return None
+
+
+def clear_data_caches():
+    """清空行情、特征和预测结果缓存（模型缓存保留）"""
+    _cached_stock_data.clear()
+    _cached_prediction_features.clear()
+    _cached_prediction.clear()
+    cache = get_prediction_cache()
+    if cache is not None:
+        cache.clear()
+    counters = _cache_counters()
+    with counters['lock']:
+        counters['counts'].clear()
+
+
+# 兼容 requirements.txt 允许的旧版 Streamlit：st.rerun 需要 1.27+（之前为 experimental_rerun），
+# st.dataframe 的 hide_index 需要 1.23+
+_rerun = st.rerun if hasattr(st, 'rerun') else st.experimental_rerun
+_DATAFRAME_HIDE_INDEX = 'hide_index' in inspect.signature(st.dataframe).parameters
+
+
+def _sidebar_table(rows):
+    """侧边栏小表格（支持时隐藏索引列）"""
+    options = {'hide_index': True} if _DATAFRAME_HIDE_INDEX else {}
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, **options)
+
+
+def render_cache_stats():
+    """侧边栏：各层缓存的命中率"""
+    st.header("🗄️ 缓存统计")
+    counters = _cache_counters()
+    with counters['lock']:
+        counts = {layer: dict(value) for layer, value in counters['counts'].items()}
+    
+    rows = []
+    for layer, value in counts.items():
+        hits = value['calls'] - value['computes']
+        rows.append({'缓存': layer, '调用': value['calls'], '命中': hits,
+                     '命中率': f"{hits / value['calls']:.0%}" if value['calls'] else '-'})
+    
+    prediction_cache = get_prediction_cache()
+    if prediction_cache is not None:
+        stats = prediction_cache.stats()
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        rows.append({'缓存': '预测结果(按K线)', '调用': lookups, '命中': stats['hits'] + stats['disk_hits'],
+                     '命中率': f"{stats['hit_rate']:.0%}" if lookups else '-'})
+    
+    ohlcv_cache = get_ohlcv_cache()
+    if ohlcv_cache is not None:
+        stats = dict(ohlcv_cache.stats)
+        lookups = stats['hits'] + stats['misses'] + stats['delta_refreshes']
+        rows.append({'缓存': '本地行情', '调用': lookups, '命中': stats['hits'],
+                     '命中率': f"{stats['hits'] / lookups:.0%}" if lookups else '-'})
+    
+    if rows:
+        _sidebar_table(rows)
+    else:
+        st.caption("暂无缓存访问")
+    st.caption(f"行情时段: {trading_epoch()}")
+    
+    if st.button("清空数据缓存", use_container_width=True):
+        clear_data_caches()
+        _rerun()
+
+
+def render_training_status():
+    """侧边栏：后台训练任务的状态与进度"""
+    from utils.training_jobs import ACTIVE_STATUSES
+    
+    runner = get_training_runner()
+    if runner is None:
+        return
+    
+    st.header("🧠 模型训练")
+    job = runner.latest_job()
+    serving = get_model_registry().serving_version
+    
+    if job is None:
+        st.caption("暂无训练任务")
+    elif job['status'] in ACTIVE_STATUSES:
+        st.progress(job.get('progress') or 0.0,
+                    text=f"{job.get('stage_label') or ''} {job.get('message') or ''}".strip())
+        st.caption(f"任务 {job['job_id']} 提交于 {job['submitted_at']}")
+        if serving:
+            st.caption(f"训练完成前继续使用当前模型 {serving}")
+    elif job['status'] == 'succeeded':
+        st.caption(f"最近训练：{job['finished_at']} 完成，版本 {job['version']}")
+    else:
+        st.error(f"最近训练失败：{job.get('error') or '未知错误'}")
+    
+    # 新版本已生效但页面仍显示旧模型信息时整页刷新
+    if st.session_state.get('serving_model_version', serving) != serving:
+        st.session_state['serving_model_version'] = serving
+        _rerun()
+    st.session_state['serving_model_version'] = serving
+    
+    active = job is not None and job['status'] in ACTIVE_STATUSES
+    if st.button("后台重新训练", use_container_width=True, disabled=active):
+        runner.submit(TRAIN_STOCKS, window_size=20, forecast_horizon=5, use_multi_models=True)
+        _rerun()
+
+
+def render_model_versions():
+    """侧边栏：内存中各模型版本的留出样本指标与加载耗时，可回滚到上一个版本"""
+    registry = get_model_registry()
+    if registry.serving is None:
+        return
+    
+    st.header("🗂️ 模型版本")
+    comparison = registry.compare()
+    rows = []
+    for row in comparison.itertuples():
+        # 阈值在留出样本上确定的旧版本标记 *，其指标偏乐观
+        mark = '' if row.holdout_independent else '*'
+        rows.append({
+            '版本': row.version + (' ✅' if row.serving else ''),
+            '模型': row.best_model,
+            '准确率': f"{row.accuracy:.1%}{mark}" if pd.notna(row.accuracy) else '-',
+            '平均精确率': f"{row.avg_precision:.1%}{mark}" if pd.notna(row.avg_precision) else '-',
+            '加载(s)': f"{row.load_seconds:.2f}" if pd.notna(row.load_seconds) else '-',
+            '单行(ms)': f"{row.predict_ms_per_row:.3f}" if pd.notna(row.predict_ms_per_row) else '-',
+        })
+    _sidebar_table(rows)
+    st.caption("指标来自各版本的留出样本（阈值在训练期的验证集上确定）；新版本通过验证后自动切换")
+    if not comparison['holdout_independent'].all():
+        st.caption("* 旧版本的阈值在留出样本上确定，指标偏乐观")
+    
+    rejected = [r for r in registry.records() if r.get('status') == 'rejected']
+    if rejected:
+        st.caption(f"最近被拒绝：{rejected[0]['version']}（{rejected[0].get('reason')}）")
+    
+    previous = (registry.record(registry.serving_version) or {}).get('previous')
+    if previous and st.button(f"回滚到 {previous}", use_container_width=True):
+        try:
+            registry.rollback()
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            _rerun()
+
+
+# 训练进行中时定时刷新进度（只重新运行该片段，不影响页面其他部分）
+if hasattr(st, 'fragment'):
+    render_training_status_live = st.fragment(run_every=TRAINING_POLL_SECONDS)(render_training_status)
+else:
+    render_training_status_live = render_training_status
+
+
 def main():
     """主函数"""
     
+    # 后台预热预测依赖（与页面渲染并行）
+    start_dependency_warmup()
+    
     # 标题
     st.markdown('<p class="big-font">📊 股票预测系统</p>', unsafe_allow_html=True)
     st.markdown("---")
@@ -174,12 +545,30 @@ def main():
             if model_info:
                 st.info(f"**模型类型**: {model_info.get('model_name', 'Unknown')}")
                 st.info(f"**训练时间**: {model_info.get('train_date', 'Unknown')}")
-                st.info(f"**准确率**: {model_info.get('accuracy', 0):.2%}")
+                st.info(f"**准确率**: {model_info.get('accuracy') or 0:.2%}")
+                if model_info.get('load_seconds') is not None:
+                    version = model_info.get('bundle_version')
+                    st.caption(f"模型加载耗时 {model_info['load_seconds']:.2f}s"
+                               + (f"（制品包 {version}）" if version else ""))
+            else:
+                st.warning("模型训练中，完成后自动启用")
         except:
             st.warning("模型加载中...")
         
         st.markdown("---")
         
+        if PREDICTION_AVAILABLE:
+            runner = get_training_runner()
+            if runner is not None and runner.active_job() is not None:
+                render_training_status_live()
+            else:
+                render_training_status()
+            st.markdown("---")
+            render_model_versions()
+            st.markdown("---")
+            render_cache_stats()
+            st.markdown("---")
+        
         # 关于
         st.header("ℹ️ 关于")
         st.info("""
@@ -263,32 +652,38 @@ def predict_stock_streamlit(stock_code, use_multi_models, window_size, data_days
         model, all_models_data, feature_list, model_info = load_or_train_models()
         
         if model is None or feature_list is None:
-            st.error("❌ 模型加载失败")
+            progress_bar.empty()
+            status_text.empty()
+            runner = get_training_runner()
+            job = runner.active_job() if runner is not None else None
+            if job is not None:
+                st.info(f"⏳ 模型正在后台训练（{job.get('stage_label') or '排队中'}，"
+                        f"{(job.get('progress') or 0):.0%}），完成后即可预测，进度见侧边栏")
+            else:
+                st.error("❌ 模型加载失败")
             return
         
         # 2. 执行预测（使用统一模块的内联预测函数）
         status_text.text(f"📥 正在预测股票 {stock_code}...")
         progress_bar.progress(30)
         
-        # 使用统一模块的预测函数
-        if not EFINANCE_AVAILABLE:
-            st.error("❌ efinance不可用，无法下载数据")
-            st.info("💡 请检查网络连接或稍后重试")
-            return
+        # 使用统一模块的预测函数（efinance不可用时尝试使用本地行情缓存）
+        if not is_efinance_available():
+            st.warning("⚠️ efinance不可用，将使用本地缓存的行情数据")
         
-        result = predict_single_stock_inline(
-            stock_code=stock_code,
-            model=model,
-            all_models_data=all_models_data if use_multi_models else None,
-            feature_list=feature_list,
-            window_size=window_size,
-            days=data_days
+        # 行情、特征和预测结果在所有会话间共享缓存，同一交易时段内重复预测不再重新计算
+        result = cached_prediction(
+            stock_code, window_size, data_days, use_multi_models,
+            model, all_models_data, feature_list, model_info
         )
         
         progress_bar.progress(90)
         
         if result is None:
             st.error(f"❌ 无法预测股票 {stock_code}")
+            if not is_efinance_available():
+                st.info("💡 efinance不可用且本地无该股票的缓存数据，请检查网络连接或稍后重试")
+                return
             st.info("可能原因：")
             st.info("- 股票代码不存在或已退市")
             st.info("- 数据下载失败")
@@ -12,6 +12,372 @@ import math
 # 忽略警告
 warnings.filterwarnings("ignore")
 
+class ChipEngine:
+    """
+    基于NumPy价格网格的筹码分布引擎
+
+    每只股票维护一个按最小价位（minD）划分的定长价格网格数组，代替以价格为键的字典：
+    - 每日衰减与当日筹码沉积（三角分布 calcuSin / 均匀分布 calcuJUN）均为向量运算
+    - 获利盘比例（ProfitRatio）与成本分布（Cost90/Cost70等）通过累加和与 searchsorted 计算
+    - 默认只保存每日汇总序列，keep_snapshots=True 时才保存每日完整筹码分布
+
+    最高价等于最低价（如一字板）时当日全部成交量沉积在该价位上
+    """
+
+    def __init__(self, minD=0.01, flag=1, AC=1, percentiles=(90, 70), keep_snapshots=False,
+                 min_price=None, max_price=None):
+        self.minD = minD
+        self.flag = flag
+        self.AC = AC
+        self.percentiles = list(percentiles)
+        self.keep_snapshots = keep_snapshots
+
+        self.base_tick = 0
+        self.chips = np.zeros(0)
+        self.lo_tick = None  # 出现过筹码的最低/最高价位（含已衰减为0的价位）
+        self.hi_tick = None
+        self.dates = []
+        self.summary = {'ProfitRatio': []}
+        self.summary.update({f'Cost{N}': [] for N in self.percentiles})
+        self.snapshots = []
+
+        if min_price is not None and max_price is not None:
+            self._ensure_grid(self._tick(min_price), self._tick(max_price))
+
+    # ------------------------------------------------------------------
+    # 价格网格
+    # ------------------------------------------------------------------
+
+    def _tick(self, price):
+        return int(np.rint(round(price, 2) / self.minD))
+
+    def _ensure_grid(self, lo, hi, margin=64):
+        """保证网格覆盖 [lo, hi] 价位，不足时带余量扩展"""
+        if len(self.chips) and self.base_tick <= lo and hi < self.base_tick + len(self.chips):
+            return
+        if len(self.chips):
+            lo = min(lo, self.base_tick)
+            hi = max(hi, self.base_tick + len(self.chips) - 1)
+        new_base = max(0, lo - margin)
+        grown = np.zeros(hi + margin + 1 - new_base)
+        if len(self.chips):
+            offset = self.base_tick - new_base
+            grown[offset:offset + len(self.chips)] = self.chips
+        self.base_tick, self.chips = new_base, grown
+
+    def prices(self, lo=None, hi=None):
+        """网格价位（与旧实现字典键 round(price, 2) 一致）"""
+        lo = self.base_tick if lo is None else lo
+        hi = self.base_tick + len(self.chips) - 1 if hi is None else hi
+        return np.round(np.arange(lo, hi + 1) * self.minD, 2)
+
+    # ------------------------------------------------------------------
+    # 每日更新
+    # ------------------------------------------------------------------
+
+    def _deposit_batch(self, high, low, avg, vol):
+        """
+        向量化计算多个交易日的筹码沉积
+
+        返回:
+        (offsets, ticks, amounts)：第d天的价位与沉积量为 ticks[offsets[d]:offsets[d+1]]
+        """
+        minD = self.minD
+        high, low, avg, vol = (np.asarray(a, dtype=float) for a in (high, low, avg, vol))
+
+        with np.errstate(invalid='ignore'):
+            spans = (high - low) / minD
+        counts = np.where(np.isfinite(spans), spans, 0).astype(np.int64)
+        # 最高价等于最低价（或区间不足一个价位）时当日只有一个价位
+        single = counts <= 0
+        sizes = np.where(single, 1, counts)
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+
+        day = np.repeat(np.arange(len(sizes)), sizes)
+        step = np.arange(offsets[-1]) - offsets[day]
+        lowD, highD, avgD, volD = low[day], high[day], avg[day], vol[day]
+
+        x1 = np.round(lowD + step * minD, 2)
+        ticks = np.rint(x1 / minD).astype(np.int64)
+
+        if self.flag == 2:
+            amounts = volD / sizes[day]
+        else:
+            # 三角分布：以均价为顶点，对每个价位区间做梯形积分
+            x2 = x1 + minD
+            with np.errstate(divide='ignore', invalid='ignore'):
+                h = 2 / (highD - lowD)
+                left = x1 < avgD
+                y1 = np.where(left, h / (avgD - lowD) * (x1 - lowD), h / (highD - avgD) * (highD - x1))
+                y2 = np.where(left, h / (avgD - lowD) * (x2 - lowD), h / (highD - avgD) * (highD - x2))
+            amounts = minD * (y1 + y2) / 2
+            amounts = np.nan_to_num(amounts * volD, nan=0.0, posinf=0.0, neginf=0.0)
+
+        single_rows = single[day]
+        amounts = np.where(single_rows, volD, amounts)
+        return offsets, ticks, amounts
+
+    def _deposit(self, highT, lowT, avgT, volT):
+        """当日筹码沉积：返回 (价位数组, 沉积量数组)"""
+        _, ticks, amounts = self._deposit_batch([highT], [lowT], [avgT], [volT])
+        return ticks, amounts
+
+    def _dense_day(self, ticks, amounts):
+        """将当日沉积转为从最低价位开始的连续数组，返回 (最低价位, 数组)"""
+        los, dense_offsets, flat = self._dense_days(np.array([0, len(ticks)]), ticks, amounts)
+        return int(los[0]), flat
+
+    def _dense_days(self, offsets, ticks, amounts):
+        """
+        将多个交易日的沉积一次性转为连续数组
+
+        返回:
+        (los, dense_offsets, flat)：第d天从价位 los[d] 开始的沉积为 flat[dense_offsets[d]:dense_offsets[d+1]]
+        """
+        starts = offsets[:-1]
+        los = np.minimum.reduceat(ticks, starts)
+        his = np.maximum.reduceat(ticks, starts)
+        dense_offsets = np.concatenate(([0], np.cumsum(his - los + 1)))
+
+        day = np.repeat(np.arange(len(starts)), np.diff(offsets))
+        positions = dense_offsets[day] + ticks - los[day]
+        if self.flag == 2:
+            flat = np.bincount(positions, weights=amounts, minlength=dense_offsets[-1])
+        else:
+            # 与字典实现一致：同一价位重复出现时以最后一次为准
+            flat = np.zeros(dense_offsets[-1])
+            flat[positions] = amounts
+        return los, dense_offsets, flat
+
+    def _apply(self, lo, day, rate, close, dateT):
+        """衰减现有筹码并加入当日沉积，记录当日汇总指标"""
+        hi = lo + len(day) - 1
+        self._ensure_grid(lo, hi)
+
+        self.chips *= (1 - rate)
+        self.chips[lo - self.base_tick:hi - self.base_tick + 1] += day * rate
+
+        self.lo_tick = lo if self.lo_tick is None else min(self.lo_tick, lo)
+        self.hi_tick = hi if self.hi_tick is None else max(self.hi_tick, hi)
+
+        self.dates.append(dateT)
+        self.summary['ProfitRatio'].append(self.winner(close) if close is not None else np.nan)
+        for N, price in zip(self.percentiles, self.cost(self.percentiles)):
+            self.summary[f'Cost{N}'].append(price)
+        if self.keep_snapshots:
+            self.snapshots.append(self.to_dict())
+
+    def update(self, highT, lowT, avgT, volT, TurnoverRateT, close=None, dateT=None):
+        """
+        处理一个交易日
+
+        参数:
+        TurnoverRateT: 换手率（小数，与旧实现 calcu 一致）
+        close: 计算获利盘比例的价格（通常为收盘价），None时该日获利盘比例记为NaN
+        """
+        lo, day = self._dense_day(*self._deposit(highT, lowT, avgT, volT))
+        self._apply(lo, day, TurnoverRateT * self.AC, close, dateT)
+
+    # ------------------------------------------------------------------
+    # 指标
+    # ------------------------------------------------------------------
+
+    def _active(self):
+        """出现过筹码的价位区间 (价位数组, 筹码数组)"""
+        if self.lo_tick is None:
+            return np.zeros(0), np.zeros(0)
+        start = self.lo_tick - self.base_tick
+        return self.prices(self.lo_tick, self.hi_tick), self.chips[start:start + self.hi_tick - self.lo_tick + 1]
+
+    def winner(self, p):
+        """当前价格p下的获利盘比例（价格低于p的筹码占比）"""
+        prices, chips = self._active()
+        total = chips.sum()
+        if total == 0:
+            return 0
+        below = np.searchsorted(prices, p, side='left')
+        return chips[:below].sum() / total
+
+    def cost(self, N_list=(90,)):
+        """成本分布：累计筹码占比首次超过N%的价位，返回与N_list对应的价格列表"""
+        prices, chips = self._active()
+        total = chips.sum()
+        if len(prices) == 0 or total == 0:
+            return [np.nan] * len(N_list)
+        cum = np.cumsum(chips / total)
+        idx = np.searchsorted(cum, np.asarray(N_list, dtype=float) / 100, side='right')
+        return [prices[i] if i < len(prices) else prices[-1] for i in idx]
+
+    def to_dict(self):
+        """当前筹码分布转为 {价格: 筹码量}（与旧实现 Chip 字典相同的形式，只含非零价位）"""
+        prices, chips = self._active()
+        nonzero = chips != 0
+        return dict(zip(prices[nonzero].tolist(), chips[nonzero].tolist()))
+
+    # ------------------------------------------------------------------
+    # 批量计算
+    # ------------------------------------------------------------------
+
+    def run(self, df, p=None, max_block_cells=4_000_000):
+        """
+        按日期顺序计算整段数据
+
+        每天的筹码衰减与沉积仍逐日进行，但筹码分布按天分块存入 (天数, 价位数) 二维数组，
+        获利盘比例与成本分布对整块一次性用累加和计算，避免逐日调用 winner/cost
+
+        参数:
+        df: 包含 High, Low, Avg, Volume, TurnoverRate（百分比）, Close 列的DataFrame，可选 日期 列
+        p: 计算获利盘比例的固定价格，None时使用每日收盘价
+        max_block_cells: 每块二维数组的最大元素数（控制内存）
+
+        返回:
+        汇总指标DataFrame（ProfitRatio 与 Cost{N} 列，与输入行一一对应）
+        """
+        n_days = len(df)
+        high = df['High'].to_numpy(dtype=float)
+        low = df['Low'].to_numpy(dtype=float)
+        avg = df['Avg'].to_numpy(dtype=float)
+        vol = df['Volume'].to_numpy(dtype=float)
+        rate = df['TurnoverRate'].to_numpy(dtype=float) / 100 * self.AC
+        close = df['Close'].to_numpy(dtype=float) if p is None else np.full(n_days, p, dtype=float)
+        dates = df['日期'].tolist() if '日期' in df.columns else [None] * n_days
+        if n_days == 0:
+            return self.summary_frame(index=df.index)
+
+        offsets, ticks, amounts = self._deposit_batch(high, low, avg, vol)
+        los, dense_offsets, flat = self._dense_days(offsets, ticks, amounts)
+        self._ensure_grid(int(ticks.min()), int(ticks.max()))
+        prices = self.prices()
+        block_days = max(1, min(n_days, max_block_cells // len(self.chips)))
+
+        for start in range(0, n_days, block_days):
+            stop = min(start + block_days, n_days)
+            block = np.empty((stop - start, len(self.chips)))
+            hi_ticks = np.empty(stop - start, dtype=np.int64)
+
+            for i in range(start, stop):
+                lo, day = int(los[i]), flat[dense_offsets[i]:dense_offsets[i + 1]]
+                self.chips *= (1 - rate[i])
+                self.chips[lo - self.base_tick:lo - self.base_tick + len(day)] += day * rate[i]
+
+                hi = lo + len(day) - 1
+                self.lo_tick = lo if self.lo_tick is None else min(self.lo_tick, lo)
+                self.hi_tick = hi if self.hi_tick is None else max(self.hi_tick, hi)
+                block[i - start] = self.chips
+                hi_ticks[i - start] = self.hi_tick
+
+            self._summarize_block(block, hi_ticks, close[start:stop], prices)
+            self.dates.extend(dates[start:stop])
+            if self.keep_snapshots:
+                lo_idx = self.lo_tick - self.base_tick
+                for row, hi_tick in zip(block, hi_ticks):
+                    chips = row[lo_idx:hi_tick - self.base_tick + 1]
+                    nonzero = chips != 0
+                    self.snapshots.append(dict(zip(prices[lo_idx:lo_idx + len(chips)][nonzero].tolist(),
+                                                   chips[nonzero].tolist())))
+
+        return self.summary_frame(index=df.index)
+
+    def _summarize_block(self, block, hi_ticks, close, prices):
+        """对一块每日筹码分布 (天数, 价位数) 计算获利盘比例与成本分布并追加到汇总序列"""
+        n = len(block)
+        rows = np.arange(n)
+        total = block.sum(axis=1)
+        has_chips = total != 0
+
+        cum = np.cumsum(block, axis=1)
+        below = np.searchsorted(prices, close, side='left')
+        below_sum = np.where(below > 0, cum[rows, np.maximum(below - 1, 0)], 0.0)
+        profit = np.divide(below_sum, total, out=np.zeros(n), where=has_chips)
+        self.summary['ProfitRatio'].extend(np.where(np.isnan(close), np.nan, profit).tolist())
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            norm_cum = np.cumsum(block / total[:, None], axis=1)
+        last_price = prices[hi_ticks - self.base_tick]
+        for N in self.percentiles:
+            # 累计占比首次超过N%的价位；不超过时取出现过筹码的最高价位
+            idx = (norm_cum <= N / 100).sum(axis=1)
+            cost = np.where(idx < len(prices), prices[np.minimum(idx, len(prices) - 1)], last_price)
+            self.summary[f'Cost{N}'].extend(np.where(has_chips, cost, np.nan).tolist())
+
+    def rolling_winner(self, df, N=5, p=None):
+        """
+        滑动窗口获利盘比例（与 ChipDistribution.lwinner 语义一致，增量计算）
+
+        第i天的结果只使用前N天 [i-N, i) 的筹码（从空筹码开始计算），价格为第i-1天收盘价或固定价格p。
+        窗口筹码增量维护：每天先衰减再加入当日沉积，同时减去移出窗口那一天的沉积乘以其后N天的衰减乘积，
+        每天的工作量与窗口长度和当日价位数成正比，与历史长度无关
+
+        返回:
+        长度与df相同的列表，前N个为None
+        """
+        n_days = len(df)
+        result = [None] * n_days
+        if n_days <= N:
+            return result
+
+        high = df['High'].to_numpy(dtype=float)
+        low = df['Low'].to_numpy(dtype=float)
+        avg = df['Avg'].to_numpy(dtype=float)
+        vol = df['Volume'].to_numpy(dtype=float)
+        rate = df['TurnoverRate'].to_numpy(dtype=float) / 100 * self.AC
+        price = df['Close'].to_numpy(dtype=float) if p is None else np.full(n_days, p, dtype=float)
+
+        offsets, ticks, amounts = self._deposit_batch(high[:-1], low[:-1], avg[:-1], vol[:-1])
+        los, dense_offsets, flat = self._dense_days(offsets, ticks, amounts)
+
+        base = int(ticks.min())
+        window = np.zeros(int(ticks.max()) - base + 1)
+        prices = self.prices(base, base + len(window) - 1)
+        below_all = np.searchsorted(prices, price, side='left')
+
+        # 窗口 [j-N+1, j] 内各日沉积覆盖的价位区间（区间外的窗口筹码恒为0）
+        from numpy.lib.stride_tricks import sliding_window_view
+        day_lo = los - base
+        day_hi = day_lo + np.diff(dense_offsets)
+        pad = N - 1
+        win_lo = sliding_window_view(np.concatenate((np.full(pad, day_lo[0]), day_lo)), N).min(axis=1)
+        win_hi = sliding_window_view(np.concatenate((np.full(pad, day_hi[0]), day_hi)), N).max(axis=1)
+        # decay[j]: 第 j-N 天的沉积在之后N天 (j-N, j] 的累计衰减
+        decay = np.ones(n_days - 1)
+        if n_days - 1 > N:
+            decay[N:] = sliding_window_view(1 - rate[1:n_days - 1], N).prod(axis=1)
+        deposits = flat * np.repeat(rate[:n_days - 1], np.diff(dense_offsets))
+
+        for j in range(n_days - 1):
+            lo = day_lo[j]
+            day = deposits[dense_offsets[j]:dense_offsets[j + 1]]
+            # 衰减作用于前一窗口的区间，新沉积加在当日区间
+            prev_lo, prev_hi = (win_lo[j - 1], win_hi[j - 1]) if j > 0 else (lo, lo)
+            window[prev_lo:prev_hi] *= (1 - rate[j])
+            window[lo:lo + len(day)] += day
+
+            if j >= N:
+                # 移出窗口的第 j-N 天：其沉积已被之后N天各衰减一次
+                old_lo = day_lo[j - N]
+                old_day = deposits[dense_offsets[j - N]:dense_offsets[j - N + 1]]
+                window[old_lo:old_lo + len(old_day)] -= old_day * decay[j]
+                # 已不被窗口内任何沉积覆盖的价位直接置0，避免浮点残差累积
+                window[prev_lo:win_lo[j]] = 0
+                window[win_hi[j]:prev_hi] = 0
+
+            if j + 1 >= N:
+                active = np.maximum(window[win_lo[j]:win_hi[j]], 0)
+                total = active.sum()
+                if total != 0:
+                    result[j + 1] = active[:max(below_all[j] - win_lo[j], 0)].sum() / total
+                else:
+                    result[j + 1] = 0
+
+        return result
+
+    def summary_frame(self, index=None):
+        frame = pd.DataFrame(self.summary)
+        if index is not None and len(index) == len(frame):
+            frame.index = index
+        return frame
+
+
 class ChipDistribution():
     def __init__(self):
         self.Chip = {}  # 当前获利盘
@@ -137,17 +503,32 @@ class ChipDistribution():
                 Profit.append(bili)
         return Profit
         
+    def rolling_winner(self, N=5, p=None, flag=1, AC=1):
+        """
+        计算滑动窗口获利盘比例（增量版本，结果与 lwinner 的第一个返回值一致）
+
+        参数:
+        N: 窗口天数
+        p: 固定价格，None时使用前一日收盘价
+        flag, AC: 筹码计算方式与衰减系数（同 calcuChip）
+
+        返回:
+        与数据等长的列表，前N个为None
+        """
+        return ChipEngine(flag=flag, AC=AC).rolling_winner(self.data, N=N, p=p)
+
     def lwinner(self, N=5, p=None):
-        """计算滑动窗口获利盘比例"""
-        data = copy.deepcopy(self.data)
+        """计算滑动窗口获利盘比例（逐窗口重建筹码，返回原始结果和详细结果；只需比例时使用 rolling_winner）"""
+        data = self.data
         date = data['日期']
         # 扩展结果列表，存储更多信息
         ans = []  # 原始的结果列表
         detailed_results = []  # 扩展的结果列表，包含更多信息
-        total_dates = len(date)       
+        total_dates = len(date)
+        progress_step = max(1, total_dates // 10)
         for i in range(total_dates):
             # 只打印进度信息，每10%显示一次
-            if i % (total_dates // 10) == 0:
+            if i % progress_step == 0:
                 print(f"处理进度: {i/total_dates*100:.1f}% - 当前日期: {date[i]}")                
             if i < N:
                 ans.append(None)
@@ -234,19 +615,15 @@ class ChipDistribution():
         # 设置数据源
         self.get_data(df)
         
-        # 计算筹码分布
-        self.calcuChip(flag=1, AC=1)
+        # 使用NumPy引擎计算筹码分布，只保留获利盘比例和成本分布（90%和70%）的汇总序列
+        self.engine = ChipEngine(flag=1, AC=1, percentiles=(90, 70))
+        summary = self.engine.run(self.data)
+        profit_ratios = summary['ProfitRatio'].tolist()
+        cost_90 = summary['Cost90'].tolist()
+        cost_70 = summary['Cost70'].tolist()
         
-        # 计算获利盘比例
-        profit_ratios = self.winner()
-        
-        # 计算多个成本分布
-        cost_results = self.cost([90, 70])  # 计算90%和70%的成本集中度
-        cost_90 = cost_results[90]
-        cost_70 = cost_results[70]
-        
-        # 计算滑动窗口获利盘比例
-        lwinner_ratios, detailed_results = self.lwinner(N=5)
+        # 计算滑动窗口获利盘比例（增量维护窗口筹码）
+        lwinner_ratios = self.rolling_winner(N=5)
         
         # 创建一个新的DataFrame来存储所有指标
         indicators_df = pd.DataFrame()
@@ -290,3 +667,154 @@ class ChipDistribution():
         result_df = pd.merge(original_df.reset_index(), indicators_df, on='日期', how='left')
         
         return result_df
+
+
+# ============================================================================
+# 无状态批量接口
+# ============================================================================
+
+CHIP_INPUT_COLUMNS = ['High', 'Low', 'Avg', 'Volume', 'TurnoverRate', 'Close']
+
+
+def chip_indicator_columns(percentiles=(90, 70)):
+    return ['ProfitRatio'] + [f'Cost{N}' for N in percentiles] + ['LWinnerRatio']
+
+
+def compute_chip_indicators(df, flag=1, AC=1, percentiles=(90, 70), N=5):
+    """
+    计算单只股票的筹码指标（无状态，可在多进程中安全调用）
+
+    参数:
+    df: 包含 High, Low, Avg, Volume, TurnoverRate（百分比）, Close 列的DataFrame，按日期升序
+    N: 滑动窗口获利盘比例的窗口天数
+
+    返回:
+    与df同索引的DataFrame，列为 ProfitRatio, Cost{N}..., LWinnerRatio
+    """
+    summary = ChipEngine(flag=flag, AC=AC, percentiles=percentiles).run(df)
+    lwinner = ChipEngine(flag=flag, AC=AC).rolling_winner(df, N=N)
+    summary['LWinnerRatio'] = np.array([np.nan if v is None else v for v in lwinner], dtype=float)
+    summary.index = df.index
+    return summary
+
+
+def _chip_block_indicators(block, flag, AC, percentiles, N):
+    """对一只股票的 (天数, 6) 输入块计算指标，缺失行（High为NaN）跳过并在结果中保持NaN"""
+    n_out = len(chip_indicator_columns(percentiles))
+    out = np.full((len(block), n_out), np.nan)
+    valid = ~np.isnan(block[:, 0])
+    if valid.sum() == 0:
+        return out
+    df = pd.DataFrame(block[valid], columns=CHIP_INPUT_COLUMNS)
+    out[valid] = compute_chip_indicators(df, flag, AC, percentiles, N).to_numpy(dtype=float)
+    return out
+
+
+def _chip_shard_worker(task):
+    """工作进程：从共享内存读取若干只股票的输入块，把指标直接写入共享输出缓冲区"""
+    from multiprocessing import shared_memory
+
+    in_name, out_name, n_rows, n_out, offsets, flag, AC, percentiles, N = task
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        values = np.ndarray((n_rows, len(CHIP_INPUT_COLUMNS)), dtype=np.float64, buffer=shm_in.buf)
+        results = np.ndarray((n_rows, n_out), dtype=np.float64, buffer=shm_out.buf)
+        for start, stop in offsets:
+            results[start:stop] = _chip_block_indicators(values[start:stop], flag, AC, percentiles, N)
+    finally:
+        shm_in.close()
+        shm_out.close()
+    return len(offsets)
+
+
+def _panel_to_blocks(panel):
+    """
+    将面板数据转为连续数组
+
+    panel 可以是 {股票代码: DataFrame}，或以 (股票代码, 日期) 为MultiIndex的DataFrame
+
+    返回:
+    (values, offsets, index)：values 为所有股票按行拼接的 (总行数, 6) 数组，
+    第k只股票的行为 values[offsets[k]:offsets[k+1]]，index 为对应的 (股票代码, 日期) MultiIndex
+    """
+    if isinstance(panel, dict):
+        frames = list(panel.values())
+        keys = list(panel.keys())
+        index = pd.MultiIndex.from_arrays([
+            np.repeat(np.array(keys, dtype=object), [len(df) for df in frames]),
+            np.concatenate([np.asarray(df.index) for df in frames]) if frames else [],
+        ], names=['stock_code', 'date'])
+        sizes = [len(df) for df in frames]
+        values = (np.concatenate([df.reindex(columns=CHIP_INPUT_COLUMNS).to_numpy(dtype=np.float64)
+                                  for df in frames]) if frames else np.empty((0, len(CHIP_INPUT_COLUMNS))))
+    else:
+        panel = panel.sort_index(level=[0, 1], sort_remaining=False)
+        index = panel.index
+        codes = index.get_level_values(0)
+        _, sizes = np.unique(pd.factorize(codes, sort=False)[0], return_counts=True)
+        values = panel.reindex(columns=CHIP_INPUT_COLUMNS).to_numpy(dtype=np.float64)
+
+    offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    return np.ascontiguousarray(values), offsets, index
+
+
+def batch_chip_indicators(panel, n_workers=None, flag=1, AC=1, percentiles=(90, 70), N=5,
+                          stocks_per_task=None):
+    """
+    全市场批量计算筹码指标（无状态，多进程）
+
+    所有股票的输入按行拼接后放入共享内存，按股票分片交给进程池，
+    工作进程把结果直接写入共享输出缓冲区，避免逐只股票序列化DataFrame
+
+    参数:
+    panel: {股票代码: DataFrame}，或以 (股票代码, 日期) 为MultiIndex的DataFrame，
+           需包含 High, Low, Avg, Volume, TurnoverRate（百分比）, Close 列
+    n_workers: 进程数，默认CPU核数；为1时在当前进程内计算
+    stocks_per_task: 每个分片的股票数，默认按进程数自动划分
+
+    返回:
+    以 (stock_code, date) 为MultiIndex的DataFrame，列为 ProfitRatio, Cost{N}..., LWinnerRatio
+    """
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    columns = chip_indicator_columns(percentiles)
+    values, offsets, index = _panel_to_blocks(panel)
+    n_rows, n_stocks = len(values), len(offsets) - 1
+    n_workers = max(1, min(n_workers or mp.cpu_count(), max(n_stocks, 1)))
+
+    if n_workers == 1 or n_stocks <= 1:
+        results = np.full((n_rows, len(columns)), np.nan)
+        for k in range(n_stocks):
+            start, stop = offsets[k], offsets[k + 1]
+            results[start:stop] = _chip_block_indicators(values[start:stop], flag, AC, percentiles, N)
+        return pd.DataFrame(results, index=index, columns=columns)
+
+    stocks_per_task = stocks_per_task or max(1, n_stocks // (4 * n_workers))
+    spans = [(int(offsets[k]), int(offsets[k + 1])) for k in range(n_stocks)]
+    shards = [spans[i:i + stocks_per_task] for i in range(0, n_stocks, stocks_per_task)]
+
+    shm_in = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    shm_out = shared_memory.SharedMemory(create=True, size=max(n_rows * len(columns) * 8, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm_in.buf)[:] = values
+        output = np.ndarray((n_rows, len(columns)), dtype=np.float64, buffer=shm_out.buf)
+        output[:] = np.nan
+
+        tasks = [(shm_in.name, shm_out.name, n_rows, len(columns), shard, flag, AC, tuple(percentiles), N)
+                 for shard in shards]
+        print(f"[筹码] {n_stocks} 只股票, {len(tasks)} 个分片, {n_workers} 个进程")
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(_chip_shard_worker, tasks))
+
+        results = output.copy()
+        del output
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+
+    return pd.DataFrame(results, index=index, columns=columns)
@@ -0,0 +1,463 @@
+# utils/columnar_store.py
+"""
+列式数据存储
+
+将宽表（每只股票约120列的日线、processed_features等）保存为 Parquet / Feather，
+或每列一个内存映射的 .npy 文件，并附带 JSON schema：
+
+- 读取时支持列投影（只读取需要的列，例如TSFresh的9个基础列）
+- 写入时可将 float64 降为 float32，减少磁盘与内存占用
+- 每次写入生成一个新的数据文件，最后原子替换指向它的schema，读者不会看到半写状态，
+  也不会把新schema与旧数据配对；多个线程/进程同时写入同一数据集时互不干扰
+
+命令行迁移现有CSV：
+    python -m utils.columnar_store data --out data/columnar --format parquet
+"""
+import os
+import re
+import json
+import glob
+import uuid
+import shutil
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+SUPPORTED_FORMATS = ('parquet', 'feather', 'npy')
+SCHEMA_VERSION = 1
+INDEX_FILE = '__index__.npy'
+# 未被schema引用的数据文件超过此时间（秒）才清理（写入中断遗留的文件；正在写入的文件不会这么旧）
+ORPHAN_SECONDS = 3600
+# 读取时数据文件被并发写入替换后的重试次数
+READ_RETRIES = 5
+
+
+def _pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def default_format():
+    """有pyarrow时使用Parquet，否则使用内存映射的.npy"""
+    return 'parquet' if _pyarrow_available() else 'npy'
+
+
+def downcast_float32(df):
+    """将float64列降为float32（其余列保持不变）"""
+    float_cols = df.select_dtypes(include=['float64']).columns
+    if len(float_cols) == 0:
+        return df
+    return df.astype({col: np.float32 for col in float_cols})
+
+
+class ColumnarStore:
+    """
+    以名称为键的列式数据存储目录
+
+    每个数据集由一个数据文件（{name}.{版本}.parquet/.feather）或一个目录（npy，每列一个.npy）
+    加上一个 {name}.schema.json 组成；schema 记录数据文件名、格式、列名与dtype、索引和自定义元数据，
+    替换schema即提交一次写入
+    """
+
+    def __init__(self, root, fmt=None):
+        fmt = fmt or default_format()
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f"不支持的存储格式: {fmt}，可选 {SUPPORTED_FORMATS}")
+        if fmt in ('parquet', 'feather') and not _pyarrow_available():
+            raise ImportError(f"{fmt} 格式需要安装 pyarrow")
+
+        self.root = root
+        self.fmt = fmt
+        os.makedirs(root, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 路径与schema
+    # ------------------------------------------------------------------
+
+    def _schema_path(self, name):
+        return os.path.join(self.root, f"{name}.schema.json")
+
+    def _data_path(self, name, fmt):
+        """旧版本（没有版本号）的数据文件路径"""
+        return os.path.join(self.root, f"{name}.{fmt}")
+
+    def _schema_data_path(self, name, schema):
+        data_file = schema.get('data_file')
+        if data_file:
+            return os.path.join(self.root, data_file)
+        return self._data_path(name, schema['format'])
+
+    def _data_files(self, name):
+        """数据集的所有数据文件（含旧版本与写入中断遗留的文件）"""
+        pattern = re.compile(re.escape(name) + r'(\.[0-9a-f]{12})?\.(' + '|'.join(SUPPORTED_FORMATS) + ')')
+        return [f for f in os.listdir(self.root) if pattern.fullmatch(f)]
+
+    def schema(self, name):
+        """返回数据集的schema字典，不存在时返回None"""
+        try:
+            with open(self._schema_path(name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def exists(self, name):
+        schema = self.schema(name)
+        return schema is not None and os.path.exists(self._schema_data_path(name, schema))
+
+    def names(self):
+        """列出存储中的所有数据集名称"""
+        suffix = '.schema.json'
+        return sorted(f[:-len(suffix)] for f in os.listdir(self.root) if f.endswith(suffix))
+
+    def columns(self, name):
+        schema = self.schema(name)
+        return [c['name'] for c in schema['columns']] if schema else []
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def write(self, name, df, float32=False, metadata=None):
+        """
+        写入DataFrame
+
+        参数:
+        name: 数据集名称
+        df: 要写入的DataFrame（索引会一并保存）
+        float32: 是否将float64列降为float32
+        metadata: 写入schema的自定义元数据（需可JSON序列化）
+
+        返回:
+        schema字典
+        """
+        if float32:
+            df = downcast_float32(df)
+        df = df.copy(deep=False)
+        df.columns = [str(c) for c in df.columns]
+
+        # 新数据写入唯一的文件名，提交前没有读者会引用它
+        data_file = f"{name}.{uuid.uuid4().hex[:12]}.{self.fmt}"
+        data_path = os.path.join(self.root, data_file)
+        try:
+            if self.fmt == 'parquet':
+                df.to_parquet(data_path)
+            elif self.fmt == 'feather':
+                # Feather不保存非默认索引，写入前将索引转为普通列
+                df.rename_axis(INDEX_FILE).reset_index().to_feather(data_path)
+            else:
+                self._write_npy(data_path, df)
+        except Exception:
+            self._remove_path(data_path)
+            raise
+
+        schema = {
+            'version': SCHEMA_VERSION,
+            'name': name,
+            'format': self.fmt,
+            'data_file': data_file,
+            'rows': int(len(df)),
+            'index': {'name': df.index.name, 'dtype': str(df.index.dtype)},
+            'columns': [{'name': c, 'dtype': str(t)} for c, t in df.dtypes.items()],
+            'metadata': metadata or {},
+        }
+        previous = self.schema(name)
+        fd, tmp_schema = tempfile.mkstemp(dir=self.root, prefix=f".{name}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(schema, f, ensure_ascii=False, indent=1)
+            os.chmod(tmp_schema, 0o644)
+            # 提交：schema 与其引用的数据文件一起生效
+            os.replace(tmp_schema, self._schema_path(name))
+        except Exception:
+            self._remove_path(tmp_schema)
+            self._remove_path(data_path)
+            raise
+
+        # 删除被替换的数据文件；其他未被引用的文件（并发写入被覆盖、写入中断）过期后再清理，
+        # 避免删除其他写入者尚未提交的文件
+        if previous is not None:
+            old_path = self._schema_data_path(name, previous)
+            if old_path != data_path:
+                self._remove_path(old_path)
+        current = self._schema_data_path(name, schema)
+        now = time.time()
+        for f in self._data_files(name):
+            path = os.path.join(self.root, f)
+            try:
+                stale = now - os.path.getmtime(path) > ORPHAN_SECONDS
+            except OSError:
+                continue
+            if path != current and (stale or f == f"{name}.{self.fmt}" or not f.endswith(self.fmt)):
+                self._remove_path(path)
+
+        return schema
+
+    @staticmethod
+    def _write_npy(path, df):
+        os.makedirs(path)
+        np.save(os.path.join(path, INDEX_FILE), _to_npy_array(df.index))
+        for i, col in enumerate(df.columns):
+            np.save(os.path.join(path, f"{i}.npy"), _to_npy_array(df[col]))
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def read(self, name, columns=None, start=None, end=None, mmap=True):
+        """
+        读取数据集
+
+        参数:
+        name: 数据集名称
+        columns: 只读取的列（列投影），None表示全部；不存在的列会被忽略
+        start, end: 索引为日期时按区间截取（闭区间）
+        mmap: npy格式是否以内存映射方式读取
+
+        返回:
+        DataFrame，不存在时返回None
+        """
+        return self.read_with_schema(name, columns, start, end, mmap)[0]
+
+    def read_with_schema(self, name, columns=None, start=None, end=None, mmap=True):
+        """
+        读取数据集及其schema（两者来自同一次写入，元数据与数据一致）
+
+        返回:
+        (DataFrame, schema)，不存在时返回 (None, None)
+        """
+        # 读取期间数据集可能被替换、旧数据文件被清理：重新读取schema后重试
+        for attempt in range(READ_RETRIES):
+            schema = self.schema(name)
+            if schema is None:
+                return None, None
+            try:
+                return self._read(name, schema, columns, start, end, mmap), schema
+            except FileNotFoundError:
+                if attempt == READ_RETRIES - 1:
+                    raise
+
+    def _read(self, name, schema, columns, start, end, mmap):
+        all_columns = [c['name'] for c in schema['columns']]
+        if columns is None:
+            selected = all_columns
+        else:
+            available = set(all_columns)
+            selected = [c for c in columns if c in available]
+
+        fmt = schema['format']
+        path = self._schema_data_path(name, schema)
+        if fmt == 'parquet':
+            df = pd.read_parquet(path, columns=selected)
+        elif fmt == 'feather':
+            df = pd.read_feather(path, columns=[INDEX_FILE] + selected).set_index(INDEX_FILE)
+            df.index.name = schema['index']['name']
+        else:
+            return self._read_npy(path, schema, all_columns, selected, start, end, mmap)
+
+        return _slice_index(df, start, end)
+
+    @staticmethod
+    def _read_npy(path, schema, all_columns, selected, start, end, mmap):
+        mode = 'r' if mmap else None
+        index_values = np.load(os.path.join(path, INDEX_FILE), mmap_mode=mode)
+
+        # 先在（已排序的）日期索引上定位区间，只物化需要的行
+        lo, hi = 0, len(index_values)
+        if np.issubdtype(index_values.dtype, np.datetime64) and (start is not None or end is not None):
+            if start is not None:
+                lo = int(np.searchsorted(index_values, np.datetime64(pd.Timestamp(start)), side='left'))
+            if end is not None:
+                hi = int(np.searchsorted(index_values, np.datetime64(pd.Timestamp(end)), side='right'))
+
+        positions = {c: i for i, c in enumerate(all_columns)}
+        dtypes = {c['name']: c['dtype'] for c in schema['columns']}
+        data = {}
+        for col in selected:
+            values = np.load(os.path.join(path, f"{positions[col]}.npy"), mmap_mode=mode)[lo:hi]
+            data[col] = _from_npy_array(values, dtypes[col])
+
+        index = pd.Index(_from_npy_array(index_values[lo:hi], schema['index']['dtype']),
+                         name=schema['index']['name'])
+        return pd.DataFrame(data, index=index, columns=selected)
+
+    # ------------------------------------------------------------------
+    # 删除
+    # ------------------------------------------------------------------
+
+    def remove(self, name):
+        """删除数据集及其schema（先删除schema，读者不会看到没有数据的schema）"""
+        self._remove_path(self._schema_path(name))
+        for f in self._data_files(name):
+            self._remove_path(os.path.join(self.root, f))
+
+    @staticmethod
+    def _remove_path(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def _to_npy_array(values):
+    """转换为可内存映射的数组：对象/字符串列转为定长Unicode"""
+    arr = np.asarray(values)
+    if arr.dtype == object:
+        arr = np.asarray(pd.Series(values).astype(str).to_numpy(), dtype=str)
+    return arr
+
+
+def _from_npy_array(values, dtype):
+    if dtype in ('object', 'str', 'string'):
+        return np.asarray(values).astype(object)
+    return values
+
+
+def _slice_index(df, start, end):
+    if (start is None and end is None) or not isinstance(df.index, pd.DatetimeIndex):
+        return df
+    return df.loc[start:end]
+
+
+# ============================================================================
+# 仓库数据文件的读取与迁移
+# ============================================================================
+
+def default_store_dir(data_dir='data'):
+    return os.path.join(data_dir, 'columnar')
+
+
+def read_stock_csv(path, columns=None):
+    """读取 data/stock_*_data.csv（Date为索引，股票代码保留前导零），支持列投影"""
+    usecols = None if columns is None else (lambda c: c == 'Date' or c in set(columns))
+    return pd.read_csv(path, usecols=usecols, dtype={'股票代码': str},
+                       parse_dates=['Date'], index_col='Date')
+
+
+def load_stock_frame(stock_code, data_dir='data', columns=None, store=None):
+    """
+    读取单只股票的本地日线：优先列式存储，不存在时回退到CSV
+
+    返回:
+    DataFrame 或 None
+    """
+    name = f"stock_{stock_code}"
+    if store is None and os.path.isdir(default_store_dir(data_dir)):
+        store = ColumnarStore(default_store_dir(data_dir), fmt=default_format())
+    if store is not None and store.exists(name):
+        return store.read(name, columns=columns)
+
+    csv_path = os.path.join(data_dir, f"{name}_data.csv")
+    if os.path.exists(csv_path):
+        return read_stock_csv(csv_path, columns)
+    return None
+
+
+def load_processed_features(data_dir='data', columns=None, store=None):
+    """
+    读取 processed_features / processed_targets：优先列式存储，其次pickle，最后CSV
+
+    返回:
+    (X, y)，不存在时返回 (None, None)
+    """
+    if store is None and os.path.isdir(default_store_dir(data_dir)):
+        store = ColumnarStore(default_store_dir(data_dir), fmt=default_format())
+    if store is not None and store.exists('processed_features'):
+        X = store.read('processed_features', columns=columns)
+        y = store.read('processed_targets')
+        return X, (y['target'] if y is not None else None)
+
+    X, y = _read_processed_legacy(data_dir)
+    if X is not None and columns is not None:
+        X = X[[c for c in columns if c in X.columns]]
+    return X, y
+
+
+def _read_processed_legacy(data_dir):
+    pkl_path = os.path.join(data_dir, 'processed_features.pkl')
+    if os.path.exists(pkl_path):
+        data = pd.read_pickle(pkl_path)
+        return data['X'], data['y']
+
+    csv_path = os.path.join(data_dir, 'processed_features.csv')
+    if not os.path.exists(csv_path):
+        return None, None
+    X = pd.read_csv(csv_path, dtype={'id': str}, index_col='id')
+    targets_path = os.path.join(data_dir, 'processed_targets.csv')
+    y = None
+    if os.path.exists(targets_path):
+        y = pd.read_csv(targets_path, dtype={'id': str}, index_col='id')['target']
+    return X, y
+
+
+def migrate_data_dir(data_dir='data', out_dir=None, fmt=None, float32=True, verbose=True):
+    """
+    一次性将 data/ 下的CSV/pickle迁移到列式存储
+
+    - stock_*_data.csv -> stock_{code}
+    - processed_features.pkl（或.csv）-> processed_features
+    - processed_targets -> processed_targets
+
+    返回:
+    迁移的数据集名称列表
+    """
+    store = ColumnarStore(out_dir or default_store_dir(data_dir), fmt=fmt)
+    migrated = []
+
+    def _report(name, src, schema):
+        if verbose:
+            src_size = os.path.getsize(src) / 1024
+            print(f"[迁移] {os.path.basename(src)} -> {name}.{schema['format']} "
+                  f"({schema['rows']}行 x {len(schema['columns'])}列, 原文件 {src_size:.0f}KB)")
+
+    for csv_path in sorted(glob.glob(os.path.join(data_dir, 'stock_*_data.csv'))):
+        code = os.path.basename(csv_path)[len('stock_'):-len('_data.csv')]
+        df = read_stock_csv(csv_path)
+        name = f"stock_{code}"
+        schema = store.write(name, df, float32=float32,
+                             metadata={'source': os.path.basename(csv_path), 'stock_code': code})
+        _report(name, csv_path, schema)
+        migrated.append(name)
+
+    X, y = _read_processed_legacy(data_dir)
+    if X is not None:
+        src = os.path.join(data_dir, 'processed_features.pkl')
+        if not os.path.exists(src):
+            src = os.path.join(data_dir, 'processed_features.csv')
+        X.index = X.index.astype(str)
+        schema = store.write('processed_features', X, float32=float32,
+                             metadata={'source': os.path.basename(src)})
+        _report('processed_features', src, schema)
+        migrated.append('processed_features')
+
+        if y is not None:
+            y.index = y.index.astype(str)
+            schema = store.write('processed_targets', y.rename('target').to_frame(),
+                                 metadata={'source': os.path.basename(src)})
+            migrated.append('processed_targets')
+
+    if verbose:
+        print(f"[完成] 共迁移 {len(migrated)} 个数据集到 {store.root}")
+    return migrated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="将data/目录下的CSV迁移为列式存储")
+    parser.add_argument('data_dir', nargs='?', default='data', help="数据目录（默认 data）")
+    parser.add_argument('--out', default=None, help="输出目录（默认 <data_dir>/columnar）")
+    parser.add_argument('--format', default=None, choices=SUPPORTED_FORMATS,
+                        help="存储格式（默认有pyarrow时为parquet，否则为npy）")
+    parser.add_argument('--keep-float64', action='store_true', help="不将float64降为float32")
+    args = parser.parse_args(argv)
+
+    migrate_data_dir(args.data_dir, out_dir=args.out, fmt=args.format,
+                     float32=not args.keep_float64)
+
+
+if __name__ == '__main__':
+    main()
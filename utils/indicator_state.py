@@ -0,0 +1,572 @@
+# utils/indicator_state.py
+import json
+import math
+import os
+import tempfile
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# add_technical_indicators_inline（stock_analysis_unified）对应的指标列
+INLINE_STATE_COLUMNS = ['MA_5', 'MA_10', 'MA_20', 'MA_60', 'RSI_14', 'MACD', 'MACD_Signal']
+
+# utils.technical_indicators 中可以增量计算的指标列（MACD/Signal/Momentum 为未降噪的原始值）
+FULL_STATE_COLUMNS = [
+    'MA5', 'MA10', 'MA20', 'MA50', 'MA100', 'MA200', 'AVG_VOL', 'AVG_TR', 'EMA_12', 'EMA_26',
+    'Momentum', 'Volatility', 'ROC',
+    'STD', 'Upper_Band', 'Lower_Band', '%B', 'BB_Width',
+    'MACD', 'Signal',
+    'K', 'D', 'J', 'Stoch_K', 'Stoch_D',
+    'VWAP', 'AD', 'OBV',
+    'Williams_R', 'ATR', 'RSI'
+]
+
+STATE_VERSION = 1
+
+NAN = float('nan')
+
+
+def _div(a, b):
+    """与numpy浮点除法一致：除以0得到inf/NaN而不是异常"""
+    try:
+        return a / b
+    except ZeroDivisionError:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return float(np.float64(a) / np.float64(b))
+
+
+# ----------------------------------------------------------------------------
+# 状态组件：每个组件 O(1)（均摊）更新，可序列化为纯Python字典
+# ----------------------------------------------------------------------------
+
+class RollingWindow:
+    """
+    固定长度窗口的滚动和与平方和
+
+    窗口内有NaN时结果为NaN（与 rolling(window) 一致）；每 window 次更新从窗口重新求和一次，
+    消除长期累加误差（均摊 O(1)）
+    """
+
+    def __init__(self, window, values=(), total=0.0, total_sq=0.0, nan_count=0, pushes=0):
+        self.window = window
+        self.values = deque(values, maxlen=window)
+        self.total = total
+        self.total_sq = total_sq
+        self.nan_count = nan_count
+        self.pushes = pushes
+
+    def push(self, x):
+        if len(self.values) == self.window:
+            self._remove(self.values[0])
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count += 1
+        else:
+            self.total += x
+            self.total_sq += x * x
+        self.pushes += 1
+        if self.pushes % self.window == 0:
+            finite = [v for v in self.values if not math.isnan(v)]
+            self.total = math.fsum(finite)
+            self.total_sq = math.fsum(v * v for v in finite)
+
+    def _remove(self, old):
+        if math.isnan(old):
+            self.nan_count -= 1
+        else:
+            self.total -= old
+            self.total_sq -= old * old
+
+    @property
+    def full(self):
+        return len(self.values) == self.window and self.nan_count == 0
+
+    def sum(self):
+        return self.total if self.full else NAN
+
+    def mean(self):
+        return self.total / self.window if self.full else NAN
+
+    def std(self):
+        """样本标准差（ddof=1），与 rolling(window).std() 一致"""
+        if not self.full or self.window < 2:
+            return NAN
+        var = (self.total_sq - self.total * self.total / self.window) / (self.window - 1)
+        return math.sqrt(var) if var > 0 else 0.0
+
+    def lag(self, periods):
+        """periods 个bar之前的值（窗口长度需大于periods）"""
+        return self.values[-1 - periods] if len(self.values) > periods else NAN
+
+    def to_dict(self):
+        return {'window': self.window, 'values': list(self.values), 'total': self.total,
+                'total_sq': self.total_sq, 'nan_count': self.nan_count, 'pushes': self.pushes}
+
+
+class MonotonicWindow:
+    """
+    滚动最小值/最大值（单调队列，均摊 O(1)）
+    """
+
+    def __init__(self, window, mode='max', items=(), count=0):
+        self.window = window
+        self.mode = mode
+        self.items = deque(tuple(item) for item in items)
+        self.count = count
+
+    def push(self, x):
+        if self.mode == 'max':
+            while self.items and self.items[-1][1] <= x:
+                self.items.pop()
+        else:
+            while self.items and self.items[-1][1] >= x:
+                self.items.pop()
+        self.items.append((self.count, x))
+        if self.items[0][0] <= self.count - self.window:
+            self.items.popleft()
+        self.count += 1
+
+    def value(self):
+        return self.items[0][1] if self.count >= self.window else NAN
+
+    def to_dict(self):
+        return {'window': self.window, 'mode': self.mode, 'items': [list(item) for item in self.items],
+                'count': self.count}
+
+
+class EWM:
+    """
+    指数移动平均，与 Series.ewm(span=span, adjust=False).mean() 一致
+    """
+
+    def __init__(self, span, value=None):
+        self.span = span
+        self.alpha = 2.0 / (span + 1)
+        self.value = value
+
+    def push(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+    def to_dict(self):
+        return {'span': self.span, 'value': self.value}
+
+
+class SeededEMA:
+    """
+    以前 period 个值的简单平均为起点的EMA，与 talib.EMA 一致
+    """
+
+    def __init__(self, period, value=None, seed_sum=0.0, count=0):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.value = value
+        self.seed_sum = seed_sum
+        self.count = count
+
+    def push(self, x):
+        self.count += 1
+        if self.count < self.period:
+            self.seed_sum += x
+            return NAN
+        if self.count == self.period:
+            self.value = (self.seed_sum + x) / self.period
+        else:
+            self.value = self.value + self.k * (x - self.value)
+        return self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'value': self.value, 'seed_sum': self.seed_sum, 'count': self.count}
+
+
+class WilderAverage:
+    """
+    Wilder平滑：前 period 个值取简单平均，之后 (prev·(period-1) + x) / period（talib RSI/ATR）
+    """
+
+    def __init__(self, period, value=None, seed_sum=0.0, count=0):
+        self.period = period
+        self.value = value
+        self.seed_sum = seed_sum
+        self.count = count
+
+    def push(self, x):
+        self.count += 1
+        if self.count < self.period:
+            self.seed_sum += x
+            return NAN
+        if self.count == self.period:
+            self.value = (self.seed_sum + x) / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + x) / self.period
+        return self.value
+
+    def to_dict(self):
+        return {'period': self.period, 'value': self.value, 'seed_sum': self.seed_sum, 'count': self.count}
+
+
+_COMPONENT_TYPES = {cls.__name__: cls for cls in (RollingWindow, MonotonicWindow, EWM, SeededEMA, WilderAverage)}
+
+
+# ----------------------------------------------------------------------------
+# 指标状态
+# ----------------------------------------------------------------------------
+
+class IndicatorState:
+    """
+    单只股票的增量指标状态
+
+    保存各指标所需的滚动和、EMA状态和最值单调队列，每来一根新的日K线，
+    update(bar) 以 O(1)（均摊）更新全部指标，不再对整段历史重新计算
+
+    indicators:
+    - 'inline': 与 stock_analysis_unified.add_technical_indicators_inline 相同的指标（只需Close）
+    - 'full': utils.technical_indicators 中可增量计算的指标（需要 Open/High/Low/Close/Volume，
+      TurnoverRate 可选），MACD/Signal/Momentum 为未经小波降噪的原始值
+
+    update 提交新K线；preview 计算临时K线（如盘中未收盘）的指标但不修改状态；
+    to_dict/from_dict 和 save/load 用于把状态快照到磁盘
+    """
+
+    def __init__(self, indicators='inline'):
+        if indicators not in ('inline', 'full'):
+            raise ValueError(f"不支持的指标集: {indicators}")
+        self.indicators = indicators
+        self.columns = list(INLINE_STATE_COLUMNS if indicators == 'inline' else FULL_STATE_COLUMNS)
+        self.count = 0
+        self.last_date = None
+        self.prev_close = None
+        self.values = {}
+        self.components = self._build_components()
+
+    def _build_components(self):
+        c = {
+            'macd_fast': EWM(12),
+            'macd_slow': EWM(26),
+            'macd_signal': EWM(9),
+        }
+        if self.indicators == 'inline':
+            for period in (5, 10, 20, 60):
+                c[f'ma_{period}'] = RollingWindow(period)
+            c['rsi_gain'] = RollingWindow(14)
+            c['rsi_loss'] = RollingWindow(14)
+        else:
+            for period in (5, 10, 20, 50, 100, 200):
+                c[f'ma_{period}'] = RollingWindow(period)
+            c.update({
+                'close_lag': RollingWindow(11),
+                'volume_10': RollingWindow(10),
+                'turnover_10': RollingWindow(10),
+                'ema_12': SeededEMA(12),
+                'ema_26': SeededEMA(26),
+                'low_min_9': MonotonicWindow(9, 'min'),
+                'high_max_9': MonotonicWindow(9, 'max'),
+                'low_min_14': MonotonicWindow(14, 'min'),
+                'high_max_14': MonotonicWindow(14, 'max'),
+                'k_3': RollingWindow(3),
+                'stoch_k_3': RollingWindow(3),
+                'price_volume_20': RollingWindow(20),
+                'volume_20': RollingWindow(20),
+                'rsi_gain': WilderAverage(14),
+                'rsi_loss': WilderAverage(14),
+                'atr': WilderAverage(14),
+            })
+            self.values.update({'AD': 0.0, 'OBV': None})
+        return c
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def update(self, bar, date=None):
+        """
+        提交一根新的日K线并返回该K线的全部指标
+
+        参数:
+        bar: dict或Series，包含 Close（'full' 还需 Open/High/Low/Volume，TurnoverRate 可选）
+        date: K线日期（可选，记录在 last_date 中）
+
+        返回:
+        dict: 指标名 -> 值（数据不足时为NaN）
+        """
+        close = float(bar['Close'])
+        c = self.components
+        out = {}
+
+        # MACD（两种指标集相同）
+        macd = c['macd_fast'].push(close) - c['macd_slow'].push(close)
+        signal = c['macd_signal'].push(macd)
+
+        if self.indicators == 'inline':
+            for period in (5, 10, 20, 60):
+                c[f'ma_{period}'].push(close)
+                out[f'MA_{period}'] = c[f'ma_{period}'].mean()
+
+            delta = NAN if self.prev_close is None else close - self.prev_close
+            c['rsi_gain'].push(delta if delta > 0 else 0.0)
+            c['rsi_loss'].push(-delta if delta < 0 else 0.0)
+            rs = _div(c['rsi_gain'].mean(), c['rsi_loss'].mean())
+            out['RSI_14'] = 100 - 100 / (1 + rs)
+            out['MACD'] = macd
+            out['MACD_Signal'] = signal
+        else:
+            out.update(self._update_full(bar, close, macd, signal))
+
+        self.prev_close = close
+        self.count += 1
+        if date is not None:
+            self.last_date = str(pd.Timestamp(date).date())
+        return out
+
+    def _update_full(self, bar, close, macd, signal):
+        c = self.components
+        high = float(bar['High'])
+        low = float(bar['Low'])
+        volume = float(bar['Volume'])
+        turnover = float(bar['TurnoverRate']) if 'TurnoverRate' in bar else NAN
+        prev_close = self.prev_close
+        out = {}
+
+        # 移动平均线
+        for period in (5, 10, 20, 50, 100, 200):
+            c[f'ma_{period}'].push(close)
+            out[f'MA{period}'] = c[f'ma_{period}'].mean()
+        c['volume_10'].push(volume)
+        c['turnover_10'].push(turnover)
+        out['AVG_VOL'] = c['volume_10'].mean()
+        out['AVG_TR'] = c['turnover_10'].mean()
+        out['EMA_12'] = c['ema_12'].push(close)
+        out['EMA_26'] = c['ema_26'].push(close)
+
+        # 价格指标
+        c['close_lag'].push(close)
+        out['Momentum'] = close - c['close_lag'].lag(5)
+        ma20 = out['MA20']
+        std20 = c['ma_20'].std()
+        out['Volatility'] = _div(std20, ma20)
+        out['ROC'] = (_div(close, c['close_lag'].lag(10)) - 1) * 100
+
+        # 布林带
+        upper = ma20 + std20 * 2.5
+        lower = ma20 - std20 * 2.5
+        out['STD'] = std20
+        out['Upper_Band'] = upper
+        out['Lower_Band'] = lower
+        out['%B'] = _div(close - lower, upper - lower)
+        out['BB_Width'] = _div(upper - lower, ma20)
+
+        # MACD（未降噪）
+        out['MACD'] = macd
+        out['Signal'] = signal
+
+        # KDJ 与随机振荡器
+        c['low_min_9'].push(low)
+        c['high_max_9'].push(high)
+        low_min, high_max = c['low_min_9'].value(), c['high_max_9'].value()
+        k = 100 * _div(close - low_min, high_max - low_min)
+        stoch_k = _div(100 * (close - low_min), high_max - low_min)
+        c['k_3'].push(k)
+        c['stoch_k_3'].push(stoch_k)
+        d = c['k_3'].mean()
+        out['K'] = k
+        out['D'] = d
+        out['J'] = 3 * k - 2 * d
+        out['Stoch_K'] = stoch_k
+        out['Stoch_D'] = c['stoch_k_3'].mean()
+
+        # 成交量指标
+        c['price_volume_20'].push(close * volume)
+        c['volume_20'].push(volume)
+        out['VWAP'] = _div(c['price_volume_20'].sum(), c['volume_20'].sum())
+        hl = high - low
+        if hl != 0:
+            self.values['AD'] += ((close - low) - (high - close)) / hl * volume
+        out['AD'] = self.values['AD']
+        obv = self.values['OBV']
+        if obv is None:
+            obv = volume
+        elif close > prev_close:
+            obv += volume
+        elif close < prev_close:
+            obv -= volume
+        self.values['OBV'] = obv
+        out['OBV'] = obv
+
+        # Williams %R
+        c['low_min_14'].push(low)
+        c['high_max_14'].push(high)
+        highest_high, lowest_low = c['high_max_14'].value(), c['low_min_14'].value()
+        out['Williams_R'] = -100 * _div(highest_high - close, highest_high - lowest_low)
+
+        # ATR 与 RSI（Wilder平滑，从第二根K线开始）
+        if prev_close is None:
+            out['ATR'] = NAN
+            out['RSI'] = NAN
+        else:
+            true_range = max(high, prev_close) - min(low, prev_close)
+            out['ATR'] = c['atr'].push(true_range)
+            delta = close - prev_close
+            gain = c['rsi_gain'].push(max(delta, 0.0))
+            loss = c['rsi_loss'].push(max(-delta, 0.0))
+            if math.isnan(gain):
+                out['RSI'] = NAN
+            else:
+                out['RSI'] = 100 * gain / (gain + loss) if gain + loss != 0 else 0.0
+
+        return out
+
+    def preview(self, bar):
+        """
+        计算临时K线（如盘中最新价）的指标，不修改状态
+        """
+        return IndicatorState.from_dict(self.to_dict()).update(bar)
+
+    # ------------------------------------------------------------------
+    # 批量回放
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_frame(cls, df, indicators='inline'):
+        """
+        用历史K线逐根回放建立状态
+
+        返回:
+        (IndicatorState, 指标DataFrame)，指标DataFrame与df索引相同
+        """
+        state = cls(indicators)
+        frame = state.update_frame(df)
+        return state, frame
+
+    def update_frame(self, df):
+        """
+        依次提交df中的每根K线，返回这些K线的指标DataFrame
+        """
+        needed = ['Close'] if self.indicators == 'inline' else [
+            col for col in ('Open', 'High', 'Low', 'Close', 'Volume', 'TurnoverRate') if col in df.columns]
+        records = df[needed].to_dict('records')
+        dates = df.index if isinstance(df.index, pd.DatetimeIndex) else [None] * len(df)
+        rows = [self.update(bar, date) for bar, date in zip(records, dates)]
+        return pd.DataFrame(rows, index=df.index, columns=self.columns)
+
+    # ------------------------------------------------------------------
+    # 序列化
+    # ------------------------------------------------------------------
+
+    def to_dict(self):
+        """转为可JSON序列化的字典"""
+        return {
+            'version': STATE_VERSION,
+            'indicators': self.indicators,
+            'count': self.count,
+            'last_date': self.last_date,
+            'prev_close': self.prev_close,
+            'values': dict(self.values),
+            'components': {name: {'type': type(comp).__name__, **comp.to_dict()}
+                           for name, comp in self.components.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 to_dict 的结果恢复状态"""
+        if data.get('version') != STATE_VERSION:
+            raise ValueError(f"不支持的状态版本: {data.get('version')}")
+        state = cls(data['indicators'])
+        state.count = data['count']
+        state.last_date = data['last_date']
+        state.prev_close = data['prev_close']
+        state.values = dict(data['values'])
+        components = {}
+        for name, spec in data['components'].items():
+            spec = dict(spec)
+            components[name] = _COMPONENT_TYPES[spec.pop('type')](**spec)
+        state.components = components
+        return state
+
+    def save(self, path):
+        """原子写入JSON快照"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class IndicatorStateStore:
+    """
+    按股票代码保存 IndicatorState 快照的目录（每只股票一个JSON文件）
+
+    夜间更新全市场时只需对每只股票 load → update(新K线) → save，耗时与K线数量无关
+    同一进程内对同一只股票的 build/update 按股票加锁串行执行，并发更新不会丢失K线
+    """
+
+    def __init__(self, state_dir, indicators='inline'):
+        self.state_dir = state_dir
+        self.indicators = indicators
+        self._lock = threading.Lock()
+        self._stock_locks = {}
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _stock_lock(self, stock_code):
+        with self._lock:
+            return self._stock_locks.setdefault(stock_code, threading.RLock())
+
+    def _path(self, stock_code):
+        return os.path.join(self.state_dir, f"{stock_code}_{self.indicators}.json")
+
+    def get(self, stock_code):
+        """读取状态，不存在或损坏时返回None"""
+        path = self._path(stock_code)
+        if not os.path.exists(path):
+            return None
+        try:
+            return IndicatorState.load(path)
+        except Exception as e:
+            print(f"[指标状态] 读取 {stock_code} 失败: {e}")
+            return None
+
+    def put(self, stock_code, state):
+        state.save(self._path(stock_code))
+
+    def build(self, stock_code, df):
+        """用完整历史建立并保存状态，返回指标DataFrame"""
+        with self._stock_lock(stock_code):
+            state, frame = IndicatorState.from_frame(df, self.indicators)
+            self.put(stock_code, state)
+        return frame
+
+    def update(self, stock_code, df):
+        """
+        只提交 df 中晚于状态 last_date 的K线（df需以日期为索引）
+
+        没有已保存的状态时用df建立状态
+
+        返回:
+        新提交K线的指标DataFrame
+        """
+        # 读取 → 更新 → 保存 在同一把锁内完成，否则两个并发更新会基于同一份旧状态各自保存
+        with self._stock_lock(stock_code):
+            state = self.get(stock_code)
+            if state is None or state.last_date is None:
+                return self.build(stock_code, df)
+
+            new_bars = df.loc[df.index > pd.Timestamp(state.last_date)]
+            frame = state.update_frame(new_bars)
+            if len(new_bars):
+                self.put(stock_code, state)
+        return frame
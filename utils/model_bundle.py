@@ -0,0 +1,489 @@
+# utils/model_bundle.py
+"""
+模型制品包（model bundle）
+
+一次训练的所有模型保存为一个带版本号的目录，外加一个 JSON 清单（manifest）：
+
+    models/bundle/
+        CURRENT                  当前版本号（原子替换）
+        20251004-205903-1a2b3c4d/
+            manifest.json        特征列表、各模型阈值与指标、训练数据哈希、文件SHA256
+            RandomForest.pkl     pickle（最高协议）
+            XGBoost.ubj          XGBoost 原生二进制JSON格式
+            LightGBM.pkl
+            holdout.pkl          可选：训练时留出的测试集 (X, y[, 日期])，供加载新版本前验证（见 utils.model_registry）
+
+- XGBoost 使用原生格式（与版本无关，没有反序列化兼容性警告）；
+  LightGBM 的 sklearn 封装没有原生加载接口，用 pickle（其内部本就是原生文本模型）
+- sklearn 模型用 pickle：Tree.__setstate__ 会把节点数组复制到自己的内存中，
+  joblib 的内存映射无法在进程间共享这些数组，且逐个映射上千个小数组反而更慢
+  （1000棵树的随机森林：pickle 0.03s，joblib 0.24s，joblib mmap 0.47s）
+- 版本目录先写到临时目录再整体改名，最后原子替换 CURRENT，读者不会看到半写状态
+- 加载时记录总耗时和每个模型的耗时
+
+命令行：
+    python -m utils.model_bundle info models/bundle
+    python -m utils.model_bundle migrate models          # 把旧的 .pkl 文件转换为制品包
+"""
+import os
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+HOLDOUT_FILE = 'holdout.pkl'
+METRIC_KEYS = ('optimal_threshold', 'accuracy', 'avg_precision', 'precision_0', 'precision_1')
+
+
+def default_bundle_dir(models_dir='models'):
+    """默认的制品包目录：<models_dir>/bundle"""
+    return os.path.join(models_dir, 'bundle')
+
+
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _atomic_write_text(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _to_builtin(value):
+    """numpy 标量转为 Python 内置类型，便于写入JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def hash_training_data(X, y=None):
+    """
+    训练数据的SHA256（列名、行索引与取值），用于判断两个模型是否由同一份数据训练
+    """
+    digest = hashlib.sha256()
+    if isinstance(X, pd.DataFrame):
+        digest.update(json.dumps([str(c) for c in X.columns]).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(X, index=True).to_numpy().tobytes())
+    else:
+        digest.update(np.ascontiguousarray(X).tobytes())
+    if y is not None:
+        if isinstance(y, (pd.Series, pd.DataFrame)):
+            digest.update(pd.util.hash_pandas_object(y, index=True).to_numpy().tobytes())
+        else:
+            digest.update(np.ascontiguousarray(y).tobytes())
+    return digest.hexdigest()
+
+
+def _model_format(model):
+    """选择模型的存储格式：XGBoost 用原生格式，其余用 pickle"""
+    module = type(model).__module__
+    if module.startswith('xgboost') and hasattr(model, 'save_model'):
+        return 'xgboost'
+    return 'pickle'
+
+
+def _save_model(model, directory, name):
+    fmt = _model_format(model)
+    if fmt == 'xgboost':
+        filename = f"{name}.ubj"
+        model.save_model(os.path.join(directory, filename))
+    else:
+        filename = f"{name}.pkl"
+        with open(os.path.join(directory, filename), 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return filename, fmt, type(model).__module__ + '.' + type(model).__name__
+
+
+def _load_model(path, entry):
+    if entry['format'] == 'xgboost':
+        import xgboost as xgb
+        model = xgb.XGBClassifier()
+        model.load_model(path)
+        return model
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def list_bundle_versions(bundle_dir):
+    """返回目录下所有完整的版本号（按名称即时间排序）"""
+    if not os.path.isdir(bundle_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(bundle_dir)
+        if not name.startswith('.') and os.path.isfile(os.path.join(bundle_dir, name, MANIFEST_FILE))
+    )
+
+
+def current_version(bundle_dir):
+    """返回 CURRENT 指向的版本号，不存在时返回最新的版本，都没有时返回None"""
+    path = os.path.join(bundle_dir, CURRENT_FILE)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+        if version and os.path.isfile(os.path.join(bundle_dir, version, MANIFEST_FILE)):
+            return version
+    versions = list_bundle_versions(bundle_dir)
+    return versions[-1] if versions else None
+
+
+def set_current_version(bundle_dir, version):
+    """原子地把 CURRENT 指向指定版本"""
+    if not os.path.isfile(os.path.join(bundle_dir, version, MANIFEST_FILE)):
+        raise FileNotFoundError(f"版本不存在: {version}")
+    _atomic_write_text(os.path.join(bundle_dir, CURRENT_FILE), version + '\n')
+
+
+def read_manifest(bundle_dir, version=None):
+    """读取清单（默认当前版本），不存在时返回None"""
+    version = version or current_version(bundle_dir)
+    if version is None:
+        return None
+    with open(os.path.join(bundle_dir, version, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_model_bundle(bundle_dir, all_models_data, feature_list, best_model_name=None,
+                      training_data_hash=None, metadata=None, make_current=True, holdout=None,
+                      training_cutoff=None):
+    """
+    保存一次训练的所有模型为新版本
+
+    参数:
+    bundle_dir: 制品包根目录（如 models/bundle）
+    all_models_data: {模型名: {'model': 模型, 'optimal_threshold': ..., 'accuracy': ..., ...}}
+                     （train_models 的返回格式）
+    feature_list: 特征列名列表（顺序即模型输入顺序）
+    best_model_name: 最佳模型名，默认取 avg_precision 最高的模型
+    training_data_hash: 训练数据哈希（见 hash_training_data）
+    metadata: 其他写入清单的信息（股票数、样本数、窗口大小等），需可JSON序列化
+    make_current: 保存后是否把 CURRENT 指向新版本
+    holdout: 可选的留出样本 (X, y) 或 (X, y, dates)（未参与训练的测试集，dates 为每行的窗口结束日期），
+             与模型一起保存
+    training_cutoff: 训练截止日（训练用到的数据都不晚于该日期），比较版本时用于挑出各版本都没见过的样本
+
+    返回:
+    新版本号
+    """
+    if not all_models_data:
+        raise ValueError("all_models_data 不能为空")
+    if best_model_name is None:
+        best_model_name = max(all_models_data, key=lambda k: all_models_data[k].get('avg_precision', 0))
+    if best_model_name not in all_models_data:
+        raise ValueError(f"最佳模型 {best_model_name} 不在 all_models_data 中")
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    created = datetime.now()
+    version = created.strftime('%Y%m%d-%H%M%S')
+    if training_data_hash:
+        version += '-' + training_data_hash[:8]
+    base, suffix = version, 1
+    while os.path.exists(os.path.join(bundle_dir, version)):
+        version = f"{base}.{suffix}"
+        suffix += 1
+
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{version}.', dir=bundle_dir)
+    try:
+        models = {}
+        for name, model_data in all_models_data.items():
+            filename, fmt, model_class = _save_model(model_data['model'], tmp_dir, name)
+            path = os.path.join(tmp_dir, filename)
+            entry = {
+                'file': filename,
+                'format': fmt,
+                'class': model_class,
+                'sha256': _file_sha256(path),
+                'size': os.path.getsize(path),
+            }
+            for key in METRIC_KEYS:
+                if key in model_data:
+                    entry[key] = _to_builtin(model_data[key])
+            models[name] = entry
+
+        holdout_entry = None
+        if holdout is not None:
+            holdout = tuple(holdout)
+            path = os.path.join(tmp_dir, HOLDOUT_FILE)
+            with open(path, 'wb') as f:
+                pickle.dump(holdout, f, protocol=pickle.HIGHEST_PROTOCOL)
+            holdout_entry = {
+                'file': HOLDOUT_FILE,
+                'rows': len(holdout[1]),
+                'dated': len(holdout) > 2,
+                'sha256': _file_sha256(path),
+                'size': os.path.getsize(path),
+            }
+
+        manifest = {
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'version': version,
+            'created_at': created.strftime('%Y-%m-%d %H:%M:%S'),
+            'best_model': best_model_name,
+            'feature_list': list(feature_list),
+            'feature_count': len(feature_list),
+            'training_data_hash': training_data_hash,
+            'training_cutoff': (pd.Timestamp(training_cutoff).isoformat()
+                                if training_cutoff is not None else None),
+            'models': models,
+            'holdout': holdout_entry,
+            'metadata': metadata or {},
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # mkdtemp 创建的目录只有属主可读，改为常规权限供其他进程读取
+        os.chmod(tmp_dir, 0o755)
+        os.replace(tmp_dir, os.path.join(bundle_dir, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if make_current:
+        set_current_version(bundle_dir, version)
+    return version
+
+
+class ModelBundle:
+    """
+    加载后的制品包
+
+    属性:
+    manifest: 清单字典
+    models: {模型名: 模型}
+    all_models_data: 与 train_models 返回格式相同的字典（模型 + 阈值与指标）
+    best_model / best_model_name / feature_list
+    load_seconds: 总加载耗时；load_times: 每个模型的加载耗时
+    """
+
+    def __init__(self, path, manifest, models, load_times):
+        self.path = path
+        self.manifest = manifest
+        self.models = models
+        self.load_times = load_times
+        self.load_seconds = sum(load_times.values())
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def feature_list(self):
+        return self.manifest['feature_list']
+
+    @property
+    def best_model_name(self):
+        return self.manifest['best_model']
+
+    @property
+    def best_model(self):
+        return self.models[self.best_model_name]
+
+    @property
+    def all_models_data(self):
+        result = {}
+        for name, model in self.models.items():
+            entry = self.manifest['models'][name]
+            data = {'model': model}
+            data.update({key: entry[key] for key in METRIC_KEYS if key in entry})
+            result[name] = data
+        return result
+
+    @property
+    def model_info(self):
+        """app 侧边栏使用的模型信息（指标来自训练时的测试集）"""
+        best = self.manifest['models'][self.best_model_name]
+        metadata = self.manifest.get('metadata', {})
+        return {
+            'model_name': self.best_model_name,
+            'best_model_name': self.best_model_name,
+            'train_date': self.manifest['created_at'],
+            'accuracy': best.get('accuracy'),
+            'avg_precision': best.get('avg_precision'),
+            'optimal_threshold': best.get('optimal_threshold'),
+            'feature_count': self.manifest['feature_count'],
+            'sample_count': metadata.get('sample_count'),
+            'stock_count': metadata.get('stock_count'),
+            'available_models': list(self.models),
+            'bundle_version': self.version,
+            'load_seconds': self.load_seconds,
+        }
+
+    def __repr__(self):
+        return (f"ModelBundle(version={self.version!r}, models={list(self.models)}, "
+                f"load_seconds={self.load_seconds:.3f})")
+
+
+def verify_model_bundle(bundle_dir, version=None):
+    """
+    校验版本目录中各模型文件的SHA256
+
+    返回:
+    {模型名: 是否一致}
+    """
+    version = version or current_version(bundle_dir)
+    manifest = read_manifest(bundle_dir, version)
+    if manifest is None:
+        raise FileNotFoundError(f"{bundle_dir} 中没有模型制品包")
+    path = os.path.join(bundle_dir, version)
+    return {
+        name: os.path.exists(os.path.join(path, entry['file']))
+        and _file_sha256(os.path.join(path, entry['file'])) == entry['sha256']
+        for name, entry in manifest['models'].items()
+    }
+
+
+def load_model_bundle(bundle_dir, version=None, models=None, verify=False):
+    """
+    加载制品包
+
+    参数:
+    bundle_dir: 制品包根目录
+    version: 版本号，默认为 CURRENT 指向的版本
+    models: 只加载指定的模型名列表，默认全部
+    verify: 加载前校验文件SHA256
+
+    返回:
+    ModelBundle
+    """
+    version = version or current_version(bundle_dir)
+    if version is None:
+        raise FileNotFoundError(f"{bundle_dir} 中没有模型制品包")
+    path = os.path.join(bundle_dir, version)
+    manifest = read_manifest(bundle_dir, version)
+    if manifest.get('format_version', 0) > BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"不支持的制品包格式版本: {manifest.get('format_version')}")
+
+    if verify:
+        bad = [name for name, ok in verify_model_bundle(bundle_dir, version).items() if not ok]
+        if bad:
+            raise ValueError(f"模型文件校验失败: {bad}")
+
+    names = list(models) if models is not None else list(manifest['models'])
+    if manifest['best_model'] not in names:
+        names.insert(0, manifest['best_model'])
+
+    loaded, load_times = {}, {}
+    for name in names:
+        entry = manifest['models'][name]
+        start = time.perf_counter()
+        loaded[name] = _load_model(os.path.join(path, entry['file']), entry)
+        load_times[name] = time.perf_counter() - start
+    return ModelBundle(path, manifest, loaded, load_times)
+
+
+def load_holdout(bundle_dir, version=None):
+    """
+    读取版本中保存的留出样本
+
+    返回:
+    (X, y) 或 (X, y, dates)（与保存时相同），该版本没有留出样本时返回None
+    """
+    version = version or current_version(bundle_dir)
+    manifest = read_manifest(bundle_dir, version)
+    entry = (manifest or {}).get('holdout')
+    if not entry:
+        return None
+    path = os.path.join(bundle_dir, version, entry['file'])
+    if _file_sha256(path) != entry['sha256']:
+        raise ValueError(f"留出样本校验失败: {path}")
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def load_legacy_models(models_dir='models'):
+    """
+    读取旧格式的 .pkl 文件（trained_model / all_trained_models / feature_list / model_info）
+
+    all_trained_models.pkl 不存在时只包含最佳模型（阈值取0.5，指标取自 model_info）
+
+    返回:
+    (model, all_models_data, feature_list, model_info)
+    """
+    def _read(name):
+        with open(os.path.join(models_dir, f"{name}.pkl"), 'rb') as f:
+            return pickle.load(f)
+
+    model = _read('trained_model')
+    feature_list = list(_read('feature_list'))
+    info_path = os.path.join(models_dir, 'model_info.pkl')
+    model_info = _read('model_info') if os.path.exists(info_path) else {}
+
+    if os.path.exists(os.path.join(models_dir, 'all_trained_models.pkl')):
+        all_models_data = _read('all_trained_models')
+    else:
+        name = model_info.get('best_model_name') or type(model).__name__
+        all_models_data = {name: {
+            'model': model,
+            'optimal_threshold': 0.5,
+            'accuracy': model_info.get('accuracy'),
+            'avg_precision': model_info.get('avg_precision'),
+        }}
+    model_info.setdefault('model_name', model_info.get('best_model_name', 'Unknown'))
+    return model, all_models_data, feature_list, model_info
+
+
+def migrate_legacy_models(models_dir='models', bundle_dir=None):
+    """把旧格式的 .pkl 文件转换为制品包的新版本，返回版本号"""
+    model, all_models_data, feature_list, model_info = load_legacy_models(models_dir)
+    all_models_data = {k: {m: v for m, v in d.items() if v is not None} for k, d in all_models_data.items()}
+    best_name = next((k for k, d in all_models_data.items() if d['model'] is model), None)
+    metadata = {k: model_info[k] for k in ('sample_count', 'stock_count') if k in model_info}
+    metadata['migrated_from'] = os.path.abspath(models_dir)
+    metadata['legacy_train_date'] = model_info.get('train_date')
+    return save_model_bundle(bundle_dir or default_bundle_dir(models_dir), all_models_data, feature_list,
+                             best_model_name=best_name, metadata=metadata)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模型制品包工具")
+    sub = parser.add_subparsers(dest='command', required=True)
+    info = sub.add_parser('info', help="显示当前版本的清单与加载耗时")
+    info.add_argument('bundle_dir', nargs='?', default=default_bundle_dir())
+    info.add_argument('--version', default=None)
+    migrate = sub.add_parser('migrate', help="把旧的 .pkl 模型文件转换为制品包")
+    migrate.add_argument('models_dir', nargs='?', default='models')
+    args = parser.parse_args(argv)
+
+    if args.command == 'migrate':
+        version = migrate_legacy_models(args.models_dir)
+        print(f"[完成] 已保存版本 {version} 到 {default_bundle_dir(args.models_dir)}")
+        return
+
+    bundle = load_model_bundle(args.bundle_dir, args.version, verify=True)
+    print(f"版本: {bundle.version}  (全部版本: {', '.join(list_bundle_versions(args.bundle_dir))})")
+    print(f"最佳模型: {bundle.best_model_name}  特征数: {bundle.manifest['feature_count']}")
+    print(f"训练数据哈希: {bundle.manifest.get('training_data_hash')}")
+    print(f"训练截止日: {bundle.manifest.get('training_cutoff') or '未记录'}")
+    holdout = bundle.manifest.get('holdout')
+    print(f"留出样本: {holdout['rows'] if holdout else '无'}")
+    for name, entry in bundle.manifest['models'].items():
+        print(f"  {name:<14} {entry['format']:<8} {entry['size'] / 1e6:8.2f} MB  "
+              f"加载 {bundle.load_times.get(name, 0):.3f}s  阈值={entry.get('optimal_threshold')}  "
+              f"准确率={entry.get('accuracy')}  平均精确率={entry.get('avg_precision')}")
+    print(f"总加载耗时: {bundle.load_seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
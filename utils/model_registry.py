@@ -0,0 +1,641 @@
+# utils/model_registry.py
+"""
+模型注册表：不重启应用即可热切换模型版本
+
+ModelRegistry 监视模型制品包目录（utils.model_bundle），发现 CURRENT 指向新版本后在后台线程中：
+
+1. 加载新版本（校验文件SHA256）并把树模型编译为扁平数组（utils.tree_inference）
+2. 在留出样本上验证：特征齐全、概率有限且在[0,1]内、编译推理与原模型一致，
+   平均精确率不低于 min_avg_precision，且比当前服务的模型最多低 max_regression
+3. 验证通过后原子地替换服务指针（整体替换一个属性，请求线程读取时无需加锁）；
+   验证失败时继续使用旧模型，并把 CURRENT 改回旧版本
+
+- 内存中最多保留 max_warm 个版本（当前版本 + 之前的版本），用于A/B对比和快速回滚；
+  auto_promote=False 时新版本验证后只作为挑战者预热，route() 按比例把请求分给挑战者
+- 每个版本记录加载耗时、编译耗时、验证耗时、留出样本上的真实指标与单行推理耗时，
+  保存在 <bundle_dir>/.registry.json，重启后被拒绝的版本不会再次加载
+- 留出样本默认使用版本中保存的测试集（save_model_bundle(..., holdout=(X, y, dates))，
+  X 为全部原生特征列，特征选择结果不同的版本也能在上面评估），
+  也可以传入固定的样本，使各版本在同一份数据上比较
+- 与当前版本比较时只使用晚于当前版本训练截止日（清单中的 training_cutoff）的留出样本，
+  两个版本都没见过这些样本；没有这样的样本时跳过回退检查
+
+用法：
+    registry = ModelRegistry('models/bundle', max_warm=2, poll_interval=30)
+    registry.start()                  # 同步加载当前版本，并启动监视线程
+    model, all_models_data, feature_list, model_info = registry.serving.as_tuple()
+    registry.compare()                # 各预热版本的指标对比（DataFrame）
+    registry.rollback()               # 切换回上一个版本
+"""
+import os
+import json
+import time
+import zlib
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.model_bundle import (
+    current_version, set_current_version, list_bundle_versions, load_model_bundle, load_holdout
+)
+
+REGISTRY_FILE = '.registry.json'
+# 编译推理与原模型的最大允许概率差
+COMPILED_TOLERANCE = 1e-4
+# 重启后不再自动加载的状态
+BLOCKED_STATUSES = ('rejected', 'failed')
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def evaluate_probabilities(y_true, y_proba, threshold=0.5):
+    """
+    按阈值计算分类指标（与 train_models 的评估口径一致：平均精确率为两类精确率的平均）
+    """
+    from sklearn.metrics import accuracy_score, precision_score, roc_auc_score
+
+    y_true = np.asarray(y_true).astype(int)
+    y_pred = (np.asarray(y_proba) >= threshold).astype(int)
+    precision_0 = precision_score(y_true, y_pred, pos_label=0, zero_division=0)
+    precision_1 = precision_score(y_true, y_pred, pos_label=1, zero_division=0)
+    metrics = {
+        'rows': int(len(y_true)),
+        'threshold': float(threshold),
+        'accuracy': float(accuracy_score(y_true, y_pred)),
+        'avg_precision': float((precision_0 + precision_1) / 2),
+        'precision_0': float(precision_0),
+        'precision_1': float(precision_1),
+        'positive_rate': float(y_pred.mean()) if len(y_pred) else 0.0,
+        'auc': None,
+    }
+    if len(np.unique(y_true)) == 2:
+        metrics['auc'] = float(roc_auc_score(y_true, y_proba))
+    return metrics
+
+
+class ModelVersion:
+    """
+    加载到内存中的一个模型版本
+
+    属性:
+    version / model（最佳模型）/ all_models_data / feature_list / model_info
+    holdout: 验证用的留出样本 (X, y) 或 (X, y, dates)，没有时为None
+    training_cutoff: 训练截止日（pd.Timestamp），旧版本没有记录时为None
+    threshold_tuned_on: 阈值在哪份数据上确定（'validation'；旧版本在测试集即留出样本上确定，为None）
+    """
+
+    def __init__(self, bundle, all_models_data, holdout=None):
+        self.bundle = bundle
+        self.version = bundle.version
+        self.feature_list = bundle.feature_list
+        self.all_models_data = all_models_data
+        self.model = all_models_data[bundle.best_model_name]['model']
+        self.best_model_name = bundle.best_model_name
+        self.holdout = holdout
+        cutoff = bundle.manifest.get('training_cutoff')
+        self.training_cutoff = pd.Timestamp(cutoff) if cutoff else None
+        self.threshold_tuned_on = bundle.manifest.get('metadata', {}).get('threshold_tuned_on')
+        self.model_info = dict(bundle.model_info, model_version=bundle.version)
+
+    def as_tuple(self):
+        """(model, all_models_data, feature_list, model_info)，与 load_or_train_models 的返回格式相同"""
+        return self.model, self.all_models_data, self.feature_list, self.model_info
+
+    def evaluate(self, X, y):
+        """
+        在给定样本上评估所有模型
+
+        返回:
+        {模型名: 指标字典（另含 predict_ms_per_row）}
+        """
+        from utils.tree_inference import model_predict_proba
+
+        X = X[self.feature_list]
+        results = {}
+        for name, model_data in self.all_models_data.items():
+            start = time.perf_counter()
+            proba = np.asarray(model_predict_proba(model_data, X))[:, 1]
+            elapsed = time.perf_counter() - start
+            metrics = evaluate_probabilities(y, proba, model_data.get('optimal_threshold', 0.5))
+            metrics['predict_ms_per_row'] = elapsed * 1000 / max(len(X), 1)
+            results[name] = metrics
+        return results
+
+    def __repr__(self):
+        return f"ModelVersion(version={self.version!r}, best_model={self.best_model_name!r})"
+
+
+class ModelRegistry:
+    """
+    监视制品包目录并热切换模型版本（线程安全，每个应用进程一个实例）
+
+    参数:
+    bundle_dir: 模型制品包目录
+    max_warm: 内存中最多保留的版本数（含当前服务的版本）
+    poll_interval: 监视线程检查新版本的间隔（秒）
+    holdout: 固定的验证样本 (X, y) 或 (X, y, dates)，None 表示使用各版本中保存的留出样本；
+             没有 dates 时视为所有版本都没有在这份样本上训练过
+    holdout_rows: 验证时最多使用的样本行数
+    min_avg_precision: 最佳模型在留出样本上的最低平均精确率，None 表示不检查
+    max_regression: 新版本平均精确率比当前版本最多低多少（在两个版本都没见过的留出样本上比较），
+                    None 表示不检查
+    auto_promote: 验证通过后是否立即切换；False 时只预热为挑战者，由 promote() 手动切换
+    challenger_fraction: route() 分给挑战者的请求比例（A/B测试）
+    """
+
+    def __init__(self, bundle_dir, max_warm=2, poll_interval=30, holdout=None, holdout_rows=2000,
+                 min_avg_precision=None, max_regression=0.05, auto_promote=True, challenger_fraction=0.0):
+        self.bundle_dir = bundle_dir
+        self.max_warm = max(1, max_warm)
+        self.poll_interval = poll_interval
+        self.holdout = holdout
+        self.holdout_rows = holdout_rows
+        self.min_avg_precision = min_avg_precision
+        self.max_regression = max_regression
+        self.auto_promote = auto_promote
+        self.challenger_fraction = challenger_fraction
+
+        self._serving = None
+        self._warm = OrderedDict()
+        self._lock = threading.RLock()
+        self._check_lock = threading.Lock()
+        self._listeners = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._records = self._load_records()
+
+    # ------------------------------------------------------------------
+    # 版本记录
+    # ------------------------------------------------------------------
+
+    def _registry_path(self):
+        return os.path.join(self.bundle_dir, REGISTRY_FILE)
+
+    def _load_records(self):
+        """读取上次运行保存的版本记录；内存中的状态（服务中、预热）在重启后失效"""
+        try:
+            with open(self._registry_path(), 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        for record in records.values():
+            if record.get('status') not in BLOCKED_STATUSES:
+                record['status'] = 'unloaded'
+        return records
+
+    def _save_records(self):
+        with self._lock:
+            text = json.dumps(self._records, ensure_ascii=False, indent=2)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.bundle_dir, suffix='.tmp')
+        except OSError as e:
+            print(f"[模型注册表] 保存版本记录失败: {e}")
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._registry_path())
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"[模型注册表] 保存版本记录失败: {e}")
+
+    def _update_record(self, version, **fields):
+        with self._lock:
+            record = self._records.setdefault(version, {'version': version})
+            record.update(fields)
+            return dict(record)
+
+    def record(self, version):
+        """单个版本的记录（状态、耗时、指标），不存在时返回None"""
+        with self._lock:
+            record = self._records.get(version)
+            return dict(record) if record is not None else None
+
+    def records(self):
+        """所有版本的记录，最新版本在前"""
+        with self._lock:
+            return [dict(self._records[v]) for v in sorted(self._records, reverse=True)]
+
+    def add_listener(self, callback):
+        """注册事件回调 callback(event, record)，event 为 promoted / rejected / failed / evicted"""
+        self._listeners.append(callback)
+
+    def _notify(self, event, record):
+        for callback in list(self._listeners):
+            try:
+                callback(event, record)
+            except Exception as e:
+                print(f"[模型注册表] 回调失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    @property
+    def serving(self):
+        """当前服务的 ModelVersion，没有可用版本时为None"""
+        return self._serving
+
+    @property
+    def serving_version(self):
+        serving = self._serving
+        return serving.version if serving is not None else None
+
+    def get(self, version):
+        """内存中的指定版本，未预热时返回None"""
+        with self._lock:
+            return self._warm.get(version)
+
+    def warm_versions(self):
+        """内存中的版本号（从旧到新）"""
+        with self._lock:
+            return list(self._warm)
+
+    @property
+    def challenger(self):
+        """最新的非服务预热版本（A/B测试的对照组），没有时为None"""
+        with self._lock:
+            serving = self._serving
+            for version in reversed(self._warm):
+                if serving is None or version != serving.version:
+                    return self._warm[version]
+        return None
+
+    def route(self, key):
+        """
+        A/B分流：按 key（如股票代码）的哈希把 challenger_fraction 比例的请求分给挑战者
+        同一个 key 总是分到同一组
+        """
+        serving = self._serving
+        if self.challenger_fraction <= 0:
+            return serving
+        challenger = self.challenger
+        if challenger is None:
+            return serving
+        bucket = zlib.crc32(str(key).encode()) % 10000 / 10000
+        return challenger if bucket < self.challenger_fraction else serving
+
+    # ------------------------------------------------------------------
+    # 加载与验证
+    # ------------------------------------------------------------------
+
+    def _holdout_for(self, entry):
+        if self.holdout is not None:
+            return self.holdout, 'registry'
+        if entry.holdout is not None:
+            return entry.holdout, 'bundle'
+        return None, None
+
+    def _load(self, version):
+        """加载并编译一个版本，失败时记录原因并返回None"""
+        from utils.tree_inference import compile_models
+
+        self._update_record(version, status='loading', error=None, reason=None)
+        try:
+            bundle = load_model_bundle(self.bundle_dir, version, verify=True)
+            all_models_data = bundle.all_models_data
+            start = time.perf_counter()
+            compile_models(all_models_data, verbose=False)
+            compile_seconds = time.perf_counter() - start
+            holdout = load_holdout(self.bundle_dir, version) if self.holdout is None else None
+        except Exception as e:
+            record = self._update_record(version, status='failed', error=f"{type(e).__name__}: {e}")
+            print(f"[模型注册表] 版本 {version} 加载失败: {e}")
+            self._save_records()
+            self._notify('failed', record)
+            return None
+
+        entry = ModelVersion(bundle, all_models_data, holdout)
+        entry.model_info['compile_seconds'] = compile_seconds
+        self._update_record(
+            version,
+            created_at=bundle.manifest.get('created_at'),
+            best_model=bundle.best_model_name,
+            train_metrics={name: {key: data.get(key) for key in ('accuracy', 'avg_precision', 'optimal_threshold')}
+                           for name, data in bundle.manifest['models'].items()},
+            load_seconds=bundle.load_seconds,
+            model_load_seconds=dict(bundle.load_times),
+            compile_seconds=compile_seconds,
+            loaded_at=_now(),
+        )
+        return entry
+
+    def _validate(self, entry, check_regression=True):
+        """
+        在留出样本上验证一个版本，返回 (是否通过, 原因)；指标写入版本记录
+        """
+        self._update_record(entry.version, status='validating')
+        holdout, source = self._holdout_for(entry)
+        if holdout is None:
+            self._update_record(entry.version, holdout_source=None, holdout_metrics=None,
+                                validation='没有留出样本，只做了加载检查')
+            return True, None
+
+        X, y = holdout[0], holdout[1]
+        dates = pd.DatetimeIndex(holdout[2])[:self.holdout_rows] if len(holdout) > 2 else None
+        missing = [name for name in entry.feature_list if name not in X.columns]
+        if missing:
+            return False, f"留出样本缺少 {len(missing)} 个特征（如 {missing[0]}）"
+        full_X = X.iloc[:self.holdout_rows]
+        X = full_X[entry.feature_list]
+        y = np.asarray(y)[:len(X)]
+
+        start = time.perf_counter()
+        for name, model_data in entry.all_models_data.items():
+            proba = np.asarray(model_data['model'].predict_proba(X))[:, 1]
+            if not np.all(np.isfinite(proba)) or proba.min() < 0 or proba.max() > 1:
+                return False, f"{name} 输出的概率无效"
+            compiled = model_data.get('compiled')
+            if compiled is not None:
+                diff = float(np.max(np.abs(compiled.predict_proba(X)[:, 1] - proba)))
+                if diff > COMPILED_TOLERANCE:
+                    return False, f"{name} 编译推理与原模型不一致（最大差 {diff:.2e}）"
+        metrics = entry.evaluate(X, y)
+        best = metrics[entry.best_model_name]
+        entry.model_info['holdout_accuracy'] = best['accuracy']
+        entry.model_info['holdout_avg_precision'] = best['avg_precision']
+        # 阈值在自身留出样本上确定的旧版本，其留出样本指标偏乐观，不是独立评估
+        independent = source == 'registry' or entry.threshold_tuned_on == 'validation'
+        self._update_record(
+            entry.version, holdout_source=source, holdout_rows=len(X), holdout_metrics=metrics,
+            holdout_independent=independent,
+            predict_ms_per_row={name: m['predict_ms_per_row'] for name, m in metrics.items()},
+            validate_seconds=time.perf_counter() - start, validation='通过留出样本验证',
+        )
+
+        if self.min_avg_precision is not None and best['avg_precision'] < self.min_avg_precision:
+            return False, f"平均精确率 {best['avg_precision']:.2%} 低于下限 {self.min_avg_precision:.2%}"
+
+        serving = self._serving
+        if (check_regression and self.max_regression is not None and serving is not None
+                and serving.version != entry.version):
+            missing = [name for name in serving.feature_list if name not in full_X.columns]
+            if missing:
+                rows, skipped = None, (f"留出样本缺少版本 {serving.version} 的 {len(missing)} 个特征"
+                                       f"（如 {missing[0]}）")
+            else:
+                rows, skipped = self._unseen_rows(serving, dates, source, len(y))
+            if rows is None:
+                self._update_record(entry.version, baseline={'version': serving.version, 'skipped': skipped})
+                print(f"[模型注册表] 版本 {entry.version} 跳过回退检查: {skipped}")
+                return True, None
+            X_unseen, y_unseen = full_X[rows], y[rows]
+            baseline = serving.evaluate(X_unseen, y_unseen)[serving.best_model_name]
+            candidate = entry.evaluate(X_unseen, y_unseen)[entry.best_model_name]
+            self._update_record(entry.version, baseline={
+                'version': serving.version,
+                'rows': len(y_unseen),
+                'accuracy': baseline['accuracy'],
+                'avg_precision': baseline['avg_precision'],
+                'candidate_avg_precision': candidate['avg_precision'],
+            })
+            if candidate['avg_precision'] < baseline['avg_precision'] - self.max_regression:
+                return False, (f"平均精确率 {candidate['avg_precision']:.2%} 比当前版本 {serving.version} "
+                               f"的 {baseline['avg_precision']:.2%} 低超过 {self.max_regression:.2%}"
+                               f"（{len(y_unseen)} 个样本）")
+        return True, None
+
+    @staticmethod
+    def _unseen_rows(serving, dates, source, n_rows):
+        """
+        留出样本中当前服务版本没有训练过的行，返回 (布尔数组, None)；无法比较时返回 (None, 原因)
+
+        新版本的留出样本晚于新版本的训练截止日，却可能早于当前版本的截止日
+        （当前版本在这些样本上训练过，指标虚高），所以只比较晚于当前版本截止日的行
+        """
+        if dates is not None and serving.training_cutoff is not None:
+            rows = np.asarray(dates > serving.training_cutoff)
+            if not rows.any():
+                return None, (f"留出样本中没有晚于版本 {serving.version} "
+                              f"训练截止日 {serving.training_cutoff:%Y-%m-%d} 的样本")
+            return rows, None
+        if dates is None and source == 'registry':
+            # 固定验证样本没有日期：调用方保证各版本都没有在上面训练过
+            return np.ones(n_rows, dtype=bool), None
+        if serving.training_cutoff is None:
+            return None, f"版本 {serving.version} 没有记录训练截止日"
+        return None, "留出样本没有日期"
+
+    def _load_and_validate(self, version, check_regression=True):
+        entry = self._load(version)
+        if entry is None:
+            return None
+        try:
+            ok, reason = self._validate(entry, check_regression)
+        except Exception as e:
+            ok, reason = False, f"验证出错: {type(e).__name__}: {e}"
+        if not ok:
+            record = self._update_record(version, status='rejected', reason=reason)
+            print(f"[模型注册表] 版本 {version} 未通过验证: {reason}")
+            self._save_records()
+            self._notify('rejected', record)
+            return None
+        return entry
+
+    # ------------------------------------------------------------------
+    # 切换
+    # ------------------------------------------------------------------
+
+    def _warm_up(self, entry):
+        """把版本放入预热集合，超出 max_warm 时淘汰最旧的非服务版本，返回被淘汰的记录"""
+        evicted = []
+        with self._lock:
+            self._warm[entry.version] = entry
+            self._warm.move_to_end(entry.version)
+            if self._records.get(entry.version, {}).get('status') != 'serving':
+                self._update_record(entry.version, status='warm')
+            serving = self.serving_version
+            while len(self._warm) > self.max_warm:
+                version = next(v for v in self._warm if v != serving)
+                del self._warm[version]
+                evicted.append(self._update_record(version, status='unloaded', evicted_at=_now()))
+        return evicted
+
+    def _promote(self, entry):
+        """原子切换服务指针，并让 CURRENT 指向新版本"""
+        with self._lock:
+            previous = self._serving
+            self._serving = entry
+            if previous is not None:
+                self._update_record(previous.version, status='warm')
+            record = self._update_record(entry.version, status='serving', promoted_at=_now(),
+                                         previous=previous.version if previous is not None else None)
+            evicted = self._warm_up(entry)
+        self._save_records()
+        if current_version(self.bundle_dir) != entry.version:
+            try:
+                set_current_version(self.bundle_dir, entry.version)
+            except OSError as e:
+                print(f"[模型注册表] 更新 CURRENT 失败: {e}")
+        print(f"[模型注册表] 切换到版本 {entry.version}"
+              + (f"（之前为 {previous.version}）" if previous is not None else ""))
+        self._notify('promoted', record)
+        for item in evicted:
+            self._notify('evicted', item)
+        return entry
+
+    def _candidates(self, candidate):
+        """按优先级排列的待加载版本：CURRENT；还没有服务版本时再依次尝试较旧的版本"""
+        versions = [candidate] if candidate is not None else []
+        if self._serving is None:
+            versions += [v for v in reversed(list_bundle_versions(self.bundle_dir)) if v != candidate]
+        with self._lock:
+            return [v for v in versions
+                    if self._records.get(v, {}).get('status') not in BLOCKED_STATUSES and v not in self._warm]
+
+    def check_for_updates(self):
+        """
+        检查 CURRENT 是否指向新版本，是则加载、验证并切换（监视线程定期调用，也可手动调用）
+
+        返回:
+        新切换（或预热）的版本号，没有变化时返回None
+        """
+        with self._check_lock:
+            candidate = current_version(self.bundle_dir)
+            serving = self._serving
+            if candidate is not None and serving is not None and candidate == serving.version:
+                return None
+
+            # CURRENT 指向已预热的版本（如其他进程回滚到上一个版本）：已验证过，直接切换
+            with self._lock:
+                warm = self._warm.get(candidate)
+            if warm is not None and self.auto_promote:
+                self._promote(warm)
+                return candidate
+
+            for version in self._candidates(candidate):
+                entry = self._load_and_validate(version)
+                if entry is None:
+                    continue
+                if self.auto_promote or self._serving is None:
+                    self._promote(entry)
+                else:
+                    evicted = self._warm_up(entry)
+                    self._save_records()
+                    print(f"[模型注册表] 版本 {version} 已预热为挑战者")
+                    for item in evicted:
+                        self._notify('evicted', item)
+                return version
+
+            # 新版本未通过验证：CURRENT 改回当前服务的版本，其他进程也不会加载它
+            serving = self._serving
+            if (serving is not None and candidate is not None and candidate != serving.version
+                    and candidate not in self._warm and current_version(self.bundle_dir) == candidate):
+                try:
+                    set_current_version(self.bundle_dir, serving.version)
+                except OSError as e:
+                    print(f"[模型注册表] 恢复 CURRENT 失败: {e}")
+            return None
+
+    def promote(self, version, validate=True):
+        """
+        手动切换到指定版本（未预热时先加载；validate=False 跳过留出样本验证和回退检查）
+        """
+        with self._check_lock:
+            entry = self.get(version)
+            if entry is None:
+                if validate:
+                    entry = self._load_and_validate(version, check_regression=False)
+                else:
+                    entry = self._load(version)
+                if entry is None:
+                    raise ValueError(f"版本 {version} 加载或验证失败: {(self.record(version) or {}).get('reason')}")
+            return self._promote(entry)
+
+    def rollback(self):
+        """切换回上一个服务的版本（仍在内存中时无需重新加载）"""
+        serving = self._serving
+        previous = (self.record(serving.version) or {}).get('previous') if serving is not None else None
+        if previous is None:
+            raise ValueError("没有可回滚的版本")
+        return self.promote(previous, validate=False)
+
+    # ------------------------------------------------------------------
+    # 对比
+    # ------------------------------------------------------------------
+
+    def compare(self, X=None, y=None):
+        """
+        各预热版本的指标对比
+
+        X/y 为None时使用各版本验证时记录的留出样本指标；传入时所有版本在同一份数据上重新评估
+        （X 需包含各版本的全部特征列，如 extract_minimal_features_native 的完整输出）
+        holdout_independent 为False 的版本阈值是在该留出样本上确定的，指标偏乐观
+        """
+        rows = []
+        serving = self.serving_version
+        with self._lock:
+            entries = list(self._warm.values())
+        for entry in reversed(entries):
+            record = self.record(entry.version) or {}
+            if X is not None:
+                # 特征不全的版本无法在这份数据上评估，指标留空
+                metrics = entry.evaluate(X, y) if all(f in X.columns for f in entry.feature_list) else {}
+            else:
+                metrics = record.get('holdout_metrics') or {}
+            independent = True if X is not None else record.get('holdout_independent', False)
+            best = metrics.get(entry.best_model_name, {})
+            train = (record.get('train_metrics') or {}).get(entry.best_model_name, {})
+            rows.append({
+                'version': entry.version,
+                'serving': entry.version == serving,
+                'best_model': entry.best_model_name,
+                'accuracy': best.get('accuracy'),
+                'avg_precision': best.get('avg_precision'),
+                'auc': best.get('auc'),
+                'holdout_rows': best.get('rows'),
+                'holdout_independent': bool(independent),
+                'train_accuracy': train.get('accuracy'),
+                'train_avg_precision': train.get('avg_precision'),
+                'load_seconds': record.get('load_seconds'),
+                'compile_seconds': record.get('compile_seconds'),
+                'predict_ms_per_row': best.get('predict_ms_per_row'),
+            })
+        return pd.DataFrame(rows)
+
+    # ------------------------------------------------------------------
+    # 监视线程
+    # ------------------------------------------------------------------
+
+    def start(self, initial_load=True):
+        """启动监视线程；initial_load=True 时先同步加载当前版本"""
+        if initial_load:
+            self.check_for_updates()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name='model-registry', daemon=True)
+            self._thread.start()
+        return self
+
+    def poll_now(self):
+        """立即唤醒监视线程检查新版本（如训练任务完成后调用）"""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _watch(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.check_for_updates()
+            except Exception as e:
+                print(f"[模型注册表] 检查新版本失败: {e}")
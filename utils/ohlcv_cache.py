@@ -0,0 +1,226 @@
+# utils/ohlcv_cache.py
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.columnar_store import ColumnarStore
+from utils.prediction_cache import TRADING_SESSIONS, MARKET_CLOSE
+
+
+def default_cache_dir():
+    """默认缓存目录：环境变量 STOCK_OHLCV_CACHE_DIR，否则使用系统临时目录（Streamlit Cloud可写）"""
+    return os.environ.get('STOCK_OHLCV_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'stock_ohlcv_cache')
+
+
+def _to_timestamp(value):
+    """将 'YYYYMMDD' 字符串、date 或 datetime 转为 Timestamp"""
+    if isinstance(value, str):
+        return pd.Timestamp(datetime.strptime(value, '%Y%m%d'))
+    return pd.Timestamp(value).normalize()
+
+
+def _in_trading_hours(now):
+    """是否处于交易日开盘到收盘之间（含午间休市，节假日按工作日处理）"""
+    return now.weekday() < 5 and TRADING_SESSIONS[0][0] <= now.time() < MARKET_CLOSE
+
+
+def last_market_close(now):
+    """now 之前（含）最近一次收盘的时间"""
+    day = now.date()
+    if day.weekday() >= 5 or now.time() < MARKET_CLOSE:
+        day = (pd.Timestamp(day) - pd.offsets.BDay(1)).date()
+    return datetime.combine(day, MARKET_CLOSE)
+
+
+def _frame_bytes(df):
+    """估算DataFrame占用字节数（用于统计节省的下载量）"""
+    if df is None or df.empty:
+        return 0
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+class OHLCVCache:
+    """
+    按股票代码和复权类型（fqt）缓存的本地行情数据
+
+    - 首次请求全量下载并写入缓存
+    - 之后只下载最后缓存日期之后的K线并追加（增量刷新）
+    - 最近一次收盘之后刷新过的股票直接读缓存，不产生网络请求；交易时段内当天K线仍在变化，
+      刷新后 intraday_ttl 秒内读缓存，之后重新增量刷新
+    - 无网络（fetcher为None）时返回缓存中的旧数据
+
+    缓存内容为已重命名、已合并资金流的原始日线（未计算技术指标），通过 ColumnarStore
+    以列式格式保存（元数据写入schema），
+    stats 记录命中/未命中/增量刷新次数和节省的字节数
+    """
+
+    def __init__(self, cache_dir=None, intraday_ttl=300):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.intraday_ttl = intraday_ttl
+        self.store = ColumnarStore(self.cache_dir)
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'delta_refreshes': 0,
+            'full_refreshes': 0,
+            'stale_hits': 0,
+            'bytes_saved': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # 存储
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _name(stock_code, fqt):
+        return f"{stock_code}_fqt{fqt}"
+
+    def load(self, stock_code, fqt=1):
+        """读取缓存，返回 (DataFrame, 元数据)；不存在时返回 (None, None)"""
+        try:
+            df, schema = self.store.read_with_schema(self._name(stock_code, fqt), mmap=False)
+            if df is None:
+                return None, None
+            return df, schema['metadata']
+        except Exception as e:
+            print(f"[缓存] 读取 {stock_code} 失败，将重新下载: {e}")
+            return None, None
+
+    def save(self, stock_code, df, meta, fqt=1):
+        """原子写入缓存（数据与元数据一起提交，见 ColumnarStore.write）"""
+        try:
+            self.store.write(self._name(stock_code, fqt), df, metadata=meta)
+        except Exception as e:
+            print(f"[缓存] 写入 {stock_code} 失败: {e}")
+
+    def invalidate(self, stock_code=None, fqt=1):
+        """删除指定股票（或全部）的缓存"""
+        names = [self._name(stock_code, fqt)] if stock_code else self.store.names()
+        for name in names:
+            self.store.remove(name)
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    # ------------------------------------------------------------------
+    # 读取与刷新
+    # ------------------------------------------------------------------
+
+    def is_fresh(self, meta, now):
+        """缓存的K线在 now 时是否仍是最新的（刷新之后没有新的或变化中的K线）"""
+        refreshed_at = meta.get('refreshed_at')
+        if not refreshed_at:
+            return False
+        refreshed_at = datetime.fromisoformat(refreshed_at)
+        if _in_trading_hours(now):
+            return 0 <= (now - refreshed_at).total_seconds() < self.intraday_ttl
+        return refreshed_at >= last_market_close(now)
+
+    def get_or_fetch(self, stock_code, start_date, end_date, fetcher, fqt=1, now=None):
+        """
+        获取 [start_date, end_date] 区间的日线数据
+
+        参数:
+        stock_code: 股票代码
+        start_date, end_date: 'YYYYMMDD' 字符串
+        fetcher: 下载函数 fetcher(beg, end) -> 以日期为索引的DataFrame或None；为None表示离线
+        fqt: 复权类型（与efinance一致，1为前复权）
+        now: 当前时间，默认 datetime.now()（便于测试）
+
+        返回:
+        DataFrame 或 None
+        """
+        start_ts = _to_timestamp(start_date)
+        end_ts = _to_timestamp(end_date)
+        now = now or datetime.now()
+        refresh_meta = {
+            'refreshed_on': now.strftime('%Y%m%d'),
+            'refreshed_at': now.isoformat(timespec='seconds'),
+        }
+
+        cached, meta = self.load(stock_code, fqt)
+        covers_start = cached is not None and not cached.empty and _to_timestamp(meta['beg']) <= start_ts
+
+        if covers_start:
+            fresh = self.is_fresh(meta, now)
+            # 请求区间在上次刷新日之前结束：区间内的K线在刷新时都已收盘
+            historical = end_ts <= cached.index[-1] and end_ts < _to_timestamp(meta['refreshed_on'])
+
+            if fresh or historical or fetcher is None:
+                result = cached.loc[start_ts:end_ts]
+                self._count('hits')
+                if fetcher is None and not (fresh or historical):
+                    self._count('stale_hits')
+                self._count('bytes_saved', _frame_bytes(result))
+                return result if not result.empty else None
+
+            refreshed = self._delta_refresh(stock_code, cached, meta, end_date, fetcher, fqt, refresh_meta)
+            if refreshed is not None:
+                result = refreshed.loc[start_ts:end_ts]
+                return result if not result.empty else None
+        elif fetcher is None:
+            self._count('misses')
+            return None
+
+        # 全量下载
+        self._count('misses')
+        self._count('full_refreshes')
+        df = fetcher(start_date, end_date)
+        if df is None or df.empty:
+            return None
+
+        self.save(stock_code, df, {
+            'stock_code': stock_code,
+            'fqt': fqt,
+            'beg': start_date,
+            'last_date': df.index[-1].strftime('%Y%m%d'),
+            **refresh_meta,
+        }, fqt)
+        return df.loc[start_ts:end_ts]
+
+    def _delta_refresh(self, stock_code, cached, meta, end_date, fetcher, fqt, refresh_meta):
+        """
+        只下载最后缓存日之后的数据并追加
+
+        重新下载最后两根K线：倒数第二根用于校验复权价格是否变化（变化则返回None触发全量下载），
+        最后一根可能是盘中未收盘的数据，直接用新数据覆盖
+        """
+        anchor_pos = max(0, len(cached) - 2)
+        anchor_date = cached.index[anchor_pos]
+
+        delta = fetcher(anchor_date.strftime('%Y%m%d'), end_date)
+        if delta is None or delta.empty:
+            # 没有新数据，记录本次刷新时间
+            meta = dict(meta, **refresh_meta)
+            self.save(stock_code, cached, meta, fqt)
+            self._count('hits')
+            self._count('bytes_saved', _frame_bytes(cached))
+            return cached
+
+        if anchor_date in delta.index and 'Close' in delta.columns:
+            old_close = float(cached['Close'].iloc[anchor_pos])
+            new_close = float(delta.loc[anchor_date, 'Close'])
+            if not np.isclose(old_close, new_close, rtol=1e-6, atol=1e-9):
+                print(f"[缓存] {stock_code} 复权价格已变化，重新全量下载")
+                return None
+
+        kept = cached.loc[cached.index < delta.index[0]]
+        merged = pd.concat([kept, delta.reindex(columns=cached.columns.union(delta.columns, sort=False))])
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+
+        self.save(stock_code, merged, dict(
+            meta,
+            last_date=merged.index[-1].strftime('%Y%m%d'),
+            **refresh_meta,
+        ), fqt)
+
+        self._count('hits')
+        self._count('delta_refreshes')
+        self._count('bytes_saved', _frame_bytes(kept))
+        return merged
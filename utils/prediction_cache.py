@@ -0,0 +1,343 @@
+# utils/prediction_cache.py
+"""
+预测结果缓存
+
+同一只股票在出现新K线之前，用同一个模型预测的结果不会变化。缓存键为
+(股票代码, 窗口大小, 最新K线日期, 模型版本, 结果格式)，两级存储：
+
+- 内存：有界 LRU（OrderedDict），进程内所有会话/线程共享
+- 磁盘（可选）：每个条目一个 pickle 文件，先写临时文件再替换；多个 app 进程可共享
+
+- 收盘后的K线不再变化，条目默认不过期（ttl=None）；当天未收盘的K线可能还在变化，
+  使用较短的 intraday_ttl
+- 同一个键同时只计算一次：并发请求同一热门股票时，其余请求等待第一个请求的结果
+- invalidate 按股票或模型版本删除条目（模型更新后调用），stats() 返回命中率等统计
+"""
+import os
+import glob
+import pickle
+import hashlib
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from datetime import datetime, time as dtime
+
+import pandas as pd
+
+PredictionKey = namedtuple('PredictionKey', ['stock_code', 'window_size', 'last_bar_date', 'model_version', 'variant'])
+
+# A股交易时段（上午、下午），当天K线在收盘前可能仍在变化
+TRADING_SESSIONS = ((dtime(9, 30), dtime(11, 30)), (dtime(13, 0), dtime(15, 0)))
+MARKET_CLOSE = TRADING_SESSIONS[-1][1]
+
+
+def make_key(stock_code, window_size, last_bar_date, model_version, variant='single'):
+    """构造缓存键（last_bar_date 统一为 'YYYY-MM-DD' 字符串）"""
+    return PredictionKey(str(stock_code), int(window_size), pd.Timestamp(last_bar_date).strftime('%Y-%m-%d'),
+                         str(model_version), variant)
+
+
+def bar_in_progress(last_bar_date, now=None):
+    """最新K线是否可能仍在变化（当天且未收盘）"""
+    now = now or datetime.now()
+    return pd.Timestamp(last_bar_date).date() >= now.date() and now.time() < MARKET_CLOSE
+
+
+def trading_epoch(now=None, intraday_minutes=5):
+    """
+    行情可能发生变化的时间段标识，可作为缓存键的一部分
+
+    - 交易时段内每 intraday_minutes 分钟变化一次（午间休市期间保持上午收盘时的值）
+    - 收盘后到下一个交易日开盘前保持不变（周末视为非交易日，节假日按工作日处理）
+    """
+    now = now or datetime.now()
+    today, t = now.date(), now.time()
+    if today.weekday() < 5 and TRADING_SESSIONS[0][0] <= t < MARKET_CLOSE:
+        if TRADING_SESSIONS[0][1] <= t < TRADING_SESSIONS[1][0]:
+            t = TRADING_SESSIONS[0][1]
+        minute = (t.hour * 60 + t.minute) // intraday_minutes * intraday_minutes
+        return f"{today:%Y-%m-%d} {minute // 60:02d}:{minute % 60:02d}"
+    if today.weekday() >= 5 or t < TRADING_SESSIONS[0][0]:
+        # 上一个交易日收盘
+        today = (pd.Timestamp(today) - pd.offsets.BDay(1)).date()
+    return f"{today:%Y-%m-%d} close"
+
+
+# ============================================================================
+# 模型指纹
+# ============================================================================
+
+_MODEL_DIGESTS = weakref.WeakKeyDictionary()
+_MODEL_DIGESTS_LOCK = threading.Lock()
+
+
+def _model_digest(model):
+    """单个模型序列化后的SHA256（按对象缓存，同一模型只计算一次）"""
+    with _MODEL_DIGESTS_LOCK:
+        try:
+            digest = _MODEL_DIGESTS.get(model)
+        except TypeError:
+            digest = None
+    if digest is None:
+        digest = hashlib.sha256(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+        with _MODEL_DIGESTS_LOCK:
+            try:
+                _MODEL_DIGESTS[model] = digest
+            except TypeError:
+                pass
+    return digest
+
+
+def model_fingerprint(model, all_models_data=None, feature_list=None):
+    """
+    模型的版本指纹（没有制品包版本号时使用）
+
+    由各模型序列化内容、阈值和特征列表计算，重新训练或更换模型后指纹随之变化
+    """
+    digest = hashlib.sha256()
+    digest.update(_model_digest(model).encode())
+    for name in sorted(all_models_data or {}):
+        model_data = all_models_data[name]
+        digest.update(name.encode())
+        digest.update(_model_digest(model_data['model']).encode())
+        digest.update(repr(model_data.get('optimal_threshold')).encode())
+    if feature_list is not None:
+        digest.update('\n'.join(map(str, feature_list)).encode())
+    return digest.hexdigest()[:16]
+
+
+# ============================================================================
+# 缓存
+# ============================================================================
+
+class PredictionCache:
+    """
+    两级（内存LRU + 可选磁盘）预测结果缓存，线程安全
+
+    参数:
+    max_entries: 内存中最多保留的条目数，超出时淘汰最久未使用的条目
+    ttl: 已收盘K线的条目有效期（秒），None 表示直到失效或被淘汰
+    intraday_ttl: 当天未收盘K线的条目有效期（秒）
+    disk_dir: 磁盘缓存目录，None 表示只使用内存
+    clock: 返回当前时间戳的函数（便于测试）
+    """
+
+    def __init__(self, max_entries=512, ttl=None, intraday_ttl=300, disk_dir=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.intraday_ttl = intraday_ttl
+        self.disk_dir = disk_dir
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'puts': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'inflight_waits': 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, key, value=1):
+        self.stats_counters[key] += value
+
+    def ttl_for(self, key):
+        """条目有效期：当天未收盘的K线使用 intraday_ttl"""
+        if bar_in_progress(key.last_bar_date, datetime.fromtimestamp(self.clock())):
+            return self.intraday_ttl
+        return self.ttl
+
+    # ------------------------------------------------------------------
+    # 磁盘
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _digest(value):
+        return hashlib.sha1(repr(value).encode()).hexdigest()[:16]
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key.stock_code}_{self._digest(key.model_version)[:8]}_{self._digest(tuple(key))}.pkl")
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored_key, expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None, None
+        if stored_key != key:
+            return None, None
+        if expires_at is not None and expires_at <= self.clock():
+            self._remove_file(path)
+            with self._lock:
+                self._count('expirations')
+            return None, None
+        return value, expires_at
+
+    def _disk_put(self, key, value, expires_at):
+        path = self._disk_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, expires_at, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self._remove_file(tmp_path)
+            print(f"[预测缓存] 写入磁盘失败: {e}")
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+
+    def get(self, key):
+        """读取条目，不存在或已过期时返回None"""
+        value = self._lookup(key)
+        if value is None:
+            with self._lock:
+                self._count('misses')
+        return value
+
+    def _lookup(self, key):
+        """依次查找内存和磁盘（命中时计数，未命中不计数）"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count('hits')
+                    return value
+                del self._entries[key]
+                self._count('expirations')
+
+        if self.disk_dir:
+            value, expires_at = self._disk_get(key)
+            if value is not None:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self._count('disk_hits')
+                return value
+        return None
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count('evictions')
+
+    def put(self, key, value, ttl='auto'):
+        """写入条目；ttl='auto' 时按 ttl_for(key) 确定有效期"""
+        if ttl == 'auto':
+            ttl = self.ttl_for(key)
+        expires_at = None if ttl is None else self.clock() + ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+            self._count('puts')
+        if self.disk_dir:
+            self._disk_put(key, value, expires_at)
+
+    def get_or_compute(self, key, compute, ttl='auto'):
+        """
+        读取条目，未命中时调用 compute() 计算并写入（compute 返回None时不缓存）
+
+        同一个键同时只有一个线程执行 compute，其余线程等待其结果
+        """
+        while True:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    self._count('misses')
+                    owner = True
+                else:
+                    owner = False
+                    self._count('inflight_waits')
+            if owner:
+                break
+            event.wait()
+            # 计算结果为None（或计算失败）时重新检查，由下一个线程负责计算
+
+        try:
+            value = compute()
+            if value is not None:
+                self.put(key, value, ttl)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    # ------------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------------
+
+    def invalidate(self, stock_code=None, model_version=None):
+        """
+        删除匹配的条目（都为None时清空缓存），返回删除的内存条目数
+
+        例如模型更新后调用 invalidate(model_version=旧版本)，除权除息后调用 invalidate(stock_code)
+        """
+        def matches(key):
+            return ((stock_code is None or key.stock_code == str(stock_code))
+                    and (model_version is None or key.model_version == str(model_version)))
+
+        with self._lock:
+            keys = [key for key in self._entries if matches(key)]
+            for key in keys:
+                del self._entries[key]
+            self._count('invalidations', len(keys))
+
+        if self.disk_dir:
+            pattern = f"{stock_code if stock_code is not None else '*'}_"
+            pattern += f"{self._digest(str(model_version))[:8]}_*.pkl" if model_version is not None else "*.pkl"
+            for path in glob.glob(os.path.join(self.disk_dir, pattern)):
+                self._remove_file(path)
+        return len(keys)
+
+    def retain_model_version(self, model_version):
+        """只保留指定模型版本的条目（切换模型后清理旧版本），返回删除的内存条目数"""
+        version = str(model_version)
+        with self._lock:
+            stale = {key.model_version for key in self._entries if key.model_version != version}
+        removed = sum(self.invalidate(model_version=v) for v in stale)
+        if self.disk_dir:
+            keep = self._digest(version)[:8]
+            for path in glob.glob(os.path.join(self.disk_dir, '*.pkl')):
+                if os.path.basename(path).rsplit('_', 2)[-2] != keep:
+                    self._remove_file(path)
+        return removed
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        """命中/未命中等计数、命中率与当前条目数"""
+        with self._lock:
+            result = dict(self.stats_counters)
+            result['size'] = len(self._entries)
+        lookups = result['hits'] + result['disk_hits'] + result['misses']
+        result['hit_rate'] = (result['hits'] + result['disk_hits']) / lookups if lookups else 0.0
+        return result
@@ -4,6 +4,8 @@ import pywt
 import numpy as np
 import matplotlib.pyplot as plt
 
+from utils.wavelet_denoise import causal_wavelet_denoising
+
 # -------------------------------------------------------------------------------------------
 # Wavelet denoising
 #
@@ -16,7 +18,11 @@ def pad_data(data, pad_width, mode='edge'):
     return np.pad(data, pad_width, mode=mode)
 
 # Wavelet denoising function with parameterisation for wavelet type and decomposition level
-def wavelet_denoising(data, wavelet='db4', level=1):
+# causal=True uses only past data for every output value (no look-ahead), see
+# utils.wavelet_denoise.StreamingWaveletDenoiser
+def wavelet_denoising(data, wavelet='db4', level=1, causal=False):
+    if causal:
+        return causal_wavelet_denoising(np.asarray(data, dtype=float), wavelet, level)
     # Padding with a width of 100
     padded_data = pad_data(data, pad_width=100, mode='edge')
     # Decompose signal using Wavelet Transform
@@ -6,7 +6,16 @@ import warnings
 from scipy import stats
 from tqdm import tqdm
 import math
-from utils.wavelet_denoise import wavelet_denoising, ensure_length_match
+import time
+from numpy.lib.stride_tricks import sliding_window_view
+from utils.wavelet_denoise import wavelet_denoising, wavelet_denoising_batch, ensure_length_match
+
+# 可选的Numba编译路径（不可用时使用纯NumPy实现）
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # 忽略警告
 warnings.filterwarnings("ignore")
@@ -341,28 +350,7 @@ def add_advanced_momentum_indicators(df):
     df['TSI'] = 100 * momentum_smooth2 / abs_momentum_smooth2
     
     # 添加CMO (Chande Momentum Oscillator)
-    # 收盘价上涨和下跌的绝对值之和
-    up_sum = np.zeros(len(df))
-    down_sum = np.zeros(len(df))
-    
-    # 计算上涨和下跌
-    for i in range(1, len(df)):
-        change = df['Close'].iloc[i] - df['Close'].iloc[i-1]
-        if change > 0:
-            up_sum[i] = change
-        else:
-            down_sum[i] = abs(change)
-    
-    # 转换为Series以便使用rolling
-    up_sum_series = pd.Series(up_sum)
-    down_sum_series = pd.Series(down_sum)
-    
-    # 计算14天上涨和下跌之和
-    up_sum_14 = up_sum_series.rolling(window=14).sum()
-    down_sum_14 = down_sum_series.rolling(window=14).sum()
-    
-    # 计算CMO
-    df['CMO'] = 100 * ((up_sum_14 - down_sum_14) / (up_sum_14 + down_sum_14))
+    df['CMO'] = chande_momentum_oscillator(df['Close'], window=14)
     
     # 添加Fisher Transform应用于RSI
     if 'RSI' in df.columns:
@@ -392,6 +380,92 @@ def add_advanced_momentum_indicators(df):
     
     return df
 
+def chande_momentum_oscillator(close, window=14):
+    """
+    CMO (Chande Momentum Oscillator)，向量化实现
+
+    上涨幅度之和与下跌幅度之和由收盘价差分一次得到（第一天均为0），再做滚动求和
+
+    参数:
+    close: 收盘价Series，或NumPy数组（融合计算引擎直接传入数组）
+    window: 滚动窗口，默认为14
+
+    返回:
+    与close索引相同的CMO Series；传入数组时返回数组
+    """
+    values = np.asarray(close, dtype=float)
+    change = np.empty_like(values)
+    change[:1] = 0.0
+    change[1:] = values[1:] - values[:-1]
+    up = np.where(change > 0, change, 0.0)
+    down = np.where(change > 0, 0.0, np.abs(change))
+
+    up_sum = pd.Series(up).rolling(window=window).sum().to_numpy()
+    down_sum = pd.Series(down).rolling(window=window).sum().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cmo = 100 * ((up_sum - down_sum) / (up_sum + down_sum))
+    if isinstance(close, pd.Series):
+        return pd.Series(cmo, index=close.index)
+    return cmo
+
+def _winner_count_numpy(close, window, factor):
+    """
+    滑动窗口内大于 窗口最后一个值×factor 的个数（纯NumPy，基于滑动窗口视图）
+    """
+    out = np.full(len(close), np.nan)
+    if len(close) >= window:
+        windows = sliding_window_view(close, window)
+        counts = np.sum(windows > windows[:, -1:] * factor, axis=1).astype(float)
+        out[window - 1:] = np.where(np.isnan(windows).any(axis=1), np.nan, counts)
+    return out
+
+if NUMBA_AVAILABLE:
+    @njit
+    def _winner_count_numba(close, window, factor):
+        n = len(close)
+        out = np.full(n, np.nan)
+        for i in range(window - 1, n):
+            threshold = close[i] * factor
+            count = 0
+            has_nan = False
+            for j in range(i - window + 1, i + 1):
+                value = close[j]
+                if np.isnan(value):
+                    has_nan = True
+                    break
+                if value > threshold:
+                    count += 1
+            if not has_nan:
+                out[i] = count
+        return out
+
+def winner_close_count(close, window=3, factor=1.0, engine='auto'):
+    """
+    WINNER_CLOSE计数：滚动窗口内收盘价大于当日收盘价×factor的天数
+
+    等价于 close.rolling(window).apply(lambda x: np.sum(x > x[-1] * factor), raw=True)，
+    窗口内有NaN或不足window天时为NaN
+
+    参数:
+    close: 收盘价Series或数组
+    window: 滚动窗口，默认为3
+    factor: 当日收盘价的倍数
+    engine: 'numba'、'numpy' 或 'auto'（Numba可用时使用Numba）
+
+    返回:
+    与输入等长的float数组
+    """
+    values = np.ascontiguousarray(np.asarray(close, dtype=float))
+    if engine == 'auto':
+        engine = 'numba' if NUMBA_AVAILABLE else 'numpy'
+    if engine == 'numba':
+        if not NUMBA_AVAILABLE:
+            raise ImportError("未安装numba，请使用 engine='numpy'")
+        return _winner_count_numba(values, window, float(factor))
+    if engine == 'numpy':
+        return _winner_count_numpy(values, window, factor)
+    raise ValueError(f"不支持的engine: {engine}")
+
 def add_technical_indicators(df):
     """
     添加所有技术指标
@@ -423,12 +497,425 @@ def add_technical_indicators(df):
     
     return df
 
+# ----------------------------------------------------------------------------
+# 融合指标引擎：基于共享中间数组一次性计算 add_technical_indicators 的全部指标
+# ----------------------------------------------------------------------------
+
+# 与 add_technical_indicators 添加顺序一致的指标列（相关性指标按数据列是否存在插入）
+TECHNICAL_INDICATOR_COLUMNS = [
+    'MA5', 'MA10', 'MA20', 'MA50', 'MA100', 'MA200', 'AVG_VOL', 'AVG_TR', 'EMA_12', 'EMA_26',
+    'Denoised_PriceChange', 'Momentum', 'Volatility', 'ROC',
+    'STD', 'Upper_Band', 'Lower_Band', '%B',
+    'MACD', 'Signal',
+    'K', 'D', 'J', 'Stoch_K', 'Stoch_D',
+    'DI_plus', 'DI_minus', 'ADX',
+    'VWAP', 'MFI', 'AD', 'OBV',
+    'TRIX', 'TEMA', 'Williams_R', 'ATR', 'CCI', 'RSI',
+    'HV_20', 'GK_Volatility', 'Vol_Ratio', 'TR', 'TR_ROC', 'UD_Ratio', 'Normalized_ATR',
+    'BB_Width', 'Amplitude', 'Price_Up', 'Up_Days_Ratio', 'Extreme_Day', 'Extreme_Days_Count',
+    'Overbought', 'Oversold', 'OB_OS_Signal', 'Trend_Strength',
+    'TSI', 'CMO', 'Fisher_Transform_RSI', 'KST', 'KST_Signal'
+]
+
+def technical_indicator_columns(df):
+    """
+    返回 compute_technical_indicators 对该DataFrame输出的指标列（顺序与 add_technical_indicators 一致）
+    """
+    columns = list(TECHNICAL_INDICATOR_COLUMNS)
+    correlation = []
+    if 'high_industry_index' in df.columns:
+        correlation += ['Stock_Industry_RS', 'Industry_Correlation']
+    if 'close_SZ_index' in df.columns:
+        correlation += ['Stock_SZ_RS', 'SZ_Correlation']
+    position = columns.index('RSI') + 1
+    return columns[:position] + correlation + columns[position:]
+
+def _cumsum_with_nan(x):
+    """
+    前置0的累计和及NaN计数，供 _rolling_sum 复用
+    """
+    nan = np.isnan(x)
+    total = np.concatenate([[0.0], np.cumsum(np.where(nan, 0.0, x))])
+    nan_count = np.concatenate([[0], np.cumsum(nan)])
+    return total, nan_count
+
+def _rolling_sum(x, window, cumsum=None):
+    """
+    与 Series.rolling(window).sum() 相同的滚动和（窗口内有NaN或不足window个值时为NaN）
+
+    cumsum: _cumsum_with_nan(x) 的结果，多个窗口共用同一个累计和
+    """
+    total, nan_count = cumsum if cumsum is not None else _cumsum_with_nan(x)
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        sums = total[window:] - total[:-window]
+        valid = (nan_count[window:] - nan_count[:-window]) == 0
+        out[window - 1:] = np.where(valid, sums, np.nan)
+    return out
+
+def _rolling_mean(x, window, cumsum=None):
+    return _rolling_sum(x, window, cumsum) / window
+
+def _rolling_reduce(x, window, func, **kwargs):
+    """
+    在滑动窗口视图上按行归约（min/max/std等），前 window-1 个值为NaN
+    """
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = func(sliding_window_view(x, window), axis=1, **kwargs)
+    return out
+
+def _rolling_std(x, window):
+    """与 Series.rolling(window).std() 相同（ddof=1）"""
+    return _rolling_reduce(x, window, np.std, ddof=1)
+
+def _rolling_corr(x, y, window):
+    """与 Series.rolling(window).corr(other) 相同的滚动相关系数"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        xw = sliding_window_view(x, window)
+        yw = sliding_window_view(y, window)
+        xd = xw - xw.mean(axis=1, keepdims=True)
+        yd = yw - yw.mean(axis=1, keepdims=True)
+        denom = np.sqrt((xd ** 2).sum(axis=1) * (yd ** 2).sum(axis=1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[window - 1:] = np.where(denom > 0, (xd * yd).sum(axis=1) / denom, np.nan)
+    return out
+
+def _shift(x, periods=1):
+    out = np.full(len(x), np.nan)
+    if len(x) > periods:
+        out[periods:] = x[:-periods]
+    return out
+
+def _pct_change(x, periods=1):
+    """与 Series.pct_change(periods) 相同（先向前填充NaN）"""
+    valid = ~np.isnan(x)
+    filled = x[np.maximum.accumulate(np.where(valid, np.arange(len(x)), 0))] if valid.any() else x
+    filled = np.where(np.maximum.accumulate(valid), filled, np.nan)
+    return filled / _shift(filled, periods) - 1
+
+def _ewm(x, span):
+    """与 Series.ewm(span=span, adjust=False).mean() 相同"""
+    return pd.Series(x).ewm(span=span, adjust=False).mean().to_numpy()
+
+def compute_technical_indicators(df, dtype=np.float32, denoise=True):
+    """
+    融合指标引擎：一次性计算 add_technical_indicators 的全部指标
+
+    所有指标基于共享的中间结果计算（收盘价等的累计和用于全部滚动均值/滚动和，
+    滑动窗口视图用于滚动标准差/最值，收益率只计算一次），写入预分配的二维数组后
+    一次构建DataFrame，避免逐列插入导致的碎片化和复制；小波降噪在同参数的列上批量执行
+
+    与 add_technical_indicators 的区别：不修改输入df；指标列为dtype类型
+
+    参数:
+    df: 包含 Open/High/Low/Close/Volume/TurnoverRate 的DataFrame
+    dtype: 指标列的数据类型，默认为float32
+    denoise: 是否对 Denoised_PriceChange/Momentum/MACD/Signal 进行小波降噪（与原实现一致）
+
+    返回:
+    原始列 + 指标列的DataFrame（列顺序与 add_technical_indicators 相同，NaN同样先bfill再填0）
+    """
+    n = len(df)
+    columns = technical_indicator_columns(df)
+    position = {name: i for i, name in enumerate(columns)}
+    block = np.empty((n, len(columns)), dtype=dtype)
+
+    def put(name, values):
+        block[:, position[name]] = values
+
+    open_ = df['Open'].to_numpy(dtype=float)
+    high = df['High'].to_numpy(dtype=float)
+    low = df['Low'].to_numpy(dtype=float)
+    close = df['Close'].to_numpy(dtype=float)
+    volume = df['Volume'].to_numpy(dtype=float)
+    turnover = df['TurnoverRate'].to_numpy(dtype=float)
+
+    # 共享中间结果
+    close_cumsum = _cumsum_with_nan(close)
+    prev_close = _shift(close)
+    returns = _pct_change(close)
+    delta = close - prev_close
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 移动平均线
+        ma = {w: _rolling_mean(close, w, close_cumsum) for w in (5, 10, 20, 50, 100, 200)}
+        for w in (5, 10, 20, 50, 100, 200):
+            put(f'MA{w}', ma[w])
+        put('AVG_VOL', _rolling_mean(volume, 10))
+        put('AVG_TR', _rolling_mean(turnover, 10))
+        put('EMA_12', talib.EMA(close, timeperiod=12))
+        put('EMA_26', talib.EMA(close, timeperiod=26))
+
+        # 价格指标
+        momentum = close - _shift(close, 5)
+        std20 = _rolling_std(close, 20)
+        put('Volatility', std20 / ma[20])
+        put('ROC', _pct_change(close, 10) * 100)
+
+        # 布林带
+        upper = ma[20] + std20 * 2.5
+        lower = ma[20] - std20 * 2.5
+        put('STD', std20)
+        put('Upper_Band', upper)
+        put('Lower_Band', lower)
+        put('%B', (close - lower) / (upper - lower))
+
+        # MACD
+        macd = _ewm(close, 12) - _ewm(close, 26)
+        signal = _ewm(macd, 9)
+
+        # 小波降噪（同参数的列一次批量处理）
+        if denoise:
+            put('Denoised_PriceChange', wavelet_denoising_batch(np.nan_to_num(returns, nan=0.0), wavelet='sym8', level=2))
+            db4 = wavelet_denoising_batch(np.nan_to_num(np.column_stack([momentum, macd, signal]), nan=0.0),
+                                          wavelet='db4', level=1)
+            put('Momentum', db4[:, 0])
+            put('MACD', db4[:, 1])
+            put('Signal', db4[:, 2])
+        else:
+            put('Denoised_PriceChange', returns)
+            put('Momentum', momentum)
+            put('MACD', macd)
+            put('Signal', signal)
+
+        # KDJ 与随机振荡器
+        low_min9 = _rolling_reduce(low, 9, np.min)
+        high_max9 = _rolling_reduce(high, 9, np.max)
+        k = 100 * ((close - low_min9) / (high_max9 - low_min9))
+        d = _rolling_mean(k, 3)
+        stoch_k = 100 * (close - low_min9) / (high_max9 - low_min9)
+        put('K', k)
+        put('D', d)
+        put('J', 3 * k - 2 * d)
+        put('Stoch_K', stoch_k)
+        put('Stoch_D', _rolling_mean(stoch_k, 3))
+
+        # DMI
+        put('DI_plus', talib.PLUS_DI(high, low, close, timeperiod=14))
+        put('DI_minus', talib.MINUS_DI(high, low, close, timeperiod=14))
+        put('ADX', talib.ADX(high, low, close, timeperiod=14))
+
+        # 成交量指标
+        put('VWAP', _rolling_sum(close * volume, 20) / _rolling_sum(volume, 20))
+        put('MFI', talib.MFI(high, low, close, volume, timeperiod=14))
+        put('AD', talib.AD(high, low, close, volume))
+        put('OBV', talib.OBV(close, volume))
+
+        # 其他指标
+        put('TRIX', talib.TRIX(close, timeperiod=30))
+        put('TEMA', talib.TEMA(close, timeperiod=30))
+        highest_high = _rolling_reduce(high, 14, np.max)
+        lowest_low = _rolling_reduce(low, 14, np.min)
+        put('Williams_R', -100 * (highest_high - close) / (highest_high - lowest_low))
+        atr = talib.ATR(high, low, close, timeperiod=14)
+        put('ATR', atr)
+        put('CCI', talib.CCI(high, low, close, timeperiod=14))
+        rsi = talib.RSI(close, timeperiod=14)
+        put('RSI', rsi)
+
+        # 相关性指标
+        if 'high_industry_index' in df.columns:
+            industry = df['close_industry_index'].to_numpy(dtype=float)
+            put('Stock_Industry_RS', close / industry)
+            put('Industry_Correlation', _rolling_corr(close, industry, 20))
+        if 'close_SZ_index' in df.columns:
+            sz_index = df['close_SZ_index'].to_numpy(dtype=float)
+            put('Stock_SZ_RS', close / sz_index)
+            put('SZ_Correlation', _rolling_corr(close, sz_index, 20))
+
+        # 波动率指标
+        returns_std20 = _rolling_std(returns, 20)
+        put('HV_20', returns_std20 * np.sqrt(252))
+        gk = 0.5 * np.log(high / low) ** 2 - (2 * np.log(2) - 1) * np.log(close / open_) ** 2
+        put('GK_Volatility', np.sqrt(_rolling_mean(gk, 20) * 252))
+        put('Vol_Ratio', _rolling_std(returns, 10) / _rolling_std(returns, 30))
+        true_range = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+        put('TR', true_range)
+        put('TR_ROC', _pct_change(true_range, 5) * 100)
+        ud_ratio = np.where(close > prev_close, volume, 0) / np.where(close < prev_close, volume, 1)
+        ud_ratio = np.where(np.isfinite(ud_ratio), ud_ratio, 1.0)
+        put('UD_Ratio', _rolling_mean(ud_ratio, 10))
+        put('Normalized_ATR', atr / close)
+
+        # 市场情绪指标
+        put('BB_Width', (upper - lower) / ma[20])
+        amplitude = (high - low) / prev_close * 100
+        put('Amplitude', amplitude)
+        price_up = (close > prev_close).astype(float)
+        put('Price_Up', price_up)
+        put('Up_Days_Ratio', _rolling_sum(price_up, 20) / 20)
+        extreme_day = (amplitude > 2 * _rolling_mean(amplitude, 20)).astype(float)
+        put('Extreme_Day', extreme_day)
+        put('Extreme_Days_Count', _rolling_sum(extreme_day, 20))
+        overbought = (rsi > 80).astype(float)
+        oversold = (rsi < 20).astype(float)
+        put('Overbought', overbought)
+        put('Oversold', oversold)
+        put('OB_OS_Signal', overbought - oversold)
+        put('Trend_Strength', np.abs(_pct_change(close, 20)) / (returns_std20 * np.sqrt(20)))
+
+        # 高级动量指标
+        put('TSI', 100 * _ewm(_ewm(delta, 25), 13) / _ewm(_ewm(np.abs(delta), 25), 13))
+        put('CMO', chande_momentum_oscillator(close, window=14))
+        scaled_rsi = 2 * (rsi / 100 - 0.5)
+        fisher = 0.5 * np.log((1 + scaled_rsi) / (1 - scaled_rsi))
+        put('Fisher_Transform_RSI', np.where(np.isfinite(fisher), fisher, 0.0))
+        kst = (1 * _rolling_mean(_pct_change(close, 10), 10) + 2 * _rolling_mean(_pct_change(close, 15), 10)
+               + 3 * _rolling_mean(_pct_change(close, 20), 10) + 4 * _rolling_mean(_pct_change(close, 30), 15))
+        put('KST', kst)
+        put('KST_Signal', _rolling_mean(kst, 9))
+
+    # 一次构建DataFrame：已存在的同名列原位替换，新列追加在末尾
+    indicators = pd.DataFrame(block, index=df.index, columns=columns)
+    existing = [name for name in columns if name in df.columns]
+    base = df.copy()
+    if existing:
+        base[existing] = indicators[existing]
+    result = pd.concat([base, indicators.drop(columns=existing)], axis=1)
+
+    # 填充NaN值
+    return result.bfill().fillna(0)
+
+def compare_indicator_engines(df, dtype=np.float64, rtol=1e-7):
+    """
+    对比融合引擎与 add_technical_indicators 的结果
+
+    逐列计算最大误差，误差按 rtol × max(1, 该列最大绝对值) 判定
+
+    返回:
+    DataFrame: 每个指标列的最大绝对误差、允许误差和是否一致
+    """
+    reference = add_technical_indicators(df.copy())
+    fused = compute_technical_indicators(df, dtype=dtype)
+
+    rows = []
+    for col in technical_indicator_columns(df):
+        expected = reference[col].to_numpy(dtype=float)
+        actual = fused[col].to_numpy(dtype=float)
+        tolerance = rtol * max(1.0, float(np.nanmax(np.abs(expected))) if len(expected) else 1.0)
+        max_error = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+        rows.append({'column': col, 'max_abs_error': max_error, 'tolerance': tolerance,
+                     'match': max_error <= tolerance})
+    assert list(fused.columns) == list(reference.columns), "列顺序不一致"
+    return pd.DataFrame(rows)
+
+def _make_synthetic_ohlcv(n_days, seed=0):
+    """
+    生成用于基准测试的随机日线数据
+    """
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+    open_ = close * (1 + rng.normal(0, 0.005, n_days))
+    return pd.DataFrame({
+        'Open': open_,
+        'Close': close,
+        'High': np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n_days)),
+        'Low': np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n_days)),
+        'Volume': rng.integers(1e5, 1e7, n_days).astype(float),
+        'TurnoverRate': rng.uniform(0.1, 5, n_days),
+    }, index=pd.bdate_range('2000-01-03', periods=n_days))
+
+def benchmark_technical_indicators(day_counts=(250, 1000, 5000), repeat=3, dtype=np.float32):
+    """
+    对比融合引擎与原指标流水线的耗时，并校验结果一致（float64下校验）
+
+    返回:
+    DataFrame: 每种数据长度的两种实现耗时（取repeat次中的最小值）和加速比
+    """
+    rows = []
+    for n_days in day_counts:
+        df = _make_synthetic_ohlcv(n_days)
+
+        comparison = compare_indicator_engines(df)
+        mismatched = comparison.loc[~comparison['match'], 'column'].tolist()
+        assert not mismatched, f"指标不一致: {mismatched}"
+
+        pipeline_time = min(_time_call(add_technical_indicators, df.copy()) for _ in range(repeat))
+        engine_time = min(_time_call(compute_technical_indicators, df, dtype=dtype) for _ in range(repeat))
+
+        rows.append({
+            'days': n_days,
+            'pipeline_s': pipeline_time,
+            'engine_s': engine_time,
+            'speedup': pipeline_time / engine_time if engine_time > 0 else np.nan
+        })
+        print(f"[基准] {n_days}天: 原流水线={pipeline_time:.4f}s, 融合引擎={engine_time:.4f}s")
+
+    return pd.DataFrame(rows)
+
+def _time_call(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - t0
+
+def _cmo_loop(close, window=14):
+    """原始的逐行循环CMO实现（仅用于基准对比）"""
+    up_sum = np.zeros(len(close))
+    down_sum = np.zeros(len(close))
+    for i in range(1, len(close)):
+        change = close.iloc[i] - close.iloc[i-1]
+        if change > 0:
+            up_sum[i] = change
+        else:
+            down_sum[i] = abs(change)
+    up_sum_14 = pd.Series(up_sum, index=close.index).rolling(window=window).sum()
+    down_sum_14 = pd.Series(down_sum, index=close.index).rolling(window=window).sum()
+    return 100 * ((up_sum_14 - down_sum_14) / (up_sum_14 + down_sum_14))
+
+def _winner_close_apply(close, window=3, factor=1.0):
+    """原始的 rolling.apply 实现（仅用于基准对比）"""
+    return close.rolling(window=window).apply(lambda x: np.sum(x > x[-1] * factor), raw=True).to_numpy()
+
+def benchmark_indicator_kernels(day_counts=(1000, 10000), repeat=5):
+    """
+    指标内核微基准：CMO 与 WINNER_CLOSE 系列计数，原实现 vs NumPy（及Numba）实现
+
+    每项先校验结果一致再计时（取repeat次中的最小值）
+
+    返回:
+    DataFrame: 每个指标、数据长度、实现的耗时及相对原实现的加速比
+    """
+    if NUMBA_AVAILABLE:
+        # 预热，排除JIT编译时间
+        winner_close_count(np.arange(5, dtype=float), engine='numba')
+
+    rows = []
+    for n_days in day_counts:
+        close = _make_synthetic_ohlcv(n_days)['Close']
+
+        kernels = {
+            'CMO': (lambda: _cmo_loop(close).to_numpy(),
+                    {'numpy': lambda: chande_momentum_oscillator(close).to_numpy()})
+        }
+        for name, factor in (('WINNER_CLOSE', 1.0), ('WINNER_CLOSE_1.1', 1.1), ('WINNER_CLOSE_0.9', 0.9)):
+            engines = {'numpy': lambda f=factor: winner_close_count(close, factor=f, engine='numpy')}
+            if NUMBA_AVAILABLE:
+                engines['numba'] = lambda f=factor: winner_close_count(close, factor=f, engine='numba')
+            kernels[name] = (lambda f=factor: _winner_close_apply(close, factor=f), engines)
+
+        for name, (legacy, engines) in kernels.items():
+            expected = legacy()
+            legacy_time = min(_time_call(legacy) for _ in range(repeat))
+            rows.append({'indicator': name, 'days': n_days, 'engine': 'legacy',
+                         'seconds': legacy_time, 'speedup': 1.0})
+
+            for engine, func in engines.items():
+                assert np.allclose(func(), expected, rtol=1e-12, atol=1e-12, equal_nan=True), f"{name} ({engine}) 结果不一致"
+                engine_time = min(_time_call(func) for _ in range(repeat))
+                rows.append({'indicator': name, 'days': n_days, 'engine': engine, 'seconds': engine_time,
+                             'speedup': legacy_time / engine_time if engine_time > 0 else np.nan})
+                print(f"[基准] {name} {n_days}天: 原实现={legacy_time:.4f}s, {engine}={engine_time:.5f}s")
+
+    return pd.DataFrame(rows)
+
 def add_chouma_indicators(data):
     # 计算PPSCM和SHCM
-    data['WINNER_CLOSE'] = data['Close'].rolling(window=3).apply(lambda x: np.sum(x > x[-1]), raw=True)
+    data['WINNER_CLOSE'] = winner_close_count(data['Close'], window=3, factor=1.0)
     data['PPSCM'] = data['WINNER_CLOSE'] * 70
-    data['WINNER_CLOSE_1.1'] = data['Close'].rolling(window=3).apply(lambda x: np.sum(x > x[-1] * 1.1), raw=True)
-    data['WINNER_CLOSE_0.9'] = data['Close'].rolling(window=3).apply(lambda x: np.sum(x > x[-1] * 0.9), raw=True)
+    data['WINNER_CLOSE_1.1'] = winner_close_count(data['Close'], window=3, factor=1.1)
+    data['WINNER_CLOSE_0.9'] = winner_close_count(data['Close'], window=3, factor=0.9)
     data['SHCM'] = (data['WINNER_CLOSE_1.1'] - data['WINNER_CLOSE_0.9']) * 80
     # 计算ZSHTL和TTSLKP
     data['ZSHTL'] = data['SHCM'] / (data['PPSCM'] + data['SHCM']) * 100
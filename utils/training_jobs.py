@@ -0,0 +1,389 @@
+# utils/training_jobs.py
+"""
+后台模型训练任务
+
+训练（下载行情 + TSFresh特征 + RF/XGB/LGBM）耗时数分钟，不能放在页面请求中同步执行。
+TrainingJobRunner 把 train_stock_prediction_model 提交到独立的进程池中运行：
+
+- 任务登记表：每个任务一个 JSON 文件（<bundle_dir>/.jobs/<job_id>.json），先写临时文件再替换，
+  训练进程在每个步骤开始时更新其中的阶段和进度，页面轮询 status() 即可显示进度
+- 训练完成后由 save_model_bundle 写入新版本并原子替换 CURRENT；在此之前 CURRENT
+  仍指向旧版本，页面继续使用旧模型
+- 同一时间只运行一个训练任务（共用同一 .jobs 目录的所有应用进程之间也是如此，提交时持有
+  .jobs/.submit.lock 检查登记表），重复提交返回正在排队或运行的任务
+- 进程池使用 spawn 方式启动子进程（不复制父进程中的线程和锁，Streamlit 下更安全）
+
+用法：
+    runner = TrainingJobRunner('models/bundle')
+    job = runner.submit(stock_codes=['600519', '000001'])
+    runner.status(job['job_id'])     # {'status': 'running', 'stage': 'extract', 'progress': 0.35, ...}
+    runner.wait(job['job_id'])       # {'status': 'succeeded', 'version': '20251004-205903-1a2b3c4d', ...}
+"""
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import contextlib
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+# 训练步骤：(阶段, 说明, 该阶段开始时的总进度)，与 train_stock_prediction_model 的进度回调对应
+TRAINING_STAGES = (
+    ('download', '下载行情数据', 0.00),
+    ('features', '构建窗口样本', 0.10),
+    ('extract', '提取TSFresh特征', 0.20),
+    ('select', '特征选择', 0.35),
+    ('train', '训练模型', 0.45),
+    ('evaluate', '评估模型', 0.90),
+    ('save', '保存制品包', 0.95),
+)
+_STAGE_INDEX = {stage: i for i, (stage, _, _) in enumerate(TRAINING_STAGES)}
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+ACTIVE_STATUSES = ('queued', 'running')
+JOBS_SUBDIR = '.jobs'
+# 排队超过该时长仍未被训练进程领取的任务视为遗留任务（秒）
+QUEUED_ORPHAN_SECONDS = 600
+SUBMIT_LOCK_FILE = '.submit.lock'
+# 锁文件超过该时长仍未释放时视为持有者已退出（秒），提交只持有锁很短的时间
+SUBMIT_LOCK_STALE_SECONDS = 60
+
+
+def stage_label(stage):
+    """阶段的中文说明"""
+    index = _STAGE_INDEX.get(stage)
+    return TRAINING_STAGES[index][1] if index is not None else (stage or '')
+
+
+def overall_progress(stage, progress=0.0):
+    """把阶段内进度（0~1）换算为整个训练流程的进度（0~1）"""
+    index = _STAGE_INDEX.get(stage)
+    if index is None:
+        return 0.0
+    start = TRAINING_STAGES[index][2]
+    end = TRAINING_STAGES[index + 1][2] if index + 1 < len(TRAINING_STAGES) else 1.0
+    return start + (end - start) * min(max(float(progress), 0.0), 1.0)
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _job_path(jobs_dir, job_id):
+    return os.path.join(jobs_dir, f"{job_id}.json")
+
+
+def _write_job(jobs_dir, record):
+    """原子写入任务记录"""
+    fd, tmp_path = tempfile.mkstemp(dir=jobs_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, _job_path(jobs_dir, record['job_id']))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_job(jobs_dir, job_id):
+    try:
+        with open(_job_path(jobs_dir, job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    """进程是否仍在运行（无权限发送信号说明进程存在）"""
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+def _is_orphaned(record, now=None):
+    """
+    未完成任务是否已无人执行：运行中的任务看训练进程是否存活，
+    排队中的任务（还没有训练进程）看排队时长
+    """
+    status = record.get('status')
+    if status == 'running' and record.get('pid'):
+        return not _pid_alive(record['pid'])
+    if status in ACTIVE_STATUSES:
+        try:
+            submitted = datetime.fromisoformat(record.get('submitted_at') or '')
+        except ValueError:
+            return True
+        age = ((now or datetime.now()) - submitted).total_seconds()
+        return age > QUEUED_ORPHAN_SECONDS
+    return False
+
+
+def _lock_is_stale(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            pid = f.read().strip()
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return False
+    return bool(pid and not _pid_alive(pid)) or age > SUBMIT_LOCK_STALE_SECONDS
+
+
+@contextlib.contextmanager
+def _submit_lock(jobs_dir, timeout=10.0):
+    """
+    跨进程的提交锁：以 O_EXCL 创建锁文件，写入持有者pid；持有者已退出时删除遗留的锁文件
+    """
+    path = os.path.join(jobs_dir, SUBMIT_LOCK_FILE)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if _lock_is_stale(path):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"等待训练任务提交锁超时: {path}")
+            time.sleep(0.05)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(str(os.getpid()))
+        yield
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+def _update_job(jobs_dir, job_id, **fields):
+    record = _read_job(jobs_dir, job_id) or {'job_id': job_id}
+    record.update(fields)
+    _write_job(jobs_dir, record)
+    return record
+
+
+def _run_training_job(job_id, jobs_dir, bundle_dir, train_kwargs):
+    """
+    训练进程中执行的任务（模块级函数，spawn 子进程可以按名称导入）
+
+    返回新的制品包版本号；训练失败时抛出异常
+    """
+    from stock_analysis_unified import train_stock_prediction_model
+
+    _update_job(jobs_dir, job_id, status='running', started_at=_now(), pid=os.getpid(),
+                stage=TRAINING_STAGES[0][0], stage_label=TRAINING_STAGES[0][1], progress=0.0)
+
+    def report(stage, progress, message=''):
+        _update_job(jobs_dir, job_id, stage=stage, stage_label=stage_label(stage),
+                    progress=round(overall_progress(stage, progress), 4), message=message)
+
+    saved = []
+    best_model, _, _ = train_stock_prediction_model(bundle_dir=bundle_dir, progress_callback=report,
+                                                    on_saved=saved.append, **train_kwargs)
+    if best_model is None:
+        raise RuntimeError("训练失败：没有可用的训练数据")
+    if not saved:
+        raise RuntimeError("训练完成但没有写入新的制品包版本")
+    return saved[-1]
+
+
+class TrainingJobRunner:
+    """
+    后台训练任务管理器（线程安全，每个应用进程一个实例）
+
+    参数:
+    bundle_dir: 模型制品包目录，训练完成后新版本写入此处并成为当前版本
+    jobs_dir: 任务登记表目录，默认 <bundle_dir>/.jobs（第一次提交任务时创建）
+    max_workers: 训练进程数（训练本身已使用多核，默认1）
+    on_complete: 任务结束（成功或失败）时在本进程中调用 on_complete(job)
+    """
+
+    def __init__(self, bundle_dir, jobs_dir=None, max_workers=1, on_complete=None):
+        self.bundle_dir = bundle_dir
+        self.jobs_dir = jobs_dir or os.path.join(bundle_dir, JOBS_SUBDIR)
+        self.max_workers = max_workers
+        self._callbacks = [on_complete] if on_complete else []
+        self._futures = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        self._mark_orphaned_jobs()
+
+    def _mark_orphaned_jobs(self):
+        """
+        上一个应用进程遗留的未完成任务已无法继续，标记为失败
+
+        其他仍在运行的应用进程提交的任务不受影响（训练进程存活，或排队时间很短）
+        """
+        for record in self.jobs():
+            if _is_orphaned(record):
+                _update_job(self.jobs_dir, record['job_id'], status='failed', finished_at=_now(),
+                            error='应用进程已退出，任务中断')
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _reset_executor(self, executor):
+        """
+        丢弃已损坏的进程池（子进程被杀死或崩溃后进程池不再接受任务），下次提交时重新创建
+
+        调用方可能是进程池的管理线程，不能等待进程池关闭
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def add_done_callback(self, callback):
+        """注册任务结束回调 callback(job)"""
+        self._callbacks.append(callback)
+
+    # ------------------------------------------------------------------
+    # 提交与查询
+    # ------------------------------------------------------------------
+
+    def submit(self, stock_codes, window_size=20, forecast_horizon=5, use_multi_models=True,
+               data_dir=None):
+        """
+        提交训练任务，立即返回任务记录；已有任务（包括其他应用进程提交的）在排队或运行时直接返回该任务
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with self._lock, _submit_lock(self.jobs_dir):
+            active = self._active_job_locked()
+            if active is not None:
+                return active
+
+            job_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+            train_kwargs = {
+                'stock_codes': list(stock_codes),
+                'window_size': window_size,
+                'forecast_horizon': forecast_horizon,
+                'use_multi_models': use_multi_models,
+                'data_dir': data_dir,
+            }
+            record = {
+                'job_id': job_id,
+                'status': 'queued',
+                'stage': None,
+                'stage_label': '排队中',
+                'progress': 0.0,
+                'message': '',
+                'params': train_kwargs,
+                'submitted_at': _now(),
+                'started_at': None,
+                'finished_at': None,
+                'version': None,
+                'error': None,
+            }
+            _write_job(self.jobs_dir, record)
+            try:
+                future = self._submit_locked(job_id, train_kwargs)
+            except Exception as e:
+                record = _update_job(self.jobs_dir, job_id, status='failed', finished_at=_now(),
+                                     error=f"无法启动训练进程: {e}")
+                return record
+            self._futures[job_id] = future
+            executor = self._executor
+        print(f"[训练任务] 已提交 {job_id}: {len(train_kwargs['stock_codes'])} 只股票")
+        future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, executor, f))
+        return record
+
+    def _submit_locked(self, job_id, train_kwargs):
+        args = (_run_training_job, job_id, self.jobs_dir, self.bundle_dir, train_kwargs)
+        try:
+            return self._get_executor().submit(*args)
+        except BrokenProcessPool:
+            # 上一个训练进程异常退出，进程池已损坏：换一个新的进程池重试一次
+            executor, self._executor = self._executor, None
+            executor.shutdown(wait=False, cancel_futures=True)
+            print("[训练任务] 进程池已损坏，重新创建")
+            return self._get_executor().submit(*args)
+
+    def _on_done(self, job_id, executor, future):
+        try:
+            version = future.result()
+            record = _update_job(self.jobs_dir, job_id, status='succeeded', finished_at=_now(),
+                                 progress=1.0, stage='done', stage_label='完成', version=version)
+            print(f"[训练任务] {job_id} 完成，新版本 {version}")
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._reset_executor(executor)
+            error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            record = _update_job(self.jobs_dir, job_id, status='failed', finished_at=_now(), error=error)
+            print(f"[训练任务] {job_id} 失败: {error}")
+        with self._lock:
+            self._futures.pop(job_id, None)
+        for callback in list(self._callbacks):
+            try:
+                callback(record)
+            except Exception as e:
+                print(f"[训练任务] 回调失败: {e}")
+
+    def status(self, job_id):
+        """任务记录（不存在时返回None）"""
+        return _read_job(self.jobs_dir, job_id)
+
+    def jobs(self, limit=None):
+        """所有任务记录，最新的在前"""
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        names = sorted((name for name in os.listdir(self.jobs_dir) if name.endswith('.json')), reverse=True)
+        records = []
+        for name in names[:limit]:
+            record = _read_job(self.jobs_dir, name[:-len('.json')])
+            if record is not None:
+                records.append(record)
+        return records
+
+    def _active_job_locked(self):
+        for record in self.jobs():
+            if record.get('status') not in ACTIVE_STATUSES:
+                continue
+            # 本进程的任务由 _on_done 结束；其他进程的任务看训练进程是否存活
+            if record['job_id'] in self._futures or not _is_orphaned(record):
+                return record
+        return None
+
+    def active_job(self):
+        """正在排队或运行的任务（包括其他应用进程提交的），没有时返回None"""
+        with self._lock:
+            return self._active_job_locked()
+
+    def latest_job(self):
+        """最近提交的任务，没有时返回None"""
+        records = self.jobs(limit=1)
+        return records[0] if records else None
+
+    def wait(self, job_id, timeout=None, poll_interval=0.5):
+        """等待任务结束并返回任务记录；超时返回当前记录"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            record = self.status(job_id)
+            if record is None or record.get('status') not in ACTIVE_STATUSES:
+                return record
+            if deadline is not None and time.monotonic() >= deadline:
+                return record
+            time.sleep(poll_interval)
+
+    def shutdown(self, wait=True):
+        """关闭进程池（wait=False 时不等待正在运行的训练）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
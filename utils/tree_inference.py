@@ -0,0 +1,572 @@
+# utils/tree_inference.py
+"""
+树模型推理引擎
+
+把训练好的 RandomForest / XGBoost / LightGBM 编译为扁平的节点数组
+（特征、阈值、左子节点、右子节点、叶子值），预测时不再经过 sklearn 的输入校验和
+joblib 并行调度，单行和批量预测都只是一次数组遍历：
+
+- Numba 可用时按树编译执行（每棵树对所有行逐层下降）；否则用 NumPy 按层同步遍历（所有行×所有树同时下降一层）
+- 与原模型的概率误差在 1e-6 以内：
+  RandomForest 把输入转为 float32 后与 float64 阈值比较（与 sklearn 一致），逐树累加后取平均；
+  XGBoost 以 float32 比较 x < 阈值，LightGBM 以 float64 比较 x <= 阈值，二者对叶子值求和后做 sigmoid
+- 缺失值按各库的规则处理（sklearn 的 missing_go_to_left、XGBoost 的 default_left、
+  LightGBM 的 missing_type None/Zero/NaN）
+- 只支持二分类的提升树和数值型分裂；不支持的模型 compile_models 会跳过并继续使用原模型
+- 大批量时 XGBoost 自身的预测更快，超过 FALLBACK_ROWS 的批量仍交给原模型
+
+用法：
+    compile_models(all_models_data)                 # 为每个模型添加 model_data['compiled']
+    proba = model_predict_proba(model_data, X)      # 有编译版本时使用编译版本
+"""
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+LIGHTGBM_ZERO_THRESHOLD = 1e-35
+
+# 超过该行数时 model_predict_proba 改用原模型的批量预测（单核机器上测得的交叉点，未列出的不设上限）
+# XGBoost 自身的批量预测高度优化；没有 Numba 时按层遍历只在小批量上占优
+FALLBACK_ROWS = {
+    ('numba', 'XGBClassifier'): 1000,
+    ('numpy', 'XGBClassifier'): 20,
+    ('numpy', 'LGBMClassifier'): 20,
+    ('numpy', 'RandomForestClassifier'): 200,
+    ('numpy', 'ExtraTreesClassifier'): 200,
+}
+
+_NUMBA_KERNEL = None
+
+
+def _numba_kernel():
+    """首次使用时才导入 Numba 并编译内核（导入 Numba 本身约需0.5秒），不可用时返回None"""
+    global _NUMBA_KERNEL
+    if _NUMBA_KERNEL is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _NUMBA_KERNEL = False
+            return None
+
+        @njit
+        def _accumulate(X, feature, threshold, children, nan_left, zero_default, strict, check_missing,
+                        roots, depths, leaf_values):
+            n = X.shape[0]
+            out = np.zeros((n, leaf_values.shape[1]))
+            node = np.empty(n, dtype=np.int32)
+            # 外层按树循环，一棵树的节点在遍历所有行期间保持在缓存中；
+            # 每层对所有行各下降一步（叶子指向自身），相邻行的访存互不依赖，便于流水线并行
+            for t in range(len(roots)):
+                node[:] = roots[t]
+                for _ in range(depths[t]):
+                    for i in range(n):
+                        current = node[i]
+                        x = X[i, feature[current]]
+                        if strict:
+                            go_right = not x < threshold[current]
+                        else:
+                            go_right = not x <= threshold[current]
+                        if check_missing:
+                            if np.isnan(x) or (zero_default[current] and abs(x) <= LIGHTGBM_ZERO_THRESHOLD):
+                                go_right = not nan_left[current]
+                        node[i] = children[current, np.int64(go_right)]
+                for i in range(n):
+                    for k in range(leaf_values.shape[1]):
+                        out[i, k] += leaf_values[node[i], k]
+            return out
+
+        _NUMBA_KERNEL = _accumulate
+    return _NUMBA_KERNEL or None
+
+
+class CompiledTreeEnsemble:
+    """
+    扁平数组表示的树集成模型
+
+    所有树的节点拼接在同一组数组中，roots 为每棵树根节点的下标；
+    叶子节点的左右子节点都指向自己，因此按层遍历时到达叶子的行原地不动
+
+    kind:
+    'mean'     各树叶子的类别概率取平均（RandomForest）
+    'logistic' 叶子值求和加基准分后做 sigmoid（XGBoost / LightGBM 二分类）
+    """
+
+    def __init__(self, kind, feature, threshold, left, right, nan_left, zero_default, leaf_values,
+                 roots, depths, n_features, strict=False, input_dtype=np.float64,
+                 base_margin=0.0, sigmoid_scale=1.0, classes=(0, 1), feature_names=None, source=''):
+        if kind not in ('mean', 'logistic'):
+            raise ValueError(f"不支持的集成类型: {kind}")
+        self.kind = kind
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        # 左右子节点相邻存放，按比较结果直接取下标，无需分支
+        self.children = np.ascontiguousarray(np.column_stack([left, right]), dtype=np.int32)
+        self.nan_left = np.ascontiguousarray(nan_left, dtype=np.bool_)
+        self.zero_default = np.ascontiguousarray(zero_default, dtype=np.bool_)
+        self.leaf_values = np.ascontiguousarray(np.asarray(leaf_values, dtype=np.float64).reshape(len(self.children), -1))
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.depths = np.ascontiguousarray(depths, dtype=np.int32)
+        self.n_features = int(n_features)
+        self.strict = bool(strict)
+        self.input_dtype = np.dtype(input_dtype)
+        self.base_margin = float(base_margin)
+        self.sigmoid_scale = float(sigmoid_scale)
+        self.classes_ = np.asarray(classes)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.source = source
+        self.max_rows = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.children)
+
+    @property
+    def max_depth(self):
+        return int(self.depths.max()) if len(self.depths) else 0
+
+    @property
+    def left(self):
+        return self.children[:, 0]
+
+    @property
+    def right(self):
+        return self.children[:, 1]
+
+    @property
+    def nbytes(self):
+        arrays = (self.feature, self.threshold, self.children, self.nan_left,
+                  self.zero_default, self.leaf_values, self.roots, self.depths)
+        return sum(a.nbytes for a in arrays)
+
+    def __repr__(self):
+        return (f"CompiledTreeEnsemble(source={self.source!r}, kind={self.kind!r}, trees={self.n_trees}, "
+                f"nodes={self.n_nodes}, max_depth={self.max_depth}, {self.nbytes / 1e6:.2f} MB)")
+
+    # ------------------------------------------------------------------
+    # 预测
+    # ------------------------------------------------------------------
+
+    def _prepare_input(self, X):
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names is not None and list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            X = X.to_numpy()
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"特征数不匹配: 输入 {X.shape[1]}，模型 {self.n_features}")
+        # 先转为模型比较时使用的精度，再统一为float64供内核使用
+        return np.ascontiguousarray(X.astype(self.input_dtype, copy=False), dtype=np.float64)
+
+    def _accumulate_numpy(self, X, chunk_elements=1 << 20):
+        """按层同步遍历：每次迭代所有 (行, 树) 同时下降一层"""
+        n = len(X)
+        out = np.zeros((n, self.leaf_values.shape[1]))
+        n_features = X.shape[1]
+        flat_X = X.ravel()
+        chunk = max(1, chunk_elements // max(self.n_trees, 1))
+        for start in range(0, n, chunk):
+            stop = min(n, start + chunk)
+            offsets = (np.arange(start, stop) * n_features)[:, np.newaxis]
+            node = np.broadcast_to(self.roots, (stop - start, self.n_trees)).copy()
+            for _ in range(self.max_depth):
+                x = flat_X[offsets + self.feature[node]]
+                if self.strict:
+                    go_left = x < self.threshold[node]
+                else:
+                    go_left = x <= self.threshold[node]
+                missing = np.isnan(x)
+                zero_default = self.zero_default[node]
+                if zero_default.any():
+                    missing |= zero_default & (np.abs(x) <= LIGHTGBM_ZERO_THRESHOLD)
+                if missing.any():
+                    go_left = np.where(missing, self.nan_left[node], go_left)
+                node = np.where(go_left, self.left[node], self.right[node])
+            out[start:stop] = self.leaf_values[node].sum(axis=1)
+        return out
+
+    def _accumulate(self, X, engine):
+        if engine == 'auto':
+            engine = 'numba' if _numba_kernel() is not None else 'numpy'
+        if engine == 'numba':
+            kernel = _numba_kernel()
+            if kernel is None:
+                raise ImportError("未安装numba，请使用 engine='numpy'")
+            check_missing = bool(self.zero_default.any() or np.isnan(X).any())
+            return kernel(X, self.feature, self.threshold, self.children, self.nan_left, self.zero_default,
+                          self.strict, check_missing, self.roots, self.depths, self.leaf_values)
+        if engine == 'numpy':
+            return self._accumulate_numpy(X)
+        raise ValueError(f"不支持的engine: {engine}")
+
+    def predict_proba(self, X, engine='auto'):
+        """
+        返回 (n, 类别数) 的概率数组，与原模型的 predict_proba 相同
+
+        engine: 'numba'、'numpy' 或 'auto'（Numba可用时使用Numba）
+        """
+        X = self._prepare_input(X)
+        total = self._accumulate(X, engine)
+        if self.kind == 'mean':
+            return total / self.n_trees
+        margin = self.base_margin + total[:, 0]
+        p = 1.0 / (1.0 + np.exp(-self.sigmoid_scale * margin))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X, engine='auto'):
+        return self.classes_[np.argmax(self.predict_proba(X, engine), axis=1)]
+
+
+# ============================================================================
+# 编译各类模型
+# ============================================================================
+
+def _tree_depths(left, right, root):
+    """从根节点开始计算树的最大深度（叶子的左右子节点指向自身）"""
+    depth, frontier = 0, [root]
+    while True:
+        children = [c for node in frontier if left[node] != node for c in (left[node], right[node])]
+        if not children:
+            return depth
+        frontier = children
+        depth += 1
+
+
+def _assemble(trees):
+    """把每棵树的局部节点数组拼接为全局数组，叶子的子节点改为指向自身"""
+    parts = {key: [] for key in ('feature', 'threshold', 'left', 'right', 'nan_left', 'zero_default', 'leaf_values')}
+    roots, depths, offset = [], [], 0
+    for tree in trees:
+        n = len(tree['left'])
+        idx = np.arange(n)
+        leaf = tree['left'] < 0
+        left = np.where(leaf, idx, tree['left']) + offset
+        right = np.where(leaf, idx, tree['right']) + offset
+        parts['left'].append(left)
+        parts['right'].append(right)
+        parts['feature'].append(np.where(leaf, 0, tree['feature']))
+        parts['threshold'].append(np.where(leaf, 0.0, tree['threshold']))
+        parts['nan_left'].append(tree['nan_left'])
+        parts['zero_default'].append(tree.get('zero_default', np.zeros(n, dtype=bool)))
+        parts['leaf_values'].append(np.where(leaf[:, np.newaxis], tree['leaf_values'].reshape(n, -1), 0.0))
+        roots.append(offset)
+        depths.append(_tree_depths(left - offset, right - offset, 0))
+        offset += n
+    arrays = {key: np.concatenate(value) for key, value in parts.items()}
+    return arrays, np.asarray(roots), np.asarray(depths)
+
+
+def _compile_sklearn_forest(model):
+    trees = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        missing_left = getattr(tree, 'missing_go_to_left', None)
+        trees.append({
+            'feature': tree.feature,
+            'threshold': tree.threshold,
+            'left': tree.children_left,
+            'right': tree.children_right,
+            'nan_left': np.zeros(tree.node_count, dtype=bool) if missing_left is None else missing_left.astype(bool),
+            'leaf_values': value / normalizer,
+        })
+    arrays, roots, depths = _assemble(trees)
+    return CompiledTreeEnsemble(
+        'mean', roots=roots, depths=depths, n_features=model.n_features_in_,
+        input_dtype=np.float32, classes=model.classes_,
+        feature_names=getattr(model, 'feature_names_in_', None), source=type(model).__name__, **arrays
+    )
+
+
+def _parse_xgboost_base_score(value):
+    """XGBoost 1.x 保存为 '5E-1'，3.x 保存为 '[5E-1]'"""
+    return float(str(value).strip('[]').split(',')[0])
+
+
+def _compile_xgboost(model):
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    if objective != 'binary:logistic':
+        raise NotImplementedError(f"只支持 binary:logistic，当前目标函数为 {objective}")
+
+    gbm = learner['gradient_booster']
+    if gbm.get('name', 'gbtree') != 'gbtree':
+        raise NotImplementedError(f"只支持 gbtree，当前为 {gbm.get('name')}")
+    tree_dicts = gbm['model']['trees']
+
+    # 使用早停训练时 predict_proba 只使用到最佳迭代为止的树
+    try:
+        best_iteration = model.best_iteration
+    except AttributeError:
+        best_iteration = None
+    if best_iteration is not None:
+        tree_dicts = tree_dicts[:best_iteration + 1]
+
+    trees = []
+    for tree in tree_dicts:
+        if any(tree.get('split_type', [])):
+            raise NotImplementedError("不支持类别型分裂")
+        left = np.asarray(tree['left_children'], dtype=np.int64)
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32).astype(np.float64)
+        trees.append({
+            'feature': np.asarray(tree['split_indices'], dtype=np.int64),
+            'threshold': conditions,
+            'left': left,
+            'right': np.asarray(tree['right_children'], dtype=np.int64),
+            'nan_left': np.asarray(tree['default_left'], dtype=bool),
+            'leaf_values': conditions,
+        })
+    arrays, roots, depths = _assemble(trees)
+
+    base_score = _parse_xgboost_base_score(learner['learner_model_param']['base_score'])
+    base_margin = float(np.log(base_score / (1.0 - base_score)))
+    return CompiledTreeEnsemble(
+        'logistic', roots=roots, depths=depths, n_features=model.n_features_in_, strict=True,
+        input_dtype=np.float32, base_margin=base_margin, classes=model.classes_,
+        feature_names=getattr(model, 'feature_names_in_', None), source=type(model).__name__, **arrays
+    )
+
+
+def _flatten_lightgbm_tree(structure):
+    """把 LightGBM dump_model 的嵌套结构按先序展开为局部节点数组"""
+    feature, threshold, left, right, nan_left, zero_default, leaf_values = [], [], [], [], [], [], []
+
+    def visit(node):
+        idx = len(feature)
+        for values in (feature, threshold, left, right, nan_left, zero_default, leaf_values):
+            values.append(0)
+        if 'leaf_value' in node:
+            left[idx] = right[idx] = -1
+            leaf_values[idx] = node['leaf_value']
+            return idx
+        if node.get('decision_type', '<=') != '<=':
+            raise NotImplementedError("不支持类别型分裂")
+        feature[idx] = node['split_feature']
+        threshold[idx] = node['threshold']
+        missing_type = node.get('missing_type', 'None')
+        if missing_type == 'None':
+            # NaN按0处理，方向在编译时即可确定
+            nan_left[idx] = 0.0 <= node['threshold']
+        else:
+            nan_left[idx] = node['default_left']
+            zero_default[idx] = missing_type == 'Zero'
+        left[idx] = visit(node['left_child'])
+        right[idx] = visit(node['right_child'])
+        return idx
+
+    visit(structure)
+    return {
+        'feature': np.asarray(feature, dtype=np.int64),
+        'threshold': np.asarray(threshold, dtype=np.float64),
+        'left': np.asarray(left, dtype=np.int64),
+        'right': np.asarray(right, dtype=np.int64),
+        'nan_left': np.asarray(nan_left, dtype=bool),
+        'zero_default': np.asarray(zero_default, dtype=bool),
+        'leaf_values': np.asarray(leaf_values, dtype=np.float64),
+    }
+
+
+def _compile_lightgbm(model):
+    dump = model.booster_.dump_model()
+    objective = dump.get('objective', '')
+    if not objective.startswith('binary') or dump.get('num_tree_per_iteration', 1) != 1:
+        raise NotImplementedError(f"只支持二分类，当前目标函数为 {objective}")
+    if dump.get('average_output'):
+        raise NotImplementedError("不支持 average_output（rf 模式）")
+
+    sigmoid_scale = 1.0
+    for token in objective.split():
+        if token.startswith('sigmoid:'):
+            sigmoid_scale = float(token.split(':', 1)[1])
+
+    tree_info = dump['tree_info']
+    best_iteration = getattr(model, 'best_iteration_', None)
+    if best_iteration:
+        tree_info = tree_info[:best_iteration]
+
+    arrays, roots, depths = _assemble([_flatten_lightgbm_tree(t['tree_structure']) for t in tree_info])
+    return CompiledTreeEnsemble(
+        'logistic', roots=roots, depths=depths, n_features=dump['max_feature_idx'] + 1,
+        input_dtype=np.float64, sigmoid_scale=sigmoid_scale, classes=model.classes_,
+        feature_names=getattr(model, 'feature_names_in_', None), source=type(model).__name__, **arrays
+    )
+
+
+def compile_tree_model(model):
+    """
+    编译单个树模型，不支持时抛出 NotImplementedError
+
+    支持: sklearn RandomForestClassifier / ExtraTreesClassifier、XGBClassifier（binary:logistic）、
+    LGBMClassifier（binary）
+    """
+    module = type(model).__module__
+    if module.startswith('xgboost'):
+        return _compile_xgboost(model)
+    if module.startswith('lightgbm'):
+        return _compile_lightgbm(model)
+    if module.startswith('sklearn') and hasattr(model, 'estimators_') and hasattr(model, 'classes_'):
+        if all(hasattr(est, 'tree_') for est in model.estimators_):
+            return _compile_sklearn_forest(model)
+    raise NotImplementedError(f"不支持编译 {type(model).__name__}")
+
+
+def compile_models(all_models_data, warm_up=True, verbose=True):
+    """
+    为 all_models_data 中的每个模型添加 model_data['compiled']（编译失败的模型保持不变）
+
+    warm_up: 编译后各预测一行，提前完成 Numba 的JIT编译
+
+    返回:
+    编译成功的模型名列表
+    """
+    compiled = []
+    for name, model_data in (all_models_data or {}).items():
+        if model_data.get('compiled') is not None:
+            compiled.append(name)
+            continue
+        start = time.perf_counter()
+        try:
+            ensemble = compile_tree_model(model_data['model'])
+        except NotImplementedError as e:
+            if verbose:
+                print(f"[推理] {name} 未编译: {e}")
+            continue
+        engine = 'numba' if _numba_kernel() is not None else 'numpy'
+        ensemble.max_rows = FALLBACK_ROWS.get((engine, ensemble.source))
+        if warm_up:
+            ensemble.predict_proba(np.zeros((1, ensemble.n_features)))
+        model_data['compiled'] = ensemble
+        compiled.append(name)
+        if verbose:
+            print(f"[推理] {name} 编译完成: {ensemble.n_trees} 棵树, {ensemble.n_nodes} 个节点, "
+                  f"{time.perf_counter() - start:.2f}s")
+    return compiled
+
+
+def model_predict_proba(model_data, X):
+    """
+    model_data 中有编译版本且行数不超过其 max_rows 时使用编译版本，否则调用原模型的 predict_proba
+    """
+    compiled = model_data.get('compiled')
+    if compiled is not None and (compiled.max_rows is None or len(X) <= compiled.max_rows):
+        return compiled.predict_proba(X)
+    return model_data['model'].predict_proba(X)
+
+
+# ============================================================================
+# 基准测试
+# ============================================================================
+
+def _make_synthetic_models(n_samples=5000, n_features=44, seed=42):
+    """用与 train_models 相同的超参数训练三个模型（合成数据），返回 (all_models_data, X)"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n_samples, n_features)), columns=[f'f{i}' for i in range(n_features)])
+    logit = X.iloc[:, :5].sum(axis=1) + 0.5 * X.iloc[:, 5] * X.iloc[:, 6] + rng.normal(size=n_samples)
+    y = (logit > 0).astype(int)
+
+    models = {'RandomForest': RandomForestClassifier(
+        n_estimators=1000, random_state=42, max_depth=10, min_samples_split=20, min_samples_leaf=10,
+        max_features='log2', class_weight={0: 1, 1: 2.5}, n_jobs=-1
+    )}
+    try:
+        import xgboost as xgb
+        models['XGBoost'] = xgb.XGBClassifier(
+            n_estimators=500, max_depth=6, learning_rate=0.05, subsample=0.8, colsample_bytree=0.8,
+            random_state=42, n_jobs=-1, eval_metric='logloss'
+        )
+    except ImportError:
+        pass
+    try:
+        import lightgbm as lgb
+        models['LightGBM'] = lgb.LGBMClassifier(
+            n_estimators=500, max_depth=6, learning_rate=0.05, num_leaves=31, subsample=0.8,
+            colsample_bytree=0.8, class_weight={0: 1, 1: 2.5}, random_state=42, n_jobs=-1, verbose=-1
+        )
+    except ImportError:
+        pass
+
+    all_models_data = {}
+    for name, model in models.items():
+        model.fit(X, y)
+        all_models_data[name] = {'model': model, 'optimal_threshold': 0.5}
+    return all_models_data, X
+
+
+def _best_time(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_tree_inference(all_models_data=None, X=None, batch_sizes=(1, 100, 10000), repeat=5,
+                             engines=('numba', 'numpy'), atol=1e-6):
+    """
+    对比原模型 predict_proba 与编译版本的耗时，并校验概率误差不超过 atol
+
+    参数:
+    all_models_data: 要测试的模型，默认用合成数据训练（与 train_models 超参数相同）
+    X: 特征数据（行数不足最大批量时循环复用），默认使用合成数据
+    batch_sizes: 批量大小
+    engines: 要测试的编译引擎（Numba未安装时自动跳过 'numba'）
+
+    返回:
+    DataFrame，每行为一个 (模型, 批量, 引擎)：原模型耗时、编译版本耗时、加速比、最大误差
+    """
+    if all_models_data is None:
+        print("[基准] 训练合成模型...")
+        all_models_data, synthetic_X = _make_synthetic_models()
+        X = synthetic_X if X is None else X
+    if X is None:
+        raise ValueError("提供 all_models_data 时需要同时提供 X")
+    X = pd.DataFrame(X)
+    engines = [e for e in engines if e != 'numba' or _numba_kernel() is not None]
+
+    rows = []
+    for name, model_data in all_models_data.items():
+        model = model_data['model']
+        try:
+            compiled = compile_tree_model(model)
+        except NotImplementedError as e:
+            print(f"[基准] 跳过 {name}: {e}")
+            continue
+        for engine in engines:
+            compiled.predict_proba(X.iloc[:1], engine=engine)
+
+        for batch_size in batch_sizes:
+            batch = X.iloc[np.arange(batch_size) % len(X)]
+            reference = model.predict_proba(batch)
+            original = _best_time(lambda: model.predict_proba(batch), repeat)
+            for engine in engines:
+                result = compiled.predict_proba(batch, engine=engine)
+                max_diff = float(np.max(np.abs(result - reference)))
+                assert max_diff <= atol, f"{name} ({engine}, 批量{batch_size}) 概率误差 {max_diff:.2e} 超过 {atol}"
+                elapsed = _best_time(lambda: compiled.predict_proba(batch, engine=engine), repeat)
+                rows.append({
+                    'model': name,
+                    'batch_size': batch_size,
+                    'engine': engine,
+                    'original_ms': original * 1000,
+                    'compiled_ms': elapsed * 1000,
+                    'speedup': original / elapsed,
+                    'max_abs_diff': max_diff,
+                })
+
+    result = pd.DataFrame(rows)
+    if not result.empty:
+        print(result.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    return result
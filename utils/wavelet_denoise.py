@@ -1,3 +1,4 @@
+import logging
 import numpy as np
 import pywt
 import pandas as pd
@@ -6,13 +7,109 @@ from matplotlib import style
 import warnings
 warnings.filterwarnings("ignore")
 
+# 模块日志：默认不输出，需要调试信息时设置
+# logging.getLogger('utils.wavelet_denoise').setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
+
 # 定义全局变量，用于不同类型的数据列
 price_columns = ['Open', 'Close', 'High', 'Low', 'Avg']
 volume_columns = ['Volume', 'Turnover']
 change_columns = ['PricechangeRate', 'TurnoverRate']
 
+# 技术指标默认分类
+DEFAULT_INDICATORS_DICT = {
+    'trend_indicators': ['MA5', 'MA10', 'MA20', 'MA50', 'MA100', 'MA200', 'EMA_12', 'EMA_26', 'TEMA'],
+    'momentum_indicators': ['RSI', 'MACD', 'Signal', 'Momentum', 'ROC', 'Williams_R', 'CCI', 'MFI'],
+    'volatility_indicators': ['ATR', 'STD', 'Upper_Band', 'Lower_Band', '%B', 'Volatility'],
+    'volume_indicators': ['OBV', 'AD', 'AVG_VOL'],
+    'oscillator_indicators': ['K', 'D', 'J', 'Stoch_K', 'Stoch_D', 'TRIX'],
+    'custom_indicators': ['ProfitRatio', 'LWinnerRatio', 'PPSCM', 'SHCM', 'ZSHTL', 'TTSLKP', 'ZCMPPS', 'ZSHJJ', 'TTSLJJ', 'ZJLRQD', 'SH8', 'lijinz1', 'lijinz4'],
+    'chip_indicators': ['Cost90', 'Cost70', 'ProfitRatio', 'LWinnerRatio'],
+    'index_indicators': ['open_SZ_index', 'high_SZ_index', 'low_SZ_index', 'close_SZ_index', 'volume_SZ_index'],
+    'industry_indicators': ['open_industry_index', 'high_industry_index', 'low_industry_index', 'close_industry_index', 'volume_industry_index', 'turnover_industry_index'],
+    'forex_indicators': ['open_forex', 'high_forex', 'low_forex', 'new_forex'],
+    'us_market_indicators': ['open_us', 'high_us', 'low_us', 'close_us', 'volume_us']
+}
+
+# 各类指标的降噪参数 (wavelet, level, threshold_scale)，按处理顺序排列
+# 同一列出现在多个分类中时，以后处理的分类为准（如 ProfitRatio 使用筹码分布参数）
+INDICATOR_DENOISE_PARAMS = [
+    ('trend_indicators', ('sym8', 2, 1.0)),        # 趋势指标 - 较低级别，保留长期趋势
+    ('momentum_indicators', ('db4', 3, 1.0)),      # 动量指标 - 中等级别
+    ('volatility_indicators', ('db8', 3, 1.0)),    # 波动性指标 - 较高级别，平滑波动
+    ('volume_indicators', ('db8', 4, 1.0)),        # 成交量指标 - 较高级别，平滑成交量波动
+    ('oscillator_indicators', ('sym4', 2, 1.0)),   # 振荡器指标 - 中等级别
+    ('custom_indicators', ('sym8', 2, 1.0)),       # 自定义指标
+    ('chip_indicators', ('sym8', 2, 0.3)),         # 筹码分布指标 - 较温和
+    ('index_indicators', ('db8', 2, 0.5)),         # 上证指数指标 - 保留趋势
+    ('industry_indicators', ('db8', 2, 0.5)),      # 行业指数指标 - 保留趋势
+    ('forex_indicators', ('sym8', 2, 0.4)),        # 美元汇率指标 - 保留趋势
+    ('us_market_indicators', ('sym8', 2, 0.4)),    # 美股指标（成交量列见下）
+]
+
+# 美股成交量列使用较高级别的降噪
+US_MARKET_VOLUME_PARAMS = ('db8', 3, 0.5)
+
+
+def wavelet_denoising_batch(data, wavelet='db4', level=1, threshold_mode='soft', threshold_scale=1.0):
+    """
+    对二维数组（时间 × 列）的每一列同时进行小波降噪
+    
+    整个矩阵只做一次 pywt.wavedec / waverec（axis=0），每列的阈值按该列最细一级细节系数
+    单独估计，结果与逐列调用 wavelet_denoising 一致
+    
+    参数:
+    data: 二维数组 (n_samples, n_columns)，一维数组按单列处理
+    wavelet, level, threshold_mode, threshold_scale: 同 wavelet_denoising
+    
+    返回:
+    与输入形状相同的降噪后数组
+    """
+    data = np.array(data, dtype=float)
+    squeeze = data.ndim == 1
+    if squeeze:
+        data = data[:, np.newaxis]
+    
+    n = data.shape[0]
+    
+    # 进行小波分解（沿时间轴）
+    coeffs = pywt.wavedec(data, wavelet, level=level, axis=0)
+    
+    # 计算每列的阈值
+    sigma = np.median(np.abs(coeffs[-1]), axis=0) / 0.6745
+    threshold = sigma * np.sqrt(2 * np.log(n)) * threshold_scale
+    
+    # 对细节系数应用阈值处理，保留近似系数
+    new_coeffs = [coeffs[0]] + [pywt.threshold(c, threshold[np.newaxis, :], threshold_mode) for c in coeffs[1:]]
+    
+    # 重构信号并确保输出长度与输入相同
+    denoised = pywt.waverec(new_coeffs, wavelet, axis=0)[:n]
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        # 统计信息只在调试时计算
+        for i in range(1, len(coeffs)):
+            before = np.abs(coeffs[i]).sum(axis=0)
+            after = np.abs(new_coeffs[i]).sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                change = np.where(before > 0, (before - after) / before * 100, 0.0)
+            logger.debug("小波降噪 wavelet=%s level=%d mode=%s 细节级别=%d 系数变化=%s",
+                         wavelet, level, threshold_mode, i, np.round(change, 2).tolist())
+        mean_abs = np.mean(np.abs(data), axis=0)
+        diff = np.mean(np.abs(denoised - data), axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diff_percent = np.where(mean_abs > 0, diff / mean_abs * 100, 0.0)
+        logger.debug("小波降噪 wavelet=%s level=%d columns=%d std=%s range=%s threshold=%s diff=%s diff_pct=%s",
+                     wavelet, level, data.shape[1],
+                     np.round(np.std(data, axis=0), 4).tolist(),
+                     np.round(np.ptp(data, axis=0), 4).tolist(),
+                     np.round(threshold, 4).tolist(),
+                     np.round(diff, 4).tolist(),
+                     np.round(diff_percent, 2).tolist())
+    
+    return denoised[:, 0] if squeeze else denoised
+
 # 添加小波降噪函数
-def wavelet_denoising(data, wavelet='db4', level=1, threshold_mode='soft', threshold_scale=1.0):
+def wavelet_denoising(data, wavelet='db4', level=1, threshold_mode='soft', threshold_scale=1.0, causal=False):
     """
     使用小波变换对时间序列数据进行降噪
     
@@ -22,52 +119,15 @@ def wavelet_denoising(data, wavelet='db4', level=1, threshold_mode='soft', thres
     level: 分解级别，默认为1
     threshold_mode: 阈值处理模式，'soft'或'hard'
     threshold_scale: 阈值缩放因子，值越小降噪效果越温和
+    causal: 为True时使用因果降噪（每个值只依赖之前的数据，见 StreamingWaveletDenoiser），
+            默认为False（整段变换，会使用未来数据）
     
     返回:
     降噪后的时间序列数据
     """
-    # 确保数据是numpy数组
-    data = np.array(data, dtype=float)
-    
-    # 计算数据的标准差和范围，用于调试输出
-    data_std = np.std(data)
-    data_range = np.max(data) - np.min(data)
-    
-    # 进行小波分解
-    coeffs = pywt.wavedec(data, wavelet, level=level)
-    
-    # 计算阈值
-    sigma = np.median(np.abs(coeffs[-1])) / 0.6745
-    threshold = sigma * np.sqrt(2 * np.log(len(data))) * threshold_scale
-    
-    # 打印调试信息
-    print(f"小波降噪 - 使用 {wavelet} 小波，级别 {level}，阈值模式 {threshold_mode}")
-    print(f"数据范围: {data_range:.2f}, 标准差: {data_std:.2f}")
-    print(f"计算的阈值: {threshold:.4f}")
-    
-    # 应用阈值处理 - 对所有级别的系数应用阈值，而不仅仅是细节系数
-    new_coeffs = list(coeffs)
-    for i in range(1, len(coeffs)):  # 从1开始，保留近似系数
-        # 打印每个级别的系数变化
-        before_threshold = np.sum(np.abs(coeffs[i]))
-        new_coeffs[i] = pywt.threshold(coeffs[i], threshold, threshold_mode)
-        after_threshold = np.sum(np.abs(new_coeffs[i]))
-        change_percent = (before_threshold - after_threshold) / before_threshold * 100 if before_threshold > 0 else 0
-        print(f"  级别 {i} 系数变化: {change_percent:.2f}%")
-    
-    # 重构信号
-    denoised_data = pywt.waverec(new_coeffs, wavelet)
-    
-    # 确保输出长度与输入相同
-    if len(denoised_data) != len(data):
-        denoised_data = denoised_data[:len(data)]
-    
-    # 计算降噪前后的差异
-    diff = np.mean(np.abs(denoised_data - data))
-    diff_percent = (diff / np.mean(np.abs(data))) * 100 if np.mean(np.abs(data)) > 0 else 0
-    print(f"降噪前后平均绝对差异: {diff:.2f} ({diff_percent:.2f}%)")
-    
-    return denoised_data
+    if causal:
+        return causal_wavelet_denoising(np.asarray(data, dtype=float).ravel(), wavelet, level, threshold_mode, threshold_scale)
+    return wavelet_denoising_batch(np.asarray(data, dtype=float).ravel(), wavelet, level, threshold_mode, threshold_scale)
 
 # 添加辅助函数，用于确保数据长度一致
 def ensure_length_match(data, target_length, column_name=None):
@@ -84,7 +144,7 @@ def ensure_length_match(data, target_length, column_name=None):
     """
     if len(data) != target_length:
         if column_name:
-            print(f"警告: {column_name} 的降噪数据长度 ({len(data)}) 与目标长度 ({target_length}) 不匹配，进行调整")
+            logger.warning("%s 的降噪数据长度 (%d) 与目标长度 (%d) 不匹配，进行调整", column_name, len(data), target_length)
         
         # 如果长度大于目标长度，截断多余部分
         if len(data) > target_length:
@@ -96,10 +156,25 @@ def ensure_length_match(data, target_length, column_name=None):
     
     return data
 
+def _clamp_deviation(denoised, original, max_deviation, min_abs=None):
+    """
+    限制降噪数据相对原始数据的偏差（向量化）
+    
+    min_abs为None时只处理非零原始值，偏差按 |d-o|/o 计算（与逐元素版本一致，负值不受限制）；
+    否则只处理 |o| > min_abs 的值，偏差按 |d-o|/|o| 计算
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if min_abs is None:
+            mask = (original != 0) & (np.abs(denoised - original) / original > max_deviation)
+        else:
+            mask = (np.abs(original) > min_abs) & (np.abs(denoised - original) / np.abs(original) > max_deviation)
+    direction = np.where(denoised > original, 1.0, -1.0)
+    return np.where(mask, original * (1 + direction * max_deviation), denoised)
+
 # 添加批量小波降噪函数，用于处理DataFrame中的多个列
 def apply_wavelet_denoising(df, columns, wavelet='db4', level=1, threshold_mode='soft', threshold_scale=1.0):
     """
-    对DataFrame中的多个列应用小波降噪
+    对DataFrame中的多个列应用小波降噪（所有列一次批量变换）
     
     参数:
     df: 输入的DataFrame
@@ -116,46 +191,24 @@ def apply_wavelet_denoising(df, columns, wavelet='db4', level=1, threshold_mode=
     global price_columns, volume_columns, change_columns
     
     df_denoised = df.copy()
-    for col in columns:
-        if col in df.columns:
-            # 确保数据没有NaN值
-            data = df[col].fillna(method='ffill').fillna(method='bfill').values
-            
-            # 应用小波降噪
-            print(f"\n处理列: {col}")
-            denoised_data = wavelet_denoising(data, wavelet, level, threshold_mode, threshold_scale)
-            
-            # 确保降噪后的数据长度与原始数据长度一致
-            denoised_data = ensure_length_match(denoised_data, len(df), col)
-            
-            # 添加保护措施：确保降噪后的数据不会偏离原始数据太多
-            # 对于交易量和价格变化率，限制最大偏差
-            if col in volume_columns:
-                # 限制交易量数据的最大偏差为5%
-                max_deviation = 0.05
-                original_data = df[col].values
-                for i in range(len(denoised_data)):
-                    if original_data[i] != 0:  # 避免除以零
-                        deviation = abs(denoised_data[i] - original_data[i]) / original_data[i]
-                        if deviation > max_deviation:
-                            # 将偏差限制在最大允许范围内
-                            direction = 1 if denoised_data[i] > original_data[i] else -1
-                            denoised_data[i] = original_data[i] * (1 + direction * max_deviation)
-            
-            elif col in change_columns:
-                # 对于价格变化率，使用更严格的限制
-                max_deviation = 0.2  # 最大允许偏差为原始值的20%
-                original_data = df[col].values
-                for i in range(len(denoised_data)):
-                    if abs(original_data[i]) > 0.001:  # 避免对接近零的值进行处理
-                        deviation = abs(denoised_data[i] - original_data[i]) / abs(original_data[i])
-                        if deviation > max_deviation:
-                            # 将偏差限制在最大允许范围内
-                            direction = 1 if denoised_data[i] > original_data[i] else -1
-                            denoised_data[i] = original_data[i] * (1 + direction * max_deviation)
-            
-            # 更新DataFrame
-            df_denoised[col] = denoised_data
+    cols = [col for col in dict.fromkeys(columns) if col in df.columns]
+    if not cols:
+        return df_denoised
+    
+    # 确保数据没有NaN值
+    data = df[cols].ffill().bfill().to_numpy(dtype=float)
+    denoised = wavelet_denoising_batch(data, wavelet, level, threshold_mode, threshold_scale)
+    
+    for j, col in enumerate(cols):
+        denoised_data = denoised[:, j]
+        # 添加保护措施：确保降噪后的数据不会偏离原始数据太多
+        if col in volume_columns:
+            # 限制交易量数据的最大偏差为5%
+            denoised_data = _clamp_deviation(denoised_data, df[col].to_numpy(dtype=float), 0.05)
+        elif col in change_columns:
+            # 对于价格变化率，使用更严格的限制（最大允许偏差为原始值的20%）
+            denoised_data = _clamp_deviation(denoised_data, df[col].to_numpy(dtype=float), 0.2, min_abs=0.001)
+        df_denoised[col] = denoised_data
     
     return df_denoised
 
@@ -169,7 +222,7 @@ def apply_wavelet_denoising_to_dataframe(df):
     返回:
     处理后的DataFrame
     """
-    print("正在应用小波降噪处理...")
+    logger.info("正在应用小波降噪处理...")
     
     # 对价格和交易量数据应用小波降噪
     price_columns = ['Open', 'Close', 'High', 'Low', 'Avg']
@@ -184,10 +237,40 @@ def apply_wavelet_denoising_to_dataframe(df):
     
     # 对变化率数据使用更温和的降噪参数
     df = apply_wavelet_denoising(df, change_columns, wavelet='sym4', level=2, threshold_mode='soft', threshold_scale=0.1)
-
-    print("小波降噪处理完成")
+    
+    logger.info("小波降噪处理完成")
     return df
 
+def group_indicator_columns(columns, indicators_dict=None):
+    """
+    按降噪参数对指标列分组
+    
+    参数:
+    columns: 可用的列名（通常为 df.columns）
+    indicators_dict: 指标分类字典，默认为 DEFAULT_INDICATORS_DICT
+    
+    返回:
+    dict: {(wavelet, level, threshold_scale): [列名, ...]}，同一列只归入最后处理的分类
+    """
+    if indicators_dict is None:
+        indicators_dict = DEFAULT_INDICATORS_DICT
+    
+    available = set(columns)
+    column_params = {}
+    for group, params in INDICATOR_DENOISE_PARAMS:
+        for col in indicators_dict.get(group, []):
+            if col not in available:
+                continue
+            if group == 'us_market_indicators' and 'volume' in col.lower():
+                column_params[col] = US_MARKET_VOLUME_PARAMS
+            else:
+                column_params[col] = params
+    
+    groups = {}
+    for col, params in column_params.items():
+        groups.setdefault(params, []).append(col)
+    return groups
+
 def apply_wavelet_denoising_to_indicators(df, indicators_dict=None):
     """
     对DataFrame中的技术指标应用小波降噪
@@ -199,159 +282,19 @@ def apply_wavelet_denoising_to_indicators(df, indicators_dict=None):
     返回:
     pandas.DataFrame: 降噪后的DataFrame
     """
-    print("正在对技术指标应用小波降噪处理...")
+    logger.info("正在对技术指标应用小波降噪处理...")
     
     # 创建DataFrame的副本，避免修改原始数据
     df_denoised = df.copy()
     
-   # 如果没有提供指标字典，使用默认分类
-    if indicators_dict is None:
-        indicators_dict = {
-            'trend_indicators': ['MA5', 'MA10', 'MA20', 'MA50', 'MA100', 'MA200', 'EMA_12', 'EMA_26', 'TEMA'],
-            'momentum_indicators': ['RSI', 'MACD', 'Signal', 'Momentum', 'ROC', 'Williams_R', 'CCI', 'MFI'],
-            'volatility_indicators': ['ATR', 'STD', 'Upper_Band', 'Lower_Band', '%B', 'Volatility'],
-            'volume_indicators': ['OBV', 'AD', 'AVG_VOL'],
-            'oscillator_indicators': ['K', 'D', 'J', 'Stoch_K', 'Stoch_D', 'TRIX'],
-            'custom_indicators': ['ProfitRatio', 'LWinnerRatio', 'PPSCM', 'SHCM', 'ZSHTL', 'TTSLKP', 'ZCMPPS', 'ZSHJJ', 'TTSLJJ', 'ZJLRQD', 'SH8', 'lijinz1', 'lijinz4'],
-            'chip_indicators': ['Cost90', 'Cost70', 'ProfitRatio', 'LWinnerRatio'],
-            'index_indicators': ['open_SZ_index', 'high_SZ_index', 'low_SZ_index', 'close_SZ_index', 'volume_SZ_index'],
-            'industry_indicators': ['open_industry_index', 'high_industry_index', 'low_industry_index', 'close_industry_index', 'volume_industry_index', 'turnover_industry_index'],
-            'forex_indicators': ['open_forex', 'high_forex', 'low_forex', 'new_forex'],
-            'us_market_indicators': ['open_us', 'high_us', 'low_us', 'close_us', 'volume_us']
-        }
-    
-    
-    # 对不同类型的指标应用不同参数的小波降噪
-    # 趋势指标 - 使用较低级别的降噪，保留长期趋势
-    if 'trend_indicators' in indicators_dict:
-        trend_cols = [col for col in indicators_dict['trend_indicators'] if col in df.columns]
-        if trend_cols:
-            print(f"\n处理趋势指标: {', '.join(trend_cols)}")
-            for col in trend_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    denoised_data = wavelet_denoising(data, wavelet='sym8', level=2, threshold_mode='soft')
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 动量指标 - 使用中等级别的降噪
-    if 'momentum_indicators' in indicators_dict:
-        momentum_cols = [col for col in indicators_dict['momentum_indicators'] if col in df.columns]
-        if momentum_cols:
-            print(f"\n处理动量指标: {', '.join(momentum_cols)}")
-            for col in momentum_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    denoised_data = wavelet_denoising(data, wavelet='db4', level=3, threshold_mode='soft')
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 波动性指标 - 使用较高级别的降噪，平滑波动
-    if 'volatility_indicators' in indicators_dict:
-        volatility_cols = [col for col in indicators_dict['volatility_indicators'] if col in df.columns]
-        if volatility_cols:
-            print(f"\n处理波动性指标: {', '.join(volatility_cols)}")
-            for col in volatility_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    denoised_data = wavelet_denoising(data, wavelet='db8', level=3, threshold_mode='soft')
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 成交量指标 - 使用较高级别的降噪，平滑成交量波动
-    if 'volume_indicators' in indicators_dict:
-        volume_cols = [col for col in indicators_dict['volume_indicators'] if col in df.columns]
-        if volume_cols:
-            print(f"\n处理成交量指标: {', '.join(volume_cols)}")
-            for col in volume_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    denoised_data = wavelet_denoising(data, wavelet='db8', level=4, threshold_mode='soft')
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 振荡器指标 - 使用中等级别的降噪
-    if 'oscillator_indicators' in indicators_dict:
-        oscillator_cols = [col for col in indicators_dict['oscillator_indicators'] if col in df.columns]
-        if oscillator_cols:
-            print(f"\n处理振荡器指标: {', '.join(oscillator_cols)}")
-            for col in oscillator_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    denoised_data = wavelet_denoising(data, wavelet='sym4', level=2, threshold_mode='soft')
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 自定义指标 - 使用适合的降噪参数
-    if 'custom_indicators' in indicators_dict:
-        custom_cols = [col for col in indicators_dict['custom_indicators'] if col in df.columns]
-        if custom_cols:
-            print(f"\n处理自定义指标: {', '.join(custom_cols)}")
-            for col in custom_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    denoised_data = wavelet_denoising(data, wavelet='sym8', level=2, threshold_mode='soft')
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-
-     # 筹码分布指标 - 使用特定参数的小波降噪
-    if 'chip_indicators' in indicators_dict:
-        chip_cols = [col for col in indicators_dict['chip_indicators'] if col in df.columns]
-        if chip_cols:
-            print(f"\n处理筹码分布指标: {', '.join(chip_cols)}")
-            for col in chip_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    # 对筹码分布使用较温和的降噪参数
-                    denoised_data = wavelet_denoising(data, wavelet='sym8', level=2, threshold_mode='soft', threshold_scale=0.3)
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 上证指数指标 - 使用特定参数的小波降噪
-    if 'index_indicators' in indicators_dict:
-        index_cols = [col for col in indicators_dict['index_indicators'] if col in df.columns]
-        if index_cols:
-            print(f"\n处理上证指数指标: {', '.join(index_cols)}")
-            for col in index_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    # 对指数数据使用较低级别的降噪，保留趋势
-                    denoised_data = wavelet_denoising(data, wavelet='db8', level=2, threshold_mode='soft', threshold_scale=0.5)
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 行业指数指标 - 使用特定参数的小波降噪
-    if 'industry_indicators' in indicators_dict:
-        industry_cols = [col for col in indicators_dict['industry_indicators'] if col in df.columns]
-        if industry_cols:
-            print(f"\n处理行业指数指标: {', '.join(industry_cols)}")
-            for col in industry_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    # 对行业指数使用较低级别的降噪，保留趋势
-                    denoised_data = wavelet_denoising(data, wavelet='db8', level=2, threshold_mode='soft', threshold_scale=0.5)
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-
-    # 美元汇率指标 - 使用特定参数的小波降噪
-    if 'forex_indicators' in indicators_dict:
-        forex_cols = [col for col in indicators_dict['forex_indicators'] if col in df.columns]
-        if forex_cols:
-            print(f"\n处理美元汇率指标: {', '.join(forex_cols)}")
-            for col in forex_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    # 对汇率数据使用较低级别的降噪，保留趋势
-                    denoised_data = wavelet_denoising(data, wavelet='sym8', level=2, threshold_mode='soft', threshold_scale=0.4)
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
-    
-    # 美股指标 - 使用特定参数的小波降噪
-    if 'us_market_indicators' in indicators_dict:
-        us_cols = [col for col in indicators_dict['us_market_indicators'] if col in df.columns]
-        if us_cols:
-            print(f"\n处理美股指标: {', '.join(us_cols)}")
-            for col in us_cols:
-                if col in df.columns:
-                    data = df[col].fillna(0).values
-                    # 对美股数据使用适当的降噪参数
-                    if 'volume' in col.lower():
-                        # 成交量数据使用较高级别的降噪
-                        denoised_data = wavelet_denoising(data, wavelet='db8', level=3, threshold_mode='soft', threshold_scale=0.5)
-                    else:
-                        # 价格数据使用较低级别的降噪
-                        denoised_data = wavelet_denoising(data, wavelet='sym8', level=2, threshold_mode='soft', threshold_scale=0.4)
-                    df_denoised[col] = ensure_length_match(denoised_data, len(df), col)
+    # 参数相同的指标合并为一次批量变换
+    for (wavelet, level, threshold_scale), cols in group_indicator_columns(df.columns, indicators_dict).items():
+        logger.debug("处理指标 wavelet=%s level=%d scale=%s columns=%s", wavelet, level, threshold_scale, cols)
+        data = df[cols].fillna(0).to_numpy(dtype=float)
+        denoised = wavelet_denoising_batch(data, wavelet=wavelet, level=level, threshold_mode='soft',
+                                           threshold_scale=threshold_scale)
+        for j, col in enumerate(cols):
+            df_denoised[col] = denoised[:, j]
     
     return df_denoised
 
@@ -365,7 +308,7 @@ def apply_comprehensive_wavelet_denoising(df):
     返回:
     pandas.DataFrame: 降噪后的DataFrame
     """
-    print("开始全面小波降噪处理...")
+    logger.info("开始全面小波降噪处理...")
     
     # 1. 首先对基本价格和交易量数据进行降噪
     df = apply_wavelet_denoising_to_dataframe(df)
@@ -376,13 +319,227 @@ def apply_comprehensive_wavelet_denoising(df):
     # 3. 检查是否有任何列包含NaN值
     nan_columns = df.columns[df.isna().any()].tolist()
     if nan_columns:
-        print(f"警告: 降噪后以下列包含NaN值: {', '.join(nan_columns)}")
+        logger.warning("降噪后以下列包含NaN值: %s", ', '.join(nan_columns))
         # 填充NaN值
-        df = df.fillna(method='ffill').fillna(method='bfill')
+        df = df.ffill().bfill()
     
-    print("全面小波降噪处理完成")
+    logger.info("全面小波降噪处理完成")
     return df
 
+def _threshold(data, value, mode):
+    """软/硬阈值（value可广播）"""
+    if mode == 'soft':
+        return np.sign(data) * np.maximum(np.abs(data) - value, 0)
+    if mode == 'hard':
+        return np.where(np.abs(data) > value, data, 0.0)
+    raise ValueError(f"不支持的阈值模式: {mode}")
+
+class StreamingWaveletDenoiser:
+    """
+    因果（无未来数据）流式小波降噪器
+    
+    使用因果的 à trous（非抽取）小波变换：第 j 级近似为上一级近似与膨胀 2^(j-1) 的低通滤波器
+    （小波的 rec_lo，即最小相位排列，归一化为和为1）在过去数据上的卷积，细节为相邻两级近似之差，
+    重构即 近似 + 阈值处理后的细节之和。每个输出只依赖当前及之前的数据
+    
+    因果滤波不可避免地存在相位滞后：建议使用最小相位的 dbN 或 haar 小波，
+    近似线性相位的 symN 小波滞后更大
+    
+    - 每级只保留 (滤波器长度-1)*2^(j-1)+1 个历史值的环形缓冲区，每个tick的计算量为 O(滤波器长度 × 级别)
+    - 噪声水平由第一级细节绝对值的指数移动平均估计，各级阈值按白噪声在该级的增益缩放
+    - update(value) 逐点更新，backfill(data) 向量化批量处理历史数据；两者共享状态，
+      先 backfill 再 update 与全部逐点 update 的结果一致（浮点误差内）
+    - 可同时处理多个序列：update 传入长度为k的数组，backfill 传入 (时间 × k) 的二维数组
+    
+    开始时缓冲区用第一个值填充（相当于向过去做边缘延拓），NaN按前一个值处理
+    """
+    
+    def __init__(self, wavelet='db4', level=2, threshold_mode='soft', threshold_scale=1.0, window=250):
+        """
+        参数:
+        wavelet: 小波基函数，默认为'db4'
+        level: 分解级别，默认为2
+        threshold_mode: 阈值处理模式，'soft'或'hard'
+        threshold_scale: 阈值缩放因子，值越小降噪效果越温和
+        window: 噪声估计的EMA跨度，同时作为通用阈值 sqrt(2·log(n)) 中的n
+        """
+        if level < 1:
+            raise ValueError("level 必须大于等于1")
+        if threshold_mode not in ('soft', 'hard'):
+            raise ValueError(f"不支持的阈值模式: {threshold_mode}")
+        
+        rec_lo = np.asarray(pywt.Wavelet(wavelet).rec_lo, dtype=float)
+        self.wavelet = wavelet
+        self.level = level
+        self.threshold_mode = threshold_mode
+        self.threshold_scale = threshold_scale
+        self.window = window
+        self.filter = rec_lo / rec_lo.sum()
+        self.alpha = 2.0 / (window + 1)
+        self.universal = np.sqrt(2 * np.log(window))
+        
+        L = len(self.filter)
+        self._lags = [np.arange(L) * 2 ** j for j in range(level)]
+        self._sizes = [(L - 1) * 2 ** j + 1 for j in range(level)]
+        self._gain = self._noise_gain()
+        self.reset()
+    
+    def reset(self):
+        """清空所有状态"""
+        self._buffers = None
+        self._ema = None
+        self._last = None
+        self._t = 0
+    
+    @property
+    def buffer_size(self):
+        """每个序列保留的历史值个数"""
+        return sum(self._sizes)
+    
+    def _noise_gain(self):
+        """单位方差白噪声在各级细节中的标准差（等效滤波器的2范数）"""
+        n = sum(self._sizes)
+        impulse = np.zeros((n, 1))
+        impulse[0] = 1.0
+        histories = [np.zeros((size - 1, 1)) for size in self._sizes]
+        details, _ = self._cascade(impulse, histories)
+        return np.array([np.sqrt(np.sum(d ** 2)) for d in details])
+    
+    def _cascade(self, x, histories):
+        """
+        在给定历史的基础上对 (n, k) 数据做因果 à trous 分解
+        
+        返回 (各级细节列表, 各级近似列表)，近似列表第0项为输入本身
+        """
+        n = len(x)
+        details = []
+        approxs = [x]
+        c = x
+        for j in range(self.level):
+            size = self._sizes[j]
+            full = np.concatenate([histories[j], c])
+            idx = (size - 1) + np.arange(n)[:, np.newaxis] - self._lags[j][np.newaxis, :]
+            c_next = np.matmul(self.filter, full[idx])
+            details.append(c - c_next)
+            approxs.append(c_next)
+            c = c_next
+        return details, approxs
+    
+    def _init_state(self, first):
+        k = len(first)
+        self._buffers = [np.tile(first, (size, 1)) for size in self._sizes]
+        self._ema = np.zeros(k)
+        self._last = first.copy()
+    
+    def _fill_nan(self, x):
+        """NaN按前一个值处理"""
+        mask = np.isnan(x)
+        if mask.any():
+            if self._last is None:
+                raise ValueError("第一个值不能为NaN")
+            x = np.where(mask, self._last, x)
+        return x
+    
+    def _reconstruct(self, approx, details, ema):
+        sigma = ema / (np.sqrt(2 / np.pi) * self._gain[0])
+        out = approx
+        for j, d in enumerate(details):
+            value = self._gain[j] * sigma * self.universal * self.threshold_scale
+            out = out + _threshold(d, value, self.threshold_mode)
+        return out
+    
+    def update(self, value):
+        """
+        输入一个新值（或k个序列各一个新值），返回对应的降噪值
+        
+        只使用当前及之前的数据，计算量为 O(滤波器长度 × 级别)
+        """
+        scalar = np.ndim(value) == 0
+        x = np.atleast_1d(np.asarray(value, dtype=float))
+        if self._buffers is None:
+            if np.isnan(x).any():
+                raise ValueError("第一个值不能为NaN")
+            self._init_state(x)
+        x = self._fill_nan(x)
+        self._last = x
+        
+        details = []
+        c = x
+        for j in range(self.level):
+            buf = self._buffers[j]
+            buf[self._t % self._sizes[j]] = c
+            idx = (self._t - self._lags[j]) % self._sizes[j]
+            c_next = np.matmul(self.filter, buf[idx])
+            details.append(c - c_next)
+            c = c_next
+        
+        self._ema = (1 - self.alpha) * self._ema + self.alpha * np.abs(details[0])
+        self._t += 1
+        
+        out = self._reconstruct(c, details, self._ema)
+        return float(out[0]) if scalar else out
+    
+    def backfill(self, data):
+        """
+        批量处理一段数据（向量化），结果与逐点调用 update 相同，处理后可继续 update
+        
+        参数:
+        data: 一维数组（单个序列）或二维数组 (时间 × 序列)
+        
+        返回:
+        与输入形状相同的降噪后数组
+        """
+        X = np.array(data, dtype=float)
+        squeeze = X.ndim == 1
+        if squeeze:
+            X = X[:, np.newaxis]
+        n = len(X)
+        if n == 0:
+            return X[:, 0] if squeeze else X
+        
+        X = pd.DataFrame(X).ffill().to_numpy()
+        if self._buffers is None:
+            if np.isnan(X[0]).any():
+                raise ValueError("第一个值不能为NaN")
+            self._init_state(X[0])
+        X = self._fill_nan(X)
+        self._last = X[-1].copy()
+        
+        # 各级缓冲区中按时间顺序排列的历史值
+        t = self._t
+        histories = []
+        for j, size in enumerate(self._sizes):
+            histories.append(self._buffers[j][(t - size + 1 + np.arange(size - 1)) % size])
+        
+        details, approxs = self._cascade(X, histories)
+        
+        # 更新环形缓冲区
+        for j, size in enumerate(self._sizes):
+            keep = min(n, size)
+            self._buffers[j][(t + np.arange(n - keep, n)) % size] = approxs[j][n - keep:]
+        
+        # 噪声水平的指数移动平均（与逐点更新相同的递推）
+        ema = pd.DataFrame(np.vstack([self._ema, np.abs(details[0])])).ewm(alpha=self.alpha, adjust=False).mean()
+        ema = ema.to_numpy()[1:]
+        self._ema = ema[-1].copy()
+        self._t += n
+        
+        out = self._reconstruct(approxs[-1], details, ema)
+        return out[:, 0] if squeeze else out
+
+def causal_wavelet_denoising(data, wavelet='db4', level=2, threshold_mode='soft', threshold_scale=1.0, window=250):
+    """
+    因果小波降噪：每个输出只使用当前及之前的数据（见 StreamingWaveletDenoiser）
+    
+    参数:
+    data: 一维数组或二维数组 (时间 × 列)
+    其余参数同 StreamingWaveletDenoiser
+    
+    返回:
+    与输入形状相同的降噪后数组
+    """
+    return StreamingWaveletDenoiser(wavelet, level, threshold_mode, threshold_scale, window).backfill(data)
+
 # 增强版可视化降噪效果函数
 def plot_denoising_comparison_enhanced(original_df, denoised_df, columns=None, start_date=None, end_date=None, n_samples=200):
     """
@@ -2,6 +2,7 @@ import numpy as np
 import pywt
 import pandas as pd
 import matplotlib.pyplot as plt
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import MinMaxScaler
 
 def plot_wavelet_decomposition(signal, wavelet='db4', level=3):
@@ -39,71 +40,124 @@ def plot_wavelet_decomposition(signal, wavelet='db4', level=3):
     plt.tight_layout()
     plt.show()
 
-def extract_adaptive_wavelet_features(signal, wavelet_family='db', max_level=5, feature_type='all'):
+def _coefficient_features(coeffs, feature_type='all'):
     """
-    自适应小波特征提取 - 根据信号特性选择最佳小波基和分解级别
+    对批量小波系数按行计算特征
     
     参数:
-    signal: 输入信号
+    coeffs: pywt.wavedec(..., axis=1) 的结果，每项形状为 (窗口数, 系数个数)
+    feature_type: 特征类型 ('stats', 'energy', 'all')
+    
+    返回:
+    特征矩阵 (窗口数, 特征数)，列顺序与逐窗口提取相同：
+    每个系数依次为 [均值, 标准差, 最大值, 最小值, 中位数, 25分位数, 75分位数, 超过标准差的点数, 能量, 相对能量]
+    """
+    energies = [np.sum(coeff**2, axis=1) for coeff in coeffs]
+    total_energy = sum(energies)
+    safe_total = np.where(total_energy > 0, total_energy, 1.0)
+    
+    columns = []
+    for coeff, energy in zip(coeffs, energies):
+        if feature_type in ['stats', 'all']:
+            std = np.std(coeff, axis=1)
+            p25, median, p75 = np.percentile(coeff, [25, 50, 75], axis=1)
+            columns.extend([
+                np.mean(coeff, axis=1),  # 均值
+                std,                     # 标准差
+                np.max(coeff, axis=1),   # 最大值
+                np.min(coeff, axis=1),   # 最小值
+                median,                  # 中位数
+                p25,                     # 25分位数
+                p75,                     # 75分位数
+                np.sum(np.abs(coeff) > std[:, np.newaxis], axis=1)  # 超过标准差的点数
+            ])
+        
+        if feature_type in ['energy', 'all']:
+            columns.append(energy)  # 能量
+            columns.append(np.where(total_energy > 0, energy / safe_total, 0))  # 相对能量
+    
+    return np.column_stack(columns).astype(float)
+
+def _wavelet_entropy(coeffs):
+    """批量系数的信息熵之和"""
+    return sum(np.sum(-np.abs(coef)**2 * np.log(np.abs(coef)**2 + 1e-10)) for coef in coeffs)
+
+def extract_adaptive_wavelet_features_batch(windows, wavelet_family='db', max_level=5, feature_type='all', return_wavelet=False):
+    """
+    批量自适应小波特征提取 - 对一批窗口统一选择最佳小波基
+    
+    每个候选小波基只对整个批次做一次 wavedec(axis=1)，选择整批信息熵最小的小波基，
+    再用数组归约计算特征
+    
+    参数:
+    windows: 二维数组 (窗口数, 窗口长度)
     wavelet_family: 小波族，如'db', 'sym', 'coif'等
     max_level: 最大分解级别
     feature_type: 特征类型 ('stats', 'energy', 'all')
+    return_wavelet: 为True时同时返回选中的小波基名称
     
     返回:
-    特征向量
+    特征矩阵 (窗口数, 特征数)；return_wavelet=True 时返回 (特征矩阵, 小波基名称)
     """
+    windows = np.atleast_2d(np.asarray(windows, dtype=float))
+    
     # 尝试不同的小波基函数
     wavelet_bases = [f'{wavelet_family}{i}' for i in range(1, 11) if pywt.wavelist(wavelet_family).__contains__(f'{wavelet_family}{i}')]
     
-    best_features = None
+    best_coeffs = None
+    best_wavelet = None
     best_entropy = float('inf')
     
-    # 对每个小波基函数计算信息熵，选择熵最小的（最有信息量的）
+    # 对每个小波基函数计算整批的信息熵，选择熵最小的（最有信息量的）
     for wavelet in wavelet_bases:
         # 确定最大可能的分解级别
-        max_possible_level = pywt.dwt_max_level(len(signal), pywt.Wavelet(wavelet).dec_len)
+        max_possible_level = pywt.dwt_max_level(windows.shape[1], pywt.Wavelet(wavelet).dec_len)
         level = min(max_level, max_possible_level)
         
         # 执行小波分解
-        coeffs = pywt.wavedec(signal, wavelet, level=level)
-        
-        # 计算各系数的信息熵
-        entropy = sum([np.sum(-np.abs(coef)**2 * np.log(np.abs(coef)**2 + 1e-10)) for coef in coeffs])
+        coeffs = pywt.wavedec(windows, wavelet, level=level, axis=1)
         
+        entropy = _wavelet_entropy(coeffs)
         if entropy < best_entropy:
             best_entropy = entropy
-            # 提取特征
-            features = []
-            
-            # 对每个系数提取特征
-            for i, coeff in enumerate(coeffs):
-                if feature_type in ['stats', 'all']:
-                    # 统计特征
-                    features.extend([
-                        np.mean(coeff),      # 均值
-                        np.std(coeff),       # 标准差
-                        np.max(coeff),       # 最大值
-                        np.min(coeff),       # 最小值
-                        np.median(coeff),    # 中位数
-                        np.percentile(coeff, 25),  # 25分位数
-                        np.percentile(coeff, 75),  # 75分位数
-                        np.sum(np.abs(coeff) > np.std(coeff))  # 超过标准差的点数
-                    ])
-                
-                if feature_type in ['energy', 'all']:
-                    # 能量特征
-                    features.append(np.sum(coeff**2))  # 能量
-                    
-                    # 相对能量
-                    total_energy = sum(np.sum(c**2) for c in coeffs)
-                    if total_energy > 0:
-                        features.append(np.sum(coeff**2) / total_energy)
-                    else:
-                        features.append(0)
-            
-            best_features = np.array(features)
-    
-    return best_features
+            best_coeffs = coeffs
+            best_wavelet = wavelet
+    
+    features = _coefficient_features(best_coeffs, feature_type) if best_coeffs is not None else None
+    return (features, best_wavelet) if return_wavelet else features
+
+def extract_adaptive_wavelet_features(signal, wavelet_family='db', max_level=5, feature_type='all'):
+    """
+    自适应小波特征提取 - 根据信号特性选择最佳小波基和分解级别
+    
+    参数:
+    signal: 输入信号
+    wavelet_family: 小波族，如'db', 'sym', 'coif'等
+    max_level: 最大分解级别
+    feature_type: 特征类型 ('stats', 'energy', 'all')
+    
+    返回:
+    特征向量
+    """
+    features = extract_adaptive_wavelet_features_batch(np.asarray(signal, dtype=float)[np.newaxis, :],
+                                                       wavelet_family, max_level, feature_type)
+    return None if features is None else features[0]
+
+def extract_wavelet_features_batch(windows, wavelet='db4', level=2):
+    """
+    批量提取小波特征：所有窗口堆叠为二维数组，只做一次 wavedec(axis=1)
+    
+    参数:
+    windows: 二维数组 (窗口数, 窗口长度)
+    wavelet: 小波类型，默认为'db4'
+    level: 分解级别，默认为2
+    
+    返回:
+    特征矩阵 (窗口数, 特征数)，每行与 extract_wavelet_features 对单个窗口的结果相同
+    """
+    windows = np.atleast_2d(np.asarray(windows, dtype=float))
+    coeffs = pywt.wavedec(windows, wavelet, level=level, axis=1)
+    return _coefficient_features(coeffs)
 
 def prepare_wavelet_features(data, window_size=10, target_col='Close', wavelet='db4', level=3):
     """
@@ -127,53 +181,42 @@ def prepare_wavelet_features(data, window_size=10, target_col='Close', wavelet='
     scaler = MinMaxScaler(feature_range=(-1, 1))
     signal_scaled = scaler.fit_transform(signal.reshape(-1, 1)).flatten()
     
-    X = []
-    y = []
+    n_windows = len(signal_scaled) - window_size
+    if n_windows <= 0:
+        return np.array([]), np.array([]), scaler
     
-    # 使用滑动窗口提取特征
-    for i in range(len(signal_scaled) - window_size):
-        # 当前窗口
-        window = signal_scaled[i:i+window_size]
-        
-        # 提取小波特征
-        wavelet_features = extract_wavelet_features(window, wavelet, level)
-        
-        # 添加原始数据作为额外特征
-        combined_features = np.concatenate([window, wavelet_features])
-        
-        X.append(combined_features)
-        y.append(signal_scaled[i+window_size])
+    # 使用滑动窗口提取特征（所有窗口一次批量计算）
+    windows = sliding_window_view(signal_scaled, window_size)[:n_windows]
+    wavelet_features = extract_wavelet_features_batch(windows, wavelet, level)
+    
+    # 添加原始数据作为额外特征
+    X = np.hstack([windows, wavelet_features])
+    y = signal_scaled[window_size:]
     
-    return np.array(X), np.array(y), scaler
+    return X, y, scaler
 
 
-def prepare_multiscale_wavelet_features(df, window_size=10, target_col='Close', wavelet='sym8', levels=[2, 4, 6]):
+def _trailing_std(values, window):
     """
-    提取多尺度小波特征
+    尾部滚动标准差：第i个值为 np.std(values[max(0, i-window):i+1])
     
-    Args:
-        df: 输入数据框
-        window_size: 滑动窗口大小
-        target_col: 目标列名
-        wavelet: 小波基函数
-        levels: 多个分解层级
-        
-    Returns:
-        X: 特征矩阵
-        y: 目标值
-        scaler: 归一化器
+    完整窗口部分用 sliding_window_view 一次计算，只有开头不足 window+1 个点的部分逐个计算
+    """
+    n = len(values)
+    head = min(window, n)
+    result = np.empty(n)
+    result[:head] = [np.std(values[:i + 1]) for i in range(head)]
+    if n > window:
+        result[window:] = np.std(sliding_window_view(values, window + 1), axis=1)
+    return result
+
+def _multiscale_feature_matrix(data, wavelets, levels):
+    """
+    对每个小波基和分解层级做小波分解，返回按列堆叠、截断到相同长度的多尺度特征矩阵
     """
-    # 获取目标列数据
-    data = df[target_col].values
-    
-    # 创建多尺度特征列表
     multiscale_features = []
     
-    # 对每个小波族和层级进行小波分解
-    for family in wavelet_families:
-        # 选择该族中的一个小波基函数
-        wavelet = f"{family}4" if pywt.wavelist(family).__contains__(f"{family}4") else pywt.wavelist(family)[0]
-        
+    for wavelet in wavelets:
         for level in levels:
             # 小波分解
             try:
@@ -198,7 +241,7 @@ def prepare_multiscale_wavelet_features(df, window_size=10, target_col='Close',
                             multiscale_features.append(scaler.fit_transform(rolling_mean.reshape(-1, 1)).flatten())
                             
                             # 滚动标准差
-                            rolling_std = np.array([np.std(coef[max(0, i-window):i+1]) for i in range(len(coef))])
+                            rolling_std = _trailing_std(coef, window)
                             multiscale_features.append(scaler.fit_transform(rolling_std.reshape(-1, 1)).flatten())
             except Exception as e:
                 print(f"处理小波 {wavelet} 在级别 {level} 时出错: {e}")
@@ -209,17 +252,16 @@ def prepare_multiscale_wavelet_features(df, window_size=10, target_col='Close',
     aligned_features = [f[:min_length] for f in multiscale_features]
     
     # 合并所有特征
-    all_features = np.column_stack(aligned_features)
-    
-    # 创建滑动窗口特征
-    X, y = [], []
-    for i in range(len(all_features) - window_size):
-        X.append(all_features[i:i+window_size])
-        y.append(data[i+window_size])
-    
-    # 转换为numpy数组
-    X = np.array(X)
-    y = np.array(y)
+    return np.column_stack(aligned_features)
+
+def _multiscale_windows(all_features, data, window_size):
+    """
+    创建滑动窗口特征 (样本数, window_size, 特征数) 和归一化的目标值
+    """
+    n_samples = max(len(all_features) - window_size, 0)
+    X = np.ascontiguousarray(
+        sliding_window_view(all_features, window_size, axis=0)[:n_samples].transpose(0, 2, 1))
+    y = np.asarray(data[window_size:window_size + n_samples], dtype=float)
     
     # 归一化目标值
     y_scaler = MinMaxScaler()
@@ -227,6 +269,35 @@ def prepare_multiscale_wavelet_features(df, window_size=10, target_col='Close',
     
     return X, y, y_scaler
 
+def _family_wavelet(family):
+    """选择小波族中的一个小波基函数（优先使用 {family}4）"""
+    return f"{family}4" if f"{family}4" in pywt.wavelist() else pywt.wavelist(family)[0]
+
+def prepare_multiscale_wavelet_features(df, window_size=10, target_col='Close', wavelet='sym8', levels=[2, 4, 6], wavelet_families=None):
+    """
+    提取多尺度小波特征
+    
+    Args:
+        df: 输入数据框
+        window_size: 滑动窗口大小
+        target_col: 目标列名
+        wavelet: 小波基函数（未指定 wavelet_families 时使用）
+        levels: 多个分解层级
+        wavelet_families: 小波族列表，如 ['db', 'sym', 'coif']，每族使用其中的一个小波基；默认为None（只使用 wavelet）
+    
+    Returns:
+        X: 特征矩阵
+        y: 目标值
+        scaler: 归一化器
+    """
+    # 获取目标列数据
+    data = df[target_col].values
+    
+    wavelets = [wavelet] if wavelet_families is None else [_family_wavelet(family) for family in wavelet_families]
+    all_features = _multiscale_feature_matrix(data, wavelets, levels)
+    
+    return _multiscale_windows(all_features, data, window_size)
+
 
 # 添加增强型多尺度小波特征提取函数
 def prepare_enhanced_multiscale_features(df, window_size=10, target_col='Close', 
@@ -247,73 +318,14 @@ def prepare_enhanced_multiscale_features(df, window_size=10, target_col='Close',
         y: 目标值
         scaler: 归一化器
     """
-    import pywt
-    import numpy as np
-    from sklearn.preprocessing import MinMaxScaler
-    
     # 获取目标列数据
     data = df[target_col].values
     
-    # 创建多尺度特征列表
-    multiscale_features = []
+    # 对每个小波族选择一个小波基函数
+    wavelets = [_family_wavelet(family) for family in wavelet_families]
+    all_features = _multiscale_feature_matrix(data, wavelets, levels)
     
-    # 对每个小波族和层级进行小波分解
-    for family in wavelet_families:
-        # 选择该族中的一个小波基函数
-        wavelet = f"{family}4" if f"{family}4" in pywt.wavelist() else pywt.wavelist(family)[0]
-        
-        for level in levels:
-            # 小波分解
-            try:
-                coeffs = pywt.wavedec(data, wavelet, level=level)
-                
-                # 提取每个层级的系数
-                for i, coef in enumerate(coeffs):
-                    # 对系数进行归一化
-                    scaler = MinMaxScaler()
-                    coef_scaled = scaler.fit_transform(coef.reshape(-1, 1)).flatten()
-                    
-                    # 添加到特征列表
-                    multiscale_features.append(coef_scaled)
-                    
-                    # 添加额外的统计特征
-                    if i == 0:  # 只对近似系数计算额外特征
-                        # 计算滚动统计量
-                        window = min(20, len(coef) // 2)  # 动态调整窗口大小
-                        if window > 1:
-                            # 滚动均值
-                            rolling_mean = np.convolve(coef, np.ones(window)/window, mode='valid')
-                            multiscale_features.append(scaler.fit_transform(rolling_mean.reshape(-1, 1)).flatten())
-                            
-                            # 滚动标准差
-                            rolling_std = np.array([np.std(coef[max(0, i-window):i+1]) for i in range(len(coef))])
-                            multiscale_features.append(scaler.fit_transform(rolling_std.reshape(-1, 1)).flatten())
-            except Exception as e:
-                print(f"处理小波 {wavelet} 在级别 {level} 时出错: {e}")
-                continue
-    
-    # 确保所有特征长度一致
-    min_length = min(len(f) for f in multiscale_features)
-    aligned_features = [f[:min_length] for f in multiscale_features]
-    
-    # 合并所有特征
-    all_features = np.column_stack(aligned_features)
-    
-    # 创建滑动窗口特征
-    X, y = [], []
-    for i in range(len(all_features) - window_size):
-        X.append(all_features[i:i+window_size])
-        y.append(data[i+window_size])
-    
-    # 转换为numpy数组
-    X = np.array(X)
-    y = np.array(y)
-    
-    # 归一化目标值
-    y_scaler = MinMaxScaler()
-    y = y_scaler.fit_transform(y.reshape(-1, 1)).flatten()
-    
-    return X, y, y_scaler
+    return _multiscale_windows(all_features, data, window_size)
 
 # 添加特征选择函数
 def select_wavelet_features(X, y, method='mutual_info', n_features=None):
@@ -403,37 +415,4 @@ def extract_wavelet_features(signal, wavelet='db4', level=2):
     返回:
     特征向量
     """
-    import pywt
-    import numpy as np
-    
-    # 执行小波分解
-    coeffs = pywt.wavedec(signal, wavelet, level=level)
-    
-    # 提取特征
-    features = []
-    
-    # 对每个系数提取统计特征
-    for i, coeff in enumerate(coeffs):
-        # 统计特征
-        features.extend([
-            np.mean(coeff),      # 均值
-            np.std(coeff),       # 标准差
-            np.max(coeff),       # 最大值
-            np.min(coeff),       # 最小值
-            np.median(coeff),    # 中位数
-            np.percentile(coeff, 25),  # 25分位数
-            np.percentile(coeff, 75),  # 75分位数
-            np.sum(np.abs(coeff) > np.std(coeff))  # 超过标准差的点数
-        ])
-        
-        # 能量特征
-        features.append(np.sum(coeff**2))  # 能量
-        
-        # 相对能量
-        total_energy = sum(np.sum(c**2) for c in coeffs)
-        if total_energy > 0:
-            features.append(np.sum(coeff**2) / total_energy)
-        else:
-            features.append(0)
-    
-    return np.array(features)
\ No newline at end of file
+    return extract_wavelet_features_batch(np.asarray(signal, dtype=float)[np.newaxis, :], wavelet, level)[0]